@@ -1,6 +1,8 @@
 import os
 import datetime
 from .static_funcs import load_model_ensemble, load_model, save_checkpoint_model, load_json, download_pretrained_model
+from .read_preprocess_save_load_kg.util import load_constraints
+from .read_preprocess_save_load_kg.string_index import StringIndex
 import torch
 from typing import List, Tuple, Union
 import random
@@ -176,22 +178,25 @@ class BaseInteractiveKGE:
             self.entity_to_idx, self.relation_to_idx = tuple_of_entity_relation_idx
             self.num_entities = len(self.entity_to_idx)
             self.num_relations = len(self.relation_to_idx)
-            self.entity_to_idx: dict
-            self.relation_to_idx: dict
-            assert list(self.entity_to_idx.values()) == list(range(0, len(self.entity_to_idx)))
-            assert list(self.relation_to_idx.values()) == list(range(0, len(self.relation_to_idx)))
-
-            self.idx_to_entity = {v: k for k, v in self.entity_to_idx.items()}
-            self.idx_to_relations = {v: k for k, v in self.relation_to_idx.items()}
+            if isinstance(self.entity_to_idx, StringIndex) and isinstance(self.relation_to_idx, StringIndex):
+                # Memory-mapped string tables are indexed by 0, ..., n-1 by construction.
+                self.idx_to_entity = self.entity_to_idx.inverse
+                self.idx_to_relations = self.relation_to_idx.inverse
+            else:
+                # Pickled dictionaries of earlier experiments.
+                assert list(self.entity_to_idx.values()) == list(range(0, len(self.entity_to_idx)))
+                assert list(self.relation_to_idx.values()) == list(range(0, len(self.relation_to_idx)))
+                self.idx_to_entity = {v: k for k, v in self.entity_to_idx.items()}
+                self.idx_to_relations = {v: k for k, v in self.relation_to_idx.items()}
 
         # See https://numpy.org/doc/stable/reference/generated/numpy.memmap.html
         # @TODO: Ignore temporalryIf file exists
         # if os.path.exists(self.path + '/train_set.npy'):
         #    self.train_set = np.load(file=self.path + '/train_set.npy', mmap_mode='r')
 
-        # if apply_semantic_constraint:
-        #    (self.domain_constraints_per_rel, self.range_constraints_per_rel,
-        #     self.domain_per_rel, self.range_per_rel) = create_constraints(self.train_set)
+        if apply_semantic_constraint:
+            # Domains and ranges of relations computed during the preprocessing.
+            self.constraints = load_constraints(self.path + '/constraints')
 
     def get_eval_report(self) -> dict:
         return load_json(self.path + "/eval_report.json")
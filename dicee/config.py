@@ -44,11 +44,22 @@ class Namespace(argparse.Namespace):
         self.gpus = None
         """Number GPUs to be used during training"""
 
+        self.num_processes: int = None
+        """Number of processes of torchDDP without GPUs (gloo) launched locally. None => number of NUMA nodes, at least 2"""
+
         self.callbacks = dict()
         """Callbacks, e.g., {"PPE":{ "last_percent_to_consider": 10}}"""
 
         self.backend: str = "pandas"
-        """Backend to read, process, and index input knowledge graph. pandas, polars and rdflib available"""
+        """Backend to read, process, and index input knowledge graph. pandas, polars, rdflib and streaming available.
+        streaming reads and indexes triples chunk by chunk into memory-mapped train_set.npy, valid_set.npy, test_set.npy"""
+
+        self.read_chunk_size: int = 1_000_000
+        """Number of triples read at once with backend streaming"""
+
+        self.num_preprocess_workers: int = None
+        """Number of processes to create er/re/ee vocabs. With backend streaming and more than one process,
+        input files are sharded across processes to be parsed and indexed in parallel"""
 
         self.trainer: str = 'torchCPUTrainer'
         """Trainer for knowledge graph embedding model"""
@@ -59,9 +70,49 @@ class Namespace(argparse.Namespace):
         self.neg_ratio: int = 0
         """Negative ratio for a true triple in NegSample training_technique"""
 
+        self.corruption_ratios: list = None
+        """Probabilities of corrupting heads, tails and relations in NegSample training_technique.
+        None => [0.5, 0.5, 0.0]"""
+
+        self.filtered_negatives: bool = False
+        """Reject negative triples that are training triples and resample them in NegSample training_technique"""
+
+        self.num_shared_negatives: int = None
+        """Size of a pool of negative tail entities shared by all triples of a mini-batch in NegSample
+        training_technique. Triples are scored via forward_k_vs_sample. None => neg_ratio negatives per triple"""
+
+        self.entity_sampling: str = "uniform"
+        """Distribution of corrupted entities in NegSample training_technique. uniform or unigram (degree^unigram_alpha)"""
+
+        self.unigram_alpha: float = 0.75
+        """Exponent of entity degrees with entity_sampling unigram"""
+
+        self.bernoulli_corruption: bool = False
+        """Corrupt heads or tails per relation according to tails per head and heads per tail statistics"""
+
+        self.adversarial_temperature: float = None
+        """Weight negatives of a triple by the softmax of their scores scaled by the temperature (self-adversarial
+        negative sampling) in NegSample training_technique. None => uniform weights"""
+
         self.weight_decay: float = 0.0
         """Weight decay for all trainable params"""
 
+        self.sparse_embeddings: bool = False
+        """Sparse gradients of entity and relation embeddings updated row-wise by LazyAdam (Adam, AdamW), SGD or Adagrad.
+        Saves the optimizer costs of rows not occurring in a mini-batch with NegSample and KvsSample"""
+
+        self.num_partitions: int = None
+        """Split entities into num_partitions partitions and train on buckets of triples given by the partitions of
+        their heads and tails (PyTorch-BigGraph). Only the partitions of a bucket are kept in memory.
+        Entity embeddings are stored in partitions/entity_embeddings_{p}.npy instead of model.pt.
+        Requires torchCPUTrainer, NegSample or KvsSample and eval_model None. None => no partitioning"""
+
+        self.sharded_embeddings: bool = False
+        """Partition entity embeddings row-wise across the ranks of torchDDP on CPUs instead of replicating them.
+        Lookups are routed to the ranks owning the rows. Requires NegSample or KvsSample.
+        A rank creates only its shard and stores it into checkpoint_rank_{rank}.pt, i.e., the full table is never
+        allocated. Evaluation and the Eval, Perturb and KronE callbacks are not supported (--eval_model None)"""
+
         self.normalization: str = "None"
         """ LayerNorm, BatchNorm1d, or None """
 
@@ -86,6 +137,13 @@ class Namespace(argparse.Namespace):
         self.num_core: int = 0
         """Number of CPUs to be used in the mini-batch loading process"""
 
+        self.num_prefetch_batches: int = 2
+        """Number of mini-batches constructed and moved to the device by a background thread in TorchTrainer.
+        0 => mini-batches are constructed synchronously"""
+
+        self.log_every_n_batches: int = 100
+        """TorchTrainer prints the loss and runtimes aggregated over log_every_n_batches mini-batches"""
+
         self.random_seed: int = 0
         "Random Seed"
 
@@ -136,6 +194,41 @@ class Namespace(argparse.Namespace):
         self.continual_learning=None
         "Path of a pretrained model size of LLM"
 
+        self.degree: int = 0
+        "Degree of polynomial embeddings (PolyMult, LFMult)"
+
+        self.score_func: str = None
+        "Scoring function of polynomial embeddings: 'tri', 'comp' or 'vtp'. None uses the default of the model"
+
+        self.weight_bias: str = None
+        "LFMult layers: 'same' or 'diff' weights and bias at every layer. None uses 'diff'"
+
+        self.closed_form_scoring: bool = False
+        """Compute integrals of polynomial embeddings in closed form instead of numerical quadrature.
+        LFMult: exact integrals instead of quadrature (vtp requires it). PolyMult: required by 'comp' and 'vtp'.
+        PolyMult 'tri': exact integrals instead of its terms 1/(1+(i+j+k)%degree)"""
+
+        self.inference_cache: str = "float32"
+        "Dtype of cached entity function evaluations of FMult and GFMult at inference: 'float32', 'float16' or None"
+
+        self.quadrature: str = None
+        """Quadrature of function-space models: 'gauss_legendre', 'clenshaw_curtis' or 'trapezoid'.
+        None uses the default of the model"""
+
+        self.num_quadrature_points: int = None
+        "Number of quadrature points of function-space models. None uses the default of the model"
+
+        self.trig_scoring: str = "fft"
+        "LFMult1: compute trigonometric scores with FFTs ('fft') or exactly by direct convolution ('direct')"
+
+        self.low_rank: int = None
+        """FMult and GFMult: store each layer as a rank r factorisation U V^T (k x r each) so that layers of width
+        k = embedding_dim // (4r) cost O(k r) per point. None uses dense k x k layers with k = sqrt(embedding_dim / 2)"""
+
+        self.precision: str = None
+        """Training precision: None or '32' for float32, 'bf16-mixed' for bfloat16 autocast with float32 parameters,
+        quadrature sums and loss. Passed to the PL trainer as is"""
+
     def __iter__(self):
         # Iterate
         for k, v in self.__dict__.items():
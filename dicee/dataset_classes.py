@@ -4,20 +4,26 @@ import torch
 import pytorch_lightning as pl
 from typing import List, Tuple, Union
 from .static_preprocess_funcs import mapping_from_first_two_cols_to_third
-from .static_funcs import timeit, load_pickle
+from .static_funcs import timeit
+from .read_preprocess_save_load_kg.filter_index import FilterIndex
+from .read_preprocess_save_load_kg.util import load_string_index
+from .negative_sampling import NegativeSampler, SamplingGenerator
 
 
 @timeit
-def reload_dataset(path: str, form_of_labelling, scoring_technique, neg_ratio, label_smoothing_rate):
+def reload_dataset(path: str, form_of_labelling, scoring_technique, neg_ratio, label_smoothing_rate,
+                   negative_sampling: dict = None, num_shared_negatives: int = None):
     """ Reload the files from disk to construct the Pytorch dataset """
     return construct_dataset(train_set=np.load(path + '/train_set.npy'),
                              valid_set=None,
                              test_set=None,
-                             entity_to_idx=load_pickle(file_path=path + '/entity_to_idx.p'),
-                             relation_to_idx=load_pickle(file_path=path + '/relation_to_idx.p'),
+                             entity_to_idx=load_string_index(path + '/entity_to_idx'),
+                             relation_to_idx=load_string_index(path + '/relation_to_idx'),
                              form_of_labelling=form_of_labelling,
                              scoring_technique=scoring_technique, neg_ratio=neg_ratio,
-                             label_smoothing_rate=label_smoothing_rate)
+                             label_smoothing_rate=label_smoothing_rate,
+                             negative_sampling=negative_sampling,
+                             num_shared_negatives=num_shared_negatives)
 
 
 @timeit
@@ -35,7 +41,9 @@ def construct_dataset(*,
                       neg_ratio: int,
                       label_smoothing_rate: float,
                       byte_pair_encoding=None,
-                      block_size: int = None
+                      block_size: int = None,
+                      negative_sampling: dict = None,
+                      num_shared_negatives: int = None
                       ) -> torch.utils.data.Dataset:
     if ordered_bpe_entities and byte_pair_encoding and scoring_technique == 'NegSample':
         train_set = BPE_NegativeSamplingDataset(
@@ -52,13 +60,22 @@ def construct_dataset(*,
     elif byte_pair_encoding:
         # Multi-class classification based on transformer model's training.
         train_set = MultiClassClassificationDataset(train_set, block_size=block_size)
+    elif scoring_technique == 'NegSample' and num_shared_negatives:
+        # Binary-class with negatives shared within a mini-batch.
+        train_set = SharedNegativeSampleDataset(train_set=train_set,
+                                                num_entities=len(entity_to_idx),
+                                                num_relations=len(relation_to_idx),
+                                                num_shared_negatives=num_shared_negatives,
+                                                label_smoothing_rate=label_smoothing_rate,
+                                                negative_sampling=negative_sampling)
     elif scoring_technique == 'NegSample':
         # Binary-class.
         train_set = TriplePredictionDataset(train_set=train_set,
                                             num_entities=len(entity_to_idx),
                                             num_relations=len(relation_to_idx),
                                             neg_sample_ratio=neg_ratio,
-                                            label_smoothing_rate=label_smoothing_rate)
+                                            label_smoothing_rate=label_smoothing_rate,
+                                            negative_sampling=negative_sampling)
     elif form_of_labelling == 'EntityPrediction':
         if scoring_technique == '1vsAll':
             # Multi-class.
@@ -104,6 +121,7 @@ class BPE_NegativeSamplingDataset(torch.utils.data.Dataset):
         self.num_bpe_entities = len(self.ordered_bpe_entities)
         self.neg_ratio = neg_ratio
         self.num_datapoints = len(self.train_set)
+        self.generator = SamplingGenerator()
 
     def __len__(self):
         return self.num_datapoints
@@ -123,9 +141,9 @@ class BPE_NegativeSamplingDataset(torch.utils.data.Dataset):
         num_of_corruption = size_of_batch * self.neg_ratio
         # Select bpe entities
         corr_bpe_entities = self.ordered_bpe_entities[
-            torch.randint(0, high=self.num_bpe_entities, size=(num_of_corruption,))]
+            torch.randint(0, high=self.num_bpe_entities, size=(num_of_corruption,), generator=self.generator())]
 
-        if torch.rand(1) >= 0.5:
+        if torch.rand(1, generator=self.generator()) >= 0.5:
             bpe_h = torch.cat((bpe_h, corr_bpe_entities), 0)
             bpe_r = torch.cat((bpe_r, torch.repeat_interleave(input=bpe_r, repeats=self.neg_ratio, dim=0)), 0)
             bpe_t = torch.cat((bpe_t, torch.repeat_interleave(input=bpe_t, repeats=self.neg_ratio, dim=0)), 0)
@@ -295,55 +313,69 @@ class KvsAll(torch.utils.data.Dataset):
         self.train_data = None
         self.train_target = None
         self.label_smoothing_rate = torch.tensor(label_smoothing_rate)
-        self.collate_fn = None
 
-        # (1) Create a dictionary of training data pints
-        # Either from tuple of entities or tuple of an entity and a relation
+        # (1) Group training data points by unique tuples of entities or of an entity and a relation.
+        # The targets of the i.th tuple are train_target[offsets[i]:offsets[i+1]] (CSR).
+        # https://pytorch.org/docs/stable/data.html#multi-process-data-loading
+        # TLDL; replace Python objects with non-refcounted representations such as Pandas, Numpy or PyArrow objects
         if store is None:
-            store = dict()
             if form == 'RelationPrediction':
                 self.target_dim = len(relation_idxs)
-                for s_idx, p_idx, o_idx in train_set_idx:
-                    store.setdefault((s_idx, o_idx), list()).append(p_idx)
+                store = FilterIndex.from_triples(train_set_idx, key_columns=(0, 2), value_column=1)
             elif form == 'EntityPrediction':
                 self.target_dim = len(entity_idxs)
-                store = mapping_from_first_two_cols_to_third(train_set_idx)
+                store = FilterIndex.from_triples(train_set_idx, key_columns=(0, 1), value_column=2)
             else:
                 raise NotImplementedError
         else:
             raise ValueError()
         assert len(store) > 0
-        # Keys in store correspond to integer representation (index) of subject and predicate
-        # Values correspond to a list of integer representations of entities.
-        self.train_data = torch.LongTensor(list(store.keys()))
-
-        if sum([len(i) for i in store.values()]) == len(store):
-            # if each s,p pair contains at most 1 entity
-            self.train_target = np.array(list(store.values()))
-            try:
-                assert isinstance(self.train_target[0], np.ndarray)
-            except IndexError or AssertionError:
-                print(self.train_target)
-                # TODO: Add info
-                exit(1)
-        else:
-            self.train_target = list(store.values())
-            assert isinstance(self.train_target[0], list)
+        # Integer representations (indices) of subjects and predicates (or objects).
+        self.train_data = torch.from_numpy(store.key_pairs())
+        # Integer representations of targets and offsets of data points.
+        self.train_target = store.values
+        self.offsets = store.offsets
         del store
 
     def __len__(self):
-        assert len(self.train_data) == len(self.train_target)
+        assert len(self.train_data) + 1 == len(self.offsets)
         return len(self.train_data)
 
     def __getitem__(self, idx):
         # 1. Initialize a vector of output.
         y_vec = torch.zeros(self.target_dim)
-        y_vec[self.train_target[idx]] = 1.0
+        y_vec[torch.from_numpy(self.train_target[self.offsets[idx]:self.offsets[idx + 1]]).long()] = 1.0
 
         if self.label_smoothing_rate:
             y_vec = y_vec * (1 - self.label_smoothing_rate) + (1 / y_vec.size(0))
         return self.train_data[idx], y_vec
 
+    def __getitems__(self, indices: List[int]) -> Tuple[torch.LongTensor, torch.Tensor]:
+        """
+        A mini-batch fetched at once by the DataLoader instead of len(indices) calls of __getitem__
+
+        Returns
+        -------
+        batch x 2 inputs and the positive labels as sparse batch x target_dim COO tensor.
+        Dense labels are materialized on the training device via multi_labels_to_dense()
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        # (1) Ranges of targets of data points.
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+        row_offsets = np.cumsum(lengths) - lengths
+        # (2) Gather all targets at once: start of the range + position within the range.
+        within = np.arange(lengths.sum(), dtype=np.int64) - np.repeat(row_offsets, lengths)
+        cols = np.asarray(self.train_target[np.repeat(starts, lengths) + within], dtype=np.int64)
+        rows = np.repeat(np.arange(len(indices), dtype=np.int64), lengths)
+        y_batch = torch.sparse_coo_tensor(torch.from_numpy(np.stack((rows, cols))), torch.ones(len(rows)),
+                                          size=(len(indices), self.target_dim))
+        return self.train_data[torch.from_numpy(indices)], y_batch
+
+    def collate_fn(self, batch: Tuple[torch.LongTensor, torch.Tensor]) -> Tuple[torch.LongTensor, torch.Tensor]:
+        """ Mini-batches are created in __getitems__ """
+        return batch
+
 
 class AllvsAll(torch.utils.data.Dataset):
     """ Creates a dataset for AllvsAll training by inheriting from torch.utils.data.Dataset.
@@ -470,36 +502,31 @@ class KvsSampleDataset(torch.utils.data.Dataset):
         self.neg_sample_ratio = neg_sample_ratio
         self.label_smoothing_rate = torch.tensor(label_smoothing_rate)
         self.collate_fn = None
+        self.generator = SamplingGenerator()
 
         if self.neg_sample_ratio == 0:
             print(f'neg_sample_ratio is {neg_sample_ratio}. It will be set to 10.')
             self.neg_sample_ratio = 10
 
         print('Constructing training data...')
-        store = mapping_from_first_two_cols_to_third(train_set)
-        self.train_data = torch.IntTensor(list(store.keys()))
+        # Unique (head, relation) pairs and tail entities of the i.th pair in train_target[offsets[i]:offsets[i+1]].
         # https://pytorch.org/docs/stable/data.html#multi-process-data-loading
         # TLDL; replace Python objects with non-refcounted representations such as Pandas, Numpy or PyArrow objects
-        # Unsure whether a list of numpy arrays are non-refcounted
-        self.train_target = list([np.array(i) for i in store.values()])
+        store = FilterIndex.from_triples(train_set, key_columns=(0, 1), value_column=2)
+        self.train_data = torch.from_numpy(store.key_pairs()).int()
+        self.train_target = store.values
+        self.offsets = store.offsets
         del store
-        # @TODO: Investigate reference counts of using list of numpy arrays.
-        # import sys
-        # import gc
-        # print(sys.getrefcount(self.train_target))
-        # print(sys.getrefcount(self.train_target[0]))
-        # print(gc.get_referrers(self.train_target))
-        # print(gc.get_referrers(self.train_target[0]))
 
     def __len__(self):
-        assert len(self.train_data) == len(self.train_target)
+        assert len(self.train_data) + 1 == len(self.offsets)
         return len(self.train_data)
 
     def __getitem__(self, idx):
         # (1) Get i.th unique (head,relation) pair.
         x = self.train_data[idx]
         # (2) Get tail entities given (1).
-        positives_idx = self.train_target[idx]
+        positives_idx = self.train_target[self.offsets[idx]:self.offsets[idx + 1]]
         num_positives = len(positives_idx)
         # (3) Do we need to subsample (2) to create training data points of same size.
         if num_positives < self.neg_sample_ratio:
@@ -508,14 +535,17 @@ class KvsSampleDataset(torch.utils.data.Dataset):
             # (3.2) Generate more negative entities
             negative_idx = torch.randint(low=0,
                                          high=self.num_entities,
-                                         size=(self.neg_sample_ratio + self.neg_sample_ratio - num_positives,))
+                                         size=(self.neg_sample_ratio + self.neg_sample_ratio - num_positives,),
+                                         generator=self.generator())
         else:
             # (3.1) Subsample positives without replacement.
-            positives_idx = torch.IntTensor(np.random.choice(positives_idx, size=self.neg_sample_ratio, replace=False))
+            selected = torch.randperm(num_positives, generator=self.generator())[:self.neg_sample_ratio]
+            positives_idx = torch.IntTensor(positives_idx[selected.numpy()])
             # (3.2) Generate random entities.
             negative_idx = torch.randint(low=0,
                                          high=self.num_entities,
-                                         size=(self.neg_sample_ratio,))
+                                         size=(self.neg_sample_ratio,),
+                                         generator=self.generator())
         # (5) Create selected indexes.
         y_idx = torch.cat((positives_idx, negative_idx), 0)
         # (6) Create binary labels.
@@ -524,36 +554,38 @@ class KvsSampleDataset(torch.utils.data.Dataset):
 
 
 class NegSampleDataset(torch.utils.data.Dataset):
-    def __init__(self, train_set: np.ndarray, num_entities: int, num_relations: int, neg_sample_ratio: int = 1):
+    def __init__(self, train_set: np.ndarray, num_entities: int, num_relations: int, neg_sample_ratio: int = 1,
+                 negative_sampling: dict = None):
         assert isinstance(train_set, np.ndarray)
         # https://pytorch.org/docs/stable/data.html#multi-process-data-loading
         # TLDL; replace Python objects with non-refcounted representations such as Pandas, Numpy or PyArrow objects
         self.neg_sample_ratio = torch.tensor(
             neg_sample_ratio)
-        self.train_set = torch.from_numpy(train_set).unsqueeze(1)
+        self.train_set = torch.from_numpy(train_set)
         self.length = len(self.train_set)
         self.num_entities = torch.tensor(num_entities)
         self.num_relations = torch.tensor(num_relations)
+        # Negatives are sampled per mini-batch in collate_fn.
+        self.negative_sampler = NegativeSampler(train_set, num_entities=num_entities, num_relations=num_relations,
+                                                neg_ratio=neg_sample_ratio, **(negative_sampling or dict()))
 
     def __len__(self):
         return self.length
 
     def __getitem__(self, idx):
-        # (1) Get a triple.
-        triple = self.train_set[idx]
-        # (2) Sample an entity.
-        corr_entities = torch.randint(0, high=self.num_entities, size=(1,))
-        # (3) Flip a coin
-        if torch.rand(1) >= 0.5:
-            # (3.1) Corrupt (1) via tai.
-            negative_triple = torch.cat((triple[:, 0], triple[:, 1], corr_entities), dim=0).unsqueeze(0)
-        else:
-            # (3.1) Corrupt (1) via head.
-            negative_triple = torch.cat((corr_entities, triple[:, 1], triple[:, 2]), dim=0).unsqueeze(0)
-        # (4) Concat positive and negative triples.
-        x = torch.cat((triple, negative_triple), dim=0)
-        # (5) Concat labels of (4).
-        y = torch.tensor([1.0, 0.0])
+        return self.train_set[idx]
+
+    def collate_fn(self, batch: List[torch.Tensor]):
+        # (1) Stack triples.
+        triples = torch.stack(batch, dim=0).long()
+        size_of_batch = len(triples)
+        # (2) Corrupt (1) neg_sample_ratio times and group negatives by their positive triples.
+        negatives = self.negative_sampler.corrupt(triples).view(-1, size_of_batch, 3).transpose(0, 1)
+        # (3) Concat positive and negative triples.
+        x = torch.cat((triples.unsqueeze(1), negatives), dim=1)
+        # (4) Concat labels of (3).
+        y = torch.zeros(x.shape[:2])
+        y[:, 0] = 1.0
         return x, y
 
 
@@ -582,6 +614,8 @@ class TriplePredictionDataset(torch.utils.data.Dataset):
             ?
        label_smoothing_rate
 
+       negative_sampling
+           keyword arguments of NegativeSampler, e.g., {"filtered": True, "entity_sampling": "unigram"}
 
        collate_fn: batch:List[torch.IntTensor]
        Returns
@@ -591,7 +625,7 @@ class TriplePredictionDataset(torch.utils.data.Dataset):
 
     @timeit
     def __init__(self, train_set: np.ndarray, num_entities: int, num_relations: int, neg_sample_ratio: int = 1,
-                 label_smoothing_rate: float = 0.0):
+                 label_smoothing_rate: float = 0.0, negative_sampling: dict = None):
         assert isinstance(train_set, np.ndarray)
         # https://pytorch.org/docs/stable/data.html#multi-process-data-loading
         # TLDL; replace Python objects with non-refcounted representations such as Pandas, Numpy or PyArrow objects
@@ -603,6 +637,8 @@ class TriplePredictionDataset(torch.utils.data.Dataset):
         self.length = len(self.train_set)
         self.num_entities = torch.tensor(num_entities)
         self.num_relations = torch.tensor(num_relations)
+        self.negative_sampler = NegativeSampler(train_set, num_entities=num_entities, num_relations=num_relations,
+                                                neg_ratio=neg_sample_ratio, **(negative_sampling or dict()))
 
     def __len__(self):
         return self.length
@@ -611,64 +647,56 @@ class TriplePredictionDataset(torch.utils.data.Dataset):
         return self.train_set[idx]
 
     def collate_fn(self, batch: List[torch.Tensor]):
-        batch = torch.stack(batch, dim=0)
-        h, r, t = batch[:, 0], batch[:, 1], batch[:, 2]
+        batch = torch.stack(batch, dim=0).long()
         size_of_batch, _ = batch.shape
         assert size_of_batch > 0
         label = torch.ones((size_of_batch,)) - self.label_smoothing_rate
-        corr_entities = torch.randint(0, high=self.num_entities, size=(size_of_batch * self.neg_sample_ratio,))
-        if torch.rand(1) >= 0.5:
-            # corrupt head
-            r_head_corr = r.repeat(self.neg_sample_ratio, )
-            t_head_corr = t.repeat(self.neg_sample_ratio, )
-            label_head_corr = torch.zeros(len(t_head_corr)) + self.label_smoothing_rate
-
-            h = torch.cat((h, corr_entities), 0)
-            r = torch.cat((r, r_head_corr), 0)
-            t = torch.cat((t, t_head_corr), 0)
-            x = torch.stack((h, r, t), dim=1)
-            label = torch.cat((label, label_head_corr), 0)
-        else:
-            # corrupt tail
-            h_tail_corr = h.repeat(self.neg_sample_ratio, )
-            r_tail_corr = r.repeat(self.neg_sample_ratio, )
-            label_tail_corr = torch.zeros(len(r_tail_corr)) + self.label_smoothing_rate
-
-            h = torch.cat((h, h_tail_corr), 0)
-            r = torch.cat((r, r_tail_corr), 0)
-            t = torch.cat((t, corr_entities), 0)
-            x = torch.stack((h, r, t), dim=1)
-            label = torch.cat((label, label_tail_corr), 0)
-
-        """        
-        # corrupt head, tail or rel ?!
-        # (1) Corrupted Entities:
-        corr = torch.randint(0, high=self.num_entities, size=(size_of_batch * self.neg_sample_ratio, 2))
-        # (2) Head Corrupt:
-        h_head_corr = corr[:, 0]
-        r_head_corr = r.repeat(self.neg_sample_ratio, )
-        t_head_corr = t.repeat(self.neg_sample_ratio, )
-        label_head_corr = torch.zeros(len(t_head_corr)) + self.label_smoothing_rate
-        # (3) Tail Corrupt:
-        h_tail_corr = h.repeat(self.neg_sample_ratio, )
-        r_tail_corr = r.repeat(self.neg_sample_ratio, )
-        t_tail_corr = corr[:, 1]
-        label_tail_corr = torch.zeros(len(t_tail_corr)) + self.label_smoothing_rate
-        # (4) Relations Corrupt:
-        h_rel_corr = h.repeat(self.neg_sample_ratio, )
-        r_rel_corr = torch.randint(0, self.num_relations, (size_of_batch * self.neg_sample_ratio, 1))[:, 0]
-        t_rel_corr = t.repeat(self.neg_sample_ratio, )
-        label_rel_corr = torch.zeros(len(t_rel_corr)) + self.label_smoothing_rate
-        # (5) Stack True and Corrupted Triples
-        h = torch.cat((h, h_head_corr, h_tail_corr, h_rel_corr), 0)
-        r = torch.cat((r, r_head_corr, r_tail_corr, r_rel_corr), 0)
-        t = torch.cat((t, t_head_corr, t_tail_corr, t_rel_corr), 0)
-        x = torch.stack((h, r, t), dim=1)
-        label = torch.cat((label, label_head_corr, label_tail_corr, label_rel_corr), 0)
-        """
+        # (1) Corrupt heads, tails or relations of triples in a vectorized manner.
+        negatives = self.negative_sampler.corrupt(batch)
+        label_corr = torch.zeros(len(negatives)) + self.label_smoothing_rate
+        # (2) Stack true and corrupted triples.
+        x = torch.cat((batch, negatives), 0)
+        label = torch.cat((label, label_corr), 0)
         return x, label
 
 
+class SharedNegativeSampleDataset(TriplePredictionDataset):
+    """
+    NegSample with a pool of negative tail entities shared by all triples of a mini-batch
+
+    collate_fn returns (h, r) pairs (B x 2), target entities [t, pool] (B x (1 + M)) and labels of targets.
+    Models score a mini-batch via forward_k_vs_sample, i.e., the interaction of a head entity and a relation is
+    computed once per triple instead of 1 + neg_ratio times. Heads are corrupted via reciprocal triples.
+
+    With negative_sampling={"filtered": True}, pooled entities forming training triples are labelled as positives.
+    """
+
+    def __init__(self, train_set: np.ndarray, num_entities: int, num_relations: int, num_shared_negatives: int,
+                 label_smoothing_rate: float = 0.0, negative_sampling: dict = None):
+        super().__init__(train_set, num_entities=num_entities, num_relations=num_relations,
+                         neg_sample_ratio=num_shared_negatives, label_smoothing_rate=label_smoothing_rate,
+                         negative_sampling=negative_sampling)
+        assert num_shared_negatives > 0
+        self.num_shared_negatives = num_shared_negatives
+
+    def collate_fn(self, batch: List[torch.Tensor]):
+        batch = torch.stack(batch, dim=0).long()
+        size_of_batch = len(batch)
+        # (1) Sample a pool of entities shared by all triples.
+        pool = self.negative_sampler.sample_entities(self.num_shared_negatives)
+        target_idx = torch.cat((batch[:, 2:], pool.expand(size_of_batch, -1)), dim=1)
+        # (2) Label true tails and, if filtered, pooled entities forming training triples.
+        label = torch.zeros(target_idx.shape)
+        label[:, 0] = 1.0
+        if self.negative_sampler.triple_index is not None:
+            candidates = torch.cat((batch[:, :2].repeat_interleave(self.num_shared_negatives, dim=0),
+                                    pool.repeat(size_of_batch).unsqueeze(1)), dim=1)
+            label[:, 1:] = self.negative_sampler.triple_index.contains(candidates).view(size_of_batch, -1).float()
+        if self.label_smoothing_rate:
+            label = label * (1 - 2 * self.label_smoothing_rate) + self.label_smoothing_rate
+        return batch[:, :2], target_idx, label
+
+
 class CVDataModule(pl.LightningDataModule):
     """
        Create a Dataset for cross validation
@@ -1,6 +1,7 @@
 import torch
 from typing import Dict, Tuple, List, Callable
 from .knowledge_graph_embeddings import KGE
+from .read_preprocess_save_load_kg import FilterIndex
 from tqdm import tqdm
 import numpy as np
 
@@ -53,7 +54,10 @@ def evaluate_link_prediction_performance(model: KGE, triples, er_vocab: Dict[Tup
 
         # 3. Computed filtered ranks for missing tail entities.
         # 3.1. Compute filtered tail entity rankings
-        filt_tails = [model.entity_to_idx[i] for i in er_vocab[(str_h, str_r)]]
+        if isinstance(er_vocab, FilterIndex):
+            filt_tails = er_vocab[(h, r)]
+        else:
+            filt_tails = [model.entity_to_idx[i] for i in er_vocab[(str_h, str_r)]]
         # 3.2 Get the predicted target's score
         target_value = predictions_tails[t].item()
         # 3.3 Filter scores of all triples containing filtered tail entities
@@ -67,7 +71,10 @@ def evaluate_link_prediction_performance(model: KGE, triples, er_vocab: Dict[Tup
 
         # 4. Computed filtered ranks for missing head entities.
         # 4.1. Retrieve head entities to be filtered
-        filt_heads = [model.entity_to_idx[i] for i in re_vocab[(str_r, str_t)]]
+        if isinstance(re_vocab, FilterIndex):
+            filt_heads = re_vocab[(r, t)]
+        else:
+            filt_heads = [model.entity_to_idx[i] for i in re_vocab[(str_r, str_t)]]
         # 4.2 Get the predicted target's score
         target_value = predictions_heads[h].item()
         # 4.3 Filter scores of all triples containing filtered head entities.
@@ -142,7 +149,10 @@ def evaluate_link_prediction_performance_with_reciprocals(model: KGE, triples,
 
             id_e, id_r, id_e_target = data_batch[j]
             # (4.2) Get all ids of all entities occurring with the head entity and relation extracted in 4.1.
-            filt = [entity_to_idx[_] for _ in er_vocab[(str_h, str_r)]]
+            if isinstance(er_vocab, FilterIndex):
+                filt = er_vocab[(id_e, id_r)]
+            else:
+                filt = [entity_to_idx[_] for _ in er_vocab[(str_h, str_r)]]
             # (4.3) Store the assigned score of the target tail entity extracted in 4.1.
             target_value = predictions[j, id_e_target].item()
             # (4.4.1) Filter all assigned scores for entities.
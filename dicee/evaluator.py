@@ -2,10 +2,12 @@ import pandas as pd
 import torch
 import numpy as np
 import json
-from .static_funcs import pickle
-from .static_funcs_training import evaluate_lp, evaluate_bpe_lp
+from .static_funcs_training import evaluate_lp, evaluate_bpe_lp, csr_filter, filtered_ranks
 from typing import Tuple, List
 from .knowledge_graph import KG
+from .read_preprocess_save_load_kg import FilterIndex, RelationConstraints
+from .read_preprocess_save_load_kg.util import save_vocab, load_vocab, load_constraints
+from concurrent.futures import Future
 
 
 class Evaluator:
@@ -25,7 +27,7 @@ class Evaluator:
         self.is_continual_training = is_continual_training
         self.num_entities = None
         self.num_relations = None
-        self.domain_constraints_per_rel, self.range_constraints_per_rel = None, None
+        self.constraints = None
         self.args = args
         self.report = dict()
         self.during_training = False
@@ -42,38 +44,24 @@ class Evaluator:
         None
         """
         # print("** VOCAB Prep **")
-        if isinstance(dataset.er_vocab, dict):
-            self.er_vocab = dataset.er_vocab
-        else:
-            self.er_vocab = dataset.er_vocab.result()
-
-        if isinstance(dataset.re_vocab, dict):
-            self.re_vocab = dataset.re_vocab
-        else:
-            self.re_vocab = dataset.re_vocab.result()
+        # Vocabularies are dictionaries, FilterIndex objects or futures of them.
+        self.er_vocab = dataset.er_vocab.result() if isinstance(dataset.er_vocab, Future) else dataset.er_vocab
+        self.re_vocab = dataset.re_vocab.result() if isinstance(dataset.re_vocab, Future) else dataset.re_vocab
+        self.ee_vocab = dataset.ee_vocab.result() if isinstance(dataset.ee_vocab, Future) else dataset.ee_vocab
 
-        if isinstance(dataset.ee_vocab, dict):
-            self.ee_vocab = dataset.ee_vocab.result()
-        else:
-            self.ee_vocab = dataset.ee_vocab.result()
-
-        """
-        if isinstance(dataset.constraints, tuple):
-            self.domain_constraints_per_rel, self.range_constraints_per_rel = dataset.constraints
-        else:
-            try:
-                self.domain_constraints_per_rel, self.range_constraints_per_rel = dataset.constraints.result()
-            except RuntimeError:
-                print('Domain constraint exception occurred')
-        """
+        # Domains and ranges of relations (RelationConstraints). They cannot be computed for byte pair encoded triples.
+        constraints = getattr(dataset, "constraints", None)
+        if isinstance(constraints, Future):
+            constraints = constraints.result() if constraints.exception() is None else None
+        self.constraints = constraints
 
         self.num_entities = dataset.num_entities
         self.num_relations = dataset.num_relations
         self.func_triple_to_bpe_representation = dataset.func_triple_to_bpe_representation
 
-        pickle.dump(self.er_vocab, open(self.args.full_storage_path + "/er_vocab.p", "wb"))
-        pickle.dump(self.re_vocab, open(self.args.full_storage_path + "/re_vocab.p", "wb"))
-        pickle.dump(self.ee_vocab, open(self.args.full_storage_path + "/ee_vocab.p", "wb"))
+        save_vocab(self.er_vocab, self.args.full_storage_path + "/er_vocab")
+        save_vocab(self.re_vocab, self.args.full_storage_path + "/re_vocab")
+        save_vocab(self.ee_vocab, self.args.full_storage_path + "/ee_vocab")
 
     # @timeit
     def eval(self, dataset: KG, trained_model, form_of_labelling, during_training=False) -> None:
@@ -147,9 +135,11 @@ class Evaluator:
         return train_set, valid_set, test_set
 
     def __load_and_set_mappings(self):
-        self.er_vocab = pickle.load(open(self.args.full_storage_path + "/er_vocab.p", "rb"))
-        self.re_vocab = pickle.load(open(self.args.full_storage_path + "/re_vocab.p", "rb"))
-        self.ee_vocab = pickle.load(open(self.args.full_storage_path + "/ee_vocab.p", "rb"))
+        self.er_vocab = load_vocab(self.args.full_storage_path + "/er_vocab")
+        self.re_vocab = load_vocab(self.args.full_storage_path + "/re_vocab")
+        self.ee_vocab = load_vocab(self.args.full_storage_path + "/ee_vocab")
+        if RelationConstraints.exists(self.args.full_storage_path + "/constraints"):
+            self.constraints = load_constraints(self.args.full_storage_path + "/constraints")
 
     def eval_rank_of_head_and_tail_entity(self, *, train_set, valid_set=None, test_set=None, trained_model):
         # 4. Test model on the training dataset if it is needed.
@@ -263,73 +253,49 @@ class Evaluator:
         num_triples = len(triple_idx)
         ranks = []
         # Hit range
-        hits_range = [i for i in range(1, 11)]
-        hits = {i: [] for i in hits_range}
+        hits_range = torch.arange(1, 11)
+        hits = torch.zeros(len(hits_range), dtype=torch.long)
         if info and self.during_training is False:
             print(info + ':', end=' ')
-        if form_of_labelling == 'RelationPrediction':
-            # Iterate over integer indexed triples in mini batch fashion
-            for i in range(0, num_triples, self.args.batch_size):
-                data_batch = triple_idx[i:i + self.args.batch_size]
-                e1_idx_e2_idx, r_idx = torch.LongTensor(data_batch[:, [0, 2]]), torch.LongTensor(data_batch[:, 1])
-                # Generate predictions
-                predictions = model.forward_k_vs_all(x=e1_idx_e2_idx)
-                # Filter entities except the target entity
-                for j in range(data_batch.shape[0]):
-                    filt = self.ee_vocab[(data_batch[j][0], data_batch[j][2])]
-                    target_value = predictions[j, r_idx[j]].item()
-                    predictions[j, filt] = -np.Inf
-                    predictions[j, r_idx[j]] = target_value
-                # Sort predictions.
-                sort_values, sort_idxs = torch.sort(predictions, dim=1, descending=True)
-                # This can be also done in parallel
-                for j in range(data_batch.shape[0]):
-                    rank = torch.where(sort_idxs[j] == r_idx[j])[0].item() + 1
-                    ranks.append(rank)
-                    for hits_level in hits_range:
-                        if rank <= hits_level:
-                            hits[hits_level].append(1.0)
-        else:
-            # Iterate over integer indexed triples in mini batch fashion
-            for i in range(0, num_triples, self.args.batch_size):
-                # (1) Get a batch of data.
-                data_batch = triple_idx[i:i + self.args.batch_size]
+        # Iterate over integer indexed triples in mini batch fashion
+        for i in range(0, num_triples, self.args.batch_size):
+            # (1) Get a batch of data.
+            data_batch = triple_idx[i:i + self.args.batch_size]
+            if form_of_labelling == 'RelationPrediction':
+                # (2) Extract entity pairs and relations.
+                x, target_idx = torch.LongTensor(data_batch[:, [0, 2]]), torch.LongTensor(data_batch[:, 1])
+                # (3) Predict missing relations, i.e., assign scores to all relations.
+                with torch.no_grad():
+                    predictions = model.forward_k_vs_all(x=x)
+                # (4) Relations occurring with the entity pairs.
+                vocab, keys = self.ee_vocab, data_batch[:, [0, 2]]
+            else:
                 # (2) Extract entities and relations.
-                e1_idx_r_idx, e2_idx = torch.LongTensor(data_batch[:, [0, 1]]), torch.tensor(data_batch[:, 2])
+                x, target_idx = torch.LongTensor(data_batch[:, [0, 1]]), torch.LongTensor(data_batch[:, 2])
                 # (3) Predict missing entities, i.e., assign probs to all entities.
                 with torch.no_grad():
-                    predictions = model(e1_idx_r_idx)
-                # (4) Filter entities except the target entity
-                for j in range(data_batch.shape[0]):
-                    # (4.1) Get the ids of the head entity, the relation and the target tail entity in the j.th triple.
-                    id_e, id_r, id_e_target = data_batch[j]
-                    # (4.2) Get all ids of all entities occurring with the head entity and relation extracted in 4.1.
-                    filt = self.er_vocab[(id_e, id_r)]
-                    # (4.3) Store the assigned score of the target tail entity extracted in 4.1.
-                    target_value = predictions[j, id_e_target].item()
-                    # (4.4.1) Filter all assigned scores for entities.
-                    predictions[j, filt] = -np.Inf
-                    # (4.4.2) Filter entities based on the range of a relation as well.
-                    if 'constraint' in self.args.eval_model:
-                        predictions[j, self.range_constraints_per_rel[data_batch[j, 1]]] = -np.Inf
-                    # (4.5) Insert 4.3. after filtering.
-                    predictions[j, id_e_target] = target_value
-                # (5) Sort predictions.
-                sort_values, sort_idxs = torch.sort(predictions, dim=1, descending=True)
-                # (6) Compute the filtered ranks.
-                for j in range(data_batch.shape[0]):
-                    # index between 0 and \inf
-                    rank = torch.where(sort_idxs[j] == e2_idx[j])[0].item() + 1
-                    ranks.append(rank)
-                    for hits_level in hits_range:
-                        if rank <= hits_level:
-                            hits[hits_level].append(1.0)
-        # (7) Sanity checking: a rank for a triple
+                    predictions = model(x)
+                # (4) Entities occurring with the head entities and relations
+                vocab, keys = self.er_vocab, data_batch[:, [0, 1]]
+                # (4.1) Filter entities not being in the range of the relations as well.
+                if 'constraint' in self.args.eval_model:
+                    self.constraints.mask(predictions, data_batch[:, 1], side="range", keep=target_idx)
+            if isinstance(vocab, FilterIndex):
+                # (4.2) CSR lookup of all keys at once.
+                crow_indices, col_indices = (torch.from_numpy(i).to(predictions.device) for i in vocab.csr(keys))
+            else:
+                crow_indices, col_indices = csr_filter([vocab[(a, b)] for a, b in keys], device=predictions.device)
+            # (5) Filter all known entities except the targets and compute the filtered ranks.
+            batch_ranks = filtered_ranks(predictions, target_idx, crow_indices, col_indices).cpu()
+            ranks.append(batch_ranks)
+            hits += (batch_ranks.unsqueeze(1) <= hits_range).sum(dim=0)
+        ranks = torch.cat(ranks) if ranks else torch.zeros(0)
+        # (6) Sanity checking: a rank for a triple
         assert len(triple_idx) == len(ranks) == num_triples
-        hit_1 = sum(hits[1]) / num_triples
-        hit_3 = sum(hits[3]) / num_triples
-        hit_10 = sum(hits[10]) / num_triples
-        mean_reciprocal_rank = np.mean(1. / np.array(ranks))
+        hit_1 = hits[0].item() / num_triples
+        hit_3 = hits[2].item() / num_triples
+        hit_10 = hits[9].item() / num_triples
+        mean_reciprocal_rank = torch.mean(1. / ranks.double()).item()
 
         results = {'H@1': hit_1, 'H@3': hit_3, 'H@10': hit_10, 'MRR': mean_reciprocal_rank}
         if info and self.during_training is False:
@@ -64,7 +64,9 @@ class Execute:
                 path_for_deserialization=self.args.path_experiment_folder if hasattr(self.args,
                                                                                      'path_experiment_folder') else None,
                 backend=self.args.backend,
-                training_technique=self.args.scoring_technique)
+                training_technique=self.args.scoring_technique,
+                read_chunk_size=self.args.read_chunk_size,
+                num_preprocess_workers=self.args.num_preprocess_workers)
         print(f'Preprocessing took: {time.time() - start_time:.3f} seconds')
         # (2) Share some info about data for easy access.
         print(kg.description_of_input)
@@ -101,6 +103,7 @@ class Execute:
             'max_length_subword_tokens'] = self.knowledge_graph.max_length_subword_tokens if self.knowledge_graph.max_length_subword_tokens else None
 
         self.report['runtime_kg_loading'] = time.time() - self.start_time
+        self.report['preprocessing_timings'] = self.knowledge_graph.preprocessing_timings
 
     def load_indexed_data(self) -> None:
         """ Load the indexed data from disk into memory
@@ -138,8 +141,12 @@ class Execute:
         # Save the epoch loss
         # (2) Store NumParam and EstimatedSizeMB
         self.report.update(self.trained_model.mem_of_model())
-        # (3) Store/Serialize Model for further use.
-        if self.is_continual_training is False:
+        # (3) Store/Serialize Model for further use. Only rank 0 of a distributed training launched via torchrun.
+        if int(os.environ.get("RANK", 0)) > 0:
+            print(f'Rank {os.environ["RANK"]} does not store the model')
+        elif getattr(self.args, "sharded_embeddings", False):
+            print('Each rank has stored its shard of the model into checkpoint_rank_{rank}.pt')
+        elif self.is_continual_training is False:
             store(trainer=self.trainer,
                   trained_model=self.trained_model,
                   model_name='model',
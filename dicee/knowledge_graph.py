@@ -1,6 +1,7 @@
 from typing import List
 from .read_preprocess_save_load_kg import ReadFromDisk, PreprocessKG, LoadSaveToDisk
 import sys
+import time
 
 class KG:
     """ Knowledge Graph """
@@ -15,7 +16,8 @@ class KG:
                  add_reciprical: bool = None, eval_model: str = None,
                  read_only_few: int = None, sample_triples_ratio: float = None,
                  path_for_serialization: str = None,
-                 entity_to_idx=None, relation_to_idx=None, backend=None, training_technique: str = None):
+                 entity_to_idx=None, relation_to_idx=None, backend=None, training_technique: str = None,
+                 read_chunk_size: int = None, num_preprocess_workers: int = None):
         """
         :param dataset_dir: A path of a folder containing train.txt, valid.txt, test.text
         :param byte_pair_encoding: Apply Byte pair encoding.
@@ -31,6 +33,9 @@ class KG:
         :param add_noise_rate: Add say 10% noise in the input data
         sample_triples_ratio
         :param training_technique
+        :param read_chunk_size: Number of triples read at once with backend="streaming"
+        :param num_preprocess_workers: Number of processes used to read and index (backend="streaming") and
+        to create er/re/ee vocabs
         """
         self.dataset_dir = dataset_dir
         self.byte_pair_encoding = byte_pair_encoding
@@ -52,6 +57,10 @@ class KG:
         self.relation_to_idx = relation_to_idx
         self.backend = 'pandas' if backend is None else backend
         self.training_technique = training_technique
+        self.read_chunk_size = read_chunk_size
+        self.num_preprocess_workers = num_preprocess_workers
+        # Runtimes of preprocessing stages in seconds
+        self.preprocessing_timings = dict()
         self.raw_train_set, self.raw_valid_set, self.raw_test_set = None, None, None
         self.train_set, self.valid_set, self.test_set = None, None, None
         self.idx_entity_to_bpe_shaped = dict()
@@ -71,9 +80,16 @@ class KG:
         self.ordered_bpe_entities = None
 
         if self.path_for_deserialization is None:
+            start_time = time.perf_counter()
             ReadFromDisk(kg=self).start()
+            self.preprocessing_timings['read'] = time.perf_counter() - start_time
+            start_time = time.perf_counter()
             PreprocessKG(kg=self).start()
+            self.preprocessing_timings['preprocess'] = time.perf_counter() - start_time
+            start_time = time.perf_counter()
             LoadSaveToDisk(kg=self).save()
+            self.preprocessing_timings['save'] = time.perf_counter() - start_time
+            print('Preprocessing timings: ' + ', '.join(f'{k}: {v:.3f}s' for k, v in self.preprocessing_timings.items()))
 
         else:
             LoadSaveToDisk(kg=self).load()
@@ -5,8 +5,9 @@ from torch.utils.data import DataLoader
 from .abstracts import BaseInteractiveKGE
 from .dataset_classes import TriplePredictionDataset
 from .static_funcs import random_prediction, deploy_triple_prediction, deploy_tail_entity_prediction, \
-    deploy_relation_prediction, deploy_head_entity_prediction, load_pickle
+    deploy_relation_prediction, deploy_head_entity_prediction
 from .static_funcs_training import evaluate_lp
+from .read_preprocess_save_load_kg.util import load_vocab
 import numpy as np
 import sys
 
@@ -20,7 +21,8 @@ class KGE(BaseInteractiveKGE):
     def __init__(self, path=None, url=None, construct_ensemble=False,
                  model_name=None,
                  apply_semantic_constraint=False):
-        super().__init__(path=path, url=url, construct_ensemble=construct_ensemble, model_name=model_name)
+        super().__init__(path=path, url=url, construct_ensemble=construct_ensemble, model_name=model_name,
+                         apply_semantic_constraint=apply_semantic_constraint)
 
     def get_transductive_entity_embeddings(self,
                                            indices: Union[torch.LongTensor, List[str]],
@@ -128,8 +130,8 @@ class KGE(BaseInteractiveKGE):
             [(self.entity_to_idx[s], self.relation_to_idx[p], self.entity_to_idx[o]) for s, p, o in dataset])
         if filtered:
             return evaluate_lp(model=self.model, triple_idx=idx_dataset, num_entities=len(self.entity_to_idx),
-                               er_vocab=load_pickle(self.path + '/er_vocab.p'),
-                               re_vocab=load_pickle(self.path + '/re_vocab.p'))
+                               er_vocab=load_vocab(self.path + '/er_vocab'),
+                               re_vocab=load_vocab(self.path + '/re_vocab'))
         else:
             return evaluate_lp(model=self.model, triple_idx=idx_dataset, num_entities=len(self.entity_to_idx),
                                er_vocab=None, re_vocab=None)
@@ -385,8 +387,8 @@ class KGE(BaseInteractiveKGE):
             scores = self.predict_missing_head_entity(r, t, within=within).flatten()
             if self.apply_semantic_constraint:
                 # filter the scores
-                for th, i in enumerate(r):
-                    scores[self.domain_constraints_per_rel[self.relation_to_idx[i]]] = -torch.inf
+                for i in r:
+                    self.constraints.mask(scores.view(1, -1), [self.relation_to_idx[i]], side="domain")
 
             sort_scores, sort_idxs = torch.topk(scores, topk)
             return [(self.idx_to_entity[idx_top_entity], scores.item()) for idx_top_entity, scores in
@@ -410,8 +412,8 @@ class KGE(BaseInteractiveKGE):
             scores = self.predict_missing_tail_entity(h, r, within=within).flatten()
             if self.apply_semantic_constraint:
                 # filter the scores
-                for th, i in enumerate(r):
-                    scores[self.range_constraints_per_rel[self.relation_to_idx[i]]] = -torch.inf
+                for i in r:
+                    self.constraints.mask(scores.view(1, -1), [self.relation_to_idx[i]], side="range")
             sort_scores, sort_idxs = torch.topk(scores, topk)
             return [(self.idx_to_entity[idx_top_entity], scores.item()) for idx_top_entity, scores in
                     zip(sort_idxs.tolist(), torch.sigmoid(sort_scores))]
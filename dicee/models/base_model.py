@@ -4,6 +4,8 @@ import numpy as np
 import torch
 from torch import nn
 from torch.nn import functional as F
+from ..static_funcs_training import multi_labels_to_dense
+from ..optimizers import LazyAdam
 
 class BaseKGELightning(pl.LightningModule):
     def __init__(self, *args, **kwargs):
@@ -22,9 +24,18 @@ class BaseKGELightning(pl.LightningModule):
         return {'EstimatedSizeMB': (num_params + buffer_size) / 1024 ** 2, 'NumParam': num_params}
 
     def training_step(self, batch, batch_idx=None):
-        x_batch, y_batch = batch
+        if len(batch) == 3:
+            # KvsSample and shared negatives: inputs, indices of target entities and their labels.
+            x_batch, y_idx_batch, y_batch = batch
+            x_batch = (x_batch, y_idx_batch)
+        else:
+            x_batch, y_batch = batch
+        # KvsAll labels are sparse positive indices to be materialized on the device of the model.
+        y_batch = multi_labels_to_dense(y_batch, self.args.get("label_smoothing_rate", None))
         yhat_batch = self.forward(x_batch)
-        loss_batch = self.loss_function(yhat_batch, y_batch)
+        # Loss is computed in float32 even if the forward pass runs under (b)float16 autocast.
+        with torch.autocast(device_type=yhat_batch.device.type, enabled=False):
+            loss_batch = self.loss_function(yhat_batch.float(), y_batch)
         self.training_step_outputs.append(loss_batch.item())
         self.log("loss",
                  value=loss_batch,
@@ -77,6 +88,8 @@ class BaseKGELightning(pl.LightningModule):
         if parameters is None:
             parameters = self.parameters()
 
+        if self.args.get("sparse_embeddings", False):
+            return self.configure_sparse_optimizers(parameters)
         # default params in pytorch.
         if self.optimizer_name == 'SGD':
             self.selected_optimizer = torch.optim.SGD(params=parameters, lr=self.learning_rate,
@@ -103,6 +116,24 @@ class BaseKGELightning(pl.LightningModule):
             raise KeyError()
         return self.selected_optimizer
 
+    def configure_sparse_optimizers(self, parameters):
+        """ Optimizers updating only the rows of sparse embedding gradients (--sparse_embeddings) """
+        if self.optimizer_name in ['Adam', 'AdamW']:
+            self.selected_optimizer = LazyAdam(parameters, lr=self.learning_rate, weight_decay=self.weight_decay,
+                                               decoupled_weight_decay=self.optimizer_name == 'AdamW')
+        elif self.optimizer_name in ['SGD', 'Adagrad']:
+            if self.weight_decay:
+                raise ValueError(f"--optim {self.optimizer_name} does not support --weight_decay with "
+                                 f"--sparse_embeddings. Use --optim Adam or --optim AdamW")
+            if self.optimizer_name == 'SGD':
+                self.selected_optimizer = torch.optim.SGD(params=parameters, lr=self.learning_rate)
+            else:
+                self.selected_optimizer = torch.optim.Adagrad(parameters, lr=self.learning_rate, eps=1e-10)
+        else:
+            raise NotImplementedError(f"--optim {self.optimizer_name} is not implemented with --sparse_embeddings. "
+                                      f"Choices: Adam, AdamW, SGD, Adagrad")
+        return self.selected_optimizer
+
 
 class BaseKGE(BaseKGELightning):
     def __init__(self, args: dict):
@@ -122,6 +153,8 @@ class BaseKGE(BaseKGELightning):
         self.num_of_output_channels = None
         self.weight_decay = None
         self.loss = torch.nn.BCEWithLogitsLoss()
+        # Self-adversarial weighting of negatives in NegSample training.
+        self.adversarial_temperature = self.args.get("adversarial_temperature", None)
         self.selected_optimizer = None
         self.normalizer_class = None
         self.normalize_head_entity_embeddings = IdentityClass()
@@ -161,6 +194,55 @@ class BaseKGE(BaseKGELightning):
             self.relation_embeddings = torch.nn.Embedding(self.num_relations, self.embedding_dim)
             self.param_init(self.entity_embeddings.weight.data), self.param_init(self.relation_embeddings.weight.data)
 
+    def use_sparse_embeddings(self) -> None:
+        """ Entity and relation embeddings compute sparse gradients of the rows occurring in a mini-batch """
+        for embedding in [getattr(self, 'entity_embeddings', None), getattr(self, 'relation_embeddings', None)]:
+            if isinstance(embedding, torch.nn.Embedding):
+                embedding.sparse = True
+
+    def loss_function(self, yhat_batch: torch.FloatTensor, y_batch: torch.FloatTensor):
+        if self.adversarial_temperature and self.args.get("scoring_technique") == "NegSample":
+            return self.self_adversarial_loss(yhat_batch, y_batch)
+        return self.loss(yhat_batch, y_batch)
+
+    def self_adversarial_loss(self, yhat_batch: torch.FloatTensor, y_batch: torch.FloatTensor):
+        """
+        Binary cross entropy with self-adversarial weights of negatives (Sun et al. 2019, RotatE)
+
+        Negatives of a triple are weighted by the softmax of their scores scaled by adversarial_temperature.
+        The weights are not differentiated.
+
+        Parameters
+        ----------
+        yhat_batch: scores of B positive triples followed by neg_ratio x B negatives, see NegativeSampler.corrupt,
+        or B x (1 + M) scores of true tails and M shared negatives, see SharedNegativeSampleDataset
+        y_batch: labels of yhat_batch
+
+        Returns
+        -------
+        loss
+        """
+        if yhat_batch.dim() == 2:
+            # Negatives of the i.th triple are in the i.th row.
+            positive_loss = F.binary_cross_entropy_with_logits(yhat_batch[:, 0], y_batch[:, 0])
+            negative_scores = yhat_batch[:, 1:].transpose(0, 1)
+            negative_loss = F.binary_cross_entropy_with_logits(negative_scores, y_batch[:, 1:].transpose(0, 1),
+                                                               reduction="none")
+            weights = torch.softmax(self.adversarial_temperature * negative_scores.detach(), dim=0)
+            return (positive_loss + (weights * negative_loss).sum(dim=0).mean()) / 2
+        neg_ratio = self.args.get("neg_ratio") or 0
+        batch_size = len(yhat_batch) // (1 + neg_ratio)
+        assert batch_size * (1 + neg_ratio) == len(yhat_batch)
+        positive_loss = F.binary_cross_entropy_with_logits(yhat_batch[:batch_size], y_batch[:batch_size])
+        if neg_ratio == 0:
+            return positive_loss
+        negative_scores = yhat_batch[batch_size:].view(neg_ratio, batch_size)
+        weights = torch.softmax(self.adversarial_temperature * negative_scores.detach(), dim=0)
+        negative_loss = F.binary_cross_entropy_with_logits(negative_scores, y_batch[batch_size:].view(neg_ratio,
+                                                                                                     batch_size),
+                                                           reduction="none")
+        return (positive_loss + (weights * negative_loss).sum(dim=0).mean()) / 2
+
     def forward_byte_pair_encoded_k_vs_all(self, x: torch.LongTensor):
         """
 
@@ -350,8 +432,11 @@ class BaseKGE(BaseKGELightning):
     def forward_k_vs_all(self, *args, **kwargs):
         raise ValueError(f'MODEL:{self.name} does not have forward_k_vs_all function')
 
-    def forward_k_vs_sample(self, *args, **kwargs):
-        raise ValueError(f'MODEL:{self.name} does not have forward_k_vs_sample function')
+    def forward_k_vs_sample(self, x: torch.LongTensor, target_entity_idx: torch.LongTensor) -> torch.FloatTensor:
+        """ Scores of B x K (h, r, t_k) triples via forward_triples for models without a dedicated implementation """
+        batch_size, num_targets = target_entity_idx.shape
+        triples = torch.cat((x.repeat_interleave(num_targets, dim=0), target_entity_idx.reshape(-1, 1)), dim=1)
+        return self.forward_triples(triples).view(batch_size, num_targets)
 
     def get_triple_representation(self, idx_hrt):
         # (1) Split input into indexes.
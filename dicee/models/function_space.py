@@ -1,7 +1,153 @@
-from .base_model import BaseKGE
+from .base_model import BaseKGE, IdentityClass
+from .quadrature import nodes_and_weights, integrate, full_precision, fixed_scheme
 import torch
 import numpy as np
 
+
+class PolynomialIntegrals(torch.nn.Module):
+    '''Closed-form scores of polynomial embeddings.
+
+    A batch of embeddings is given as a coefficient tensor of shape (batch, m, degree+1), i.e.,
+    m polynomials f(x) = sum_{i=0}^{degree} c_i x^i per entity or relation.
+    Every score reduces to the moments M[n] = ∫_{a}^{b} x^n dx. The moment tensors are computed once per degree
+    and interval and registered as non-persistent buffers so that they follow model.to() and are not stored in model.pt.'''
+
+    def __init__(self, degree: int, a: float = 0.0, b: float = 1.0):
+        super().__init__()
+        self.degree = degree
+        self.a, self.b = a, b
+        d = degree + 1
+        # The composition h(r(x)) has degree**2 as the highest degree.
+        self.comp_dim = degree * degree + 1
+        n = torch.arange(max(3 * degree, self.comp_dim - 1 + degree) + 1, dtype=torch.float64)
+        moments = (b ** (n + 1) - a ** (n + 1)) / (n + 1)
+        idx = torch.arange(self.comp_dim)
+        i, j, k = torch.meshgrid(idx[:d], idx[:d], idx[:d], indexing="ij")
+        # (1) M[i+j+k] for ∫ h r t.
+        self.register_buffer("tri_moments", moments[i + j + k].float(), persistent=False)
+        i, j = torch.meshgrid(idx[:d], idx[:d], indexing="ij")
+        # (2) M[i+j] for ∫ f g and M[i] for ∫ f.
+        self.register_buffer("inner_moments", moments[i + j].float(), persistent=False)
+        self.register_buffer("moments", moments[:d].float(), persistent=False)
+        i, j = torch.meshgrid(idx, idx[:d], indexing="ij")
+        # (3) M[n+k] for ∫ h(r(x)) t(x), where n indexes the coefficients of h(r(x)).
+        self.register_buffer("comp_moments", moments[i + j].float(), persistent=False)
+        # (4) product[j,n,k] = 1 iff j+n = k, i.e., multiplication of a polynomial with r.
+        i, j, k = torch.meshgrid(idx[:d], idx, idx, indexing="ij")
+        self.register_buffer("product", (i + j == k).float(), persistent=False)
+
+    # Every score is linear in t, i.e., score(h,r,t) = sum_{p,k} q(h,r)_{p,k} t_{p,k}.
+    # Hence, a query q is computed once per (h,r) and scored against any number of tails.
+    def tri_query(self, h: torch.FloatTensor, r: torch.FloatTensor) -> torch.FloatTensor:
+        '''score(h,r,t) = sum_{i,j,k} h_i r_j t_k M[i+j+k] summed over the m polynomials'''
+        return torch.einsum('bpi,bpj,ijk->bpk', h, r, self.tri_moments)
+
+    def vtp_query(self, h: torch.FloatTensor, r: torch.FloatTensor) -> torch.FloatTensor:
+        '''score(h,r,t) = ∫ h t ∫ r - ∫ r t ∫ h summed over the m polynomials'''
+        r_int = (r @ self.moments).unsqueeze(-1)
+        h_int = (h @ self.moments).unsqueeze(-1)
+        return (h @ self.inner_moments) * r_int - (r @ self.inner_moments) * h_int
+
+    def comp_query(self, h: torch.FloatTensor, r: torch.FloatTensor) -> torch.FloatTensor:
+        '''score(h,r,t) = ∫ h(r(x)) t(x) dx summed over the m polynomials'''
+        batch_size, m, _ = r.shape
+        # (1) Coefficients of r^0, r^1, ..., r^degree padded to degree**2+1.
+        power = torch.zeros(batch_size, m, self.comp_dim, dtype=r.dtype, device=r.device)
+        power[:, :, 0] = 1.0
+        powers = [power]
+        for _ in range(self.degree):
+            power = torch.einsum('bpj,bpn,jnk->bpk', r, power, self.product)
+            powers.append(power)
+        # (2) Coefficients of h(r(x)) = sum_i h_i r(x)^i.
+        h_o_r = torch.einsum('bpi,bpin->bpn', h, torch.stack(powers, dim=2))
+        return h_o_r @ self.comp_moments
+
+    def query(self, h: torch.FloatTensor, r: torch.FloatTensor, score_func: str = "tri") -> torch.FloatTensor:
+        if score_func == "tri":
+            return self.tri_query(h, r)
+        elif score_func == "comp":
+            return self.comp_query(h, r)
+        elif score_func == "vtp":
+            return self.vtp_query(h, r)
+        else:
+            raise ValueError(f'Invalid score_func: {score_func}')
+
+    def forward(self, h: torch.FloatTensor, r: torch.FloatTensor, t: torch.FloatTensor,
+                score_func: str = "tri") -> torch.FloatTensor:
+        return torch.sum(full_precision(self.query(h, r, score_func) * t), dim=(1, 2))
+
+    def k_vs_all(self, h: torch.FloatTensor, r: torch.FloatTensor, t: torch.FloatTensor,
+                 score_func: str = "tri") -> torch.FloatTensor:
+        '''Scores of (batch, m, degree+1) heads and relations against all (num_entities, m, degree+1) tails'''
+        return full_precision(self.query(h, r, score_func).flatten(1) @ t.flatten(1).transpose(0, 1))
+
+    def k_vs_sample(self, h: torch.FloatTensor, r: torch.FloatTensor, t: torch.FloatTensor,
+                    score_func: str = "tri") -> torch.FloatTensor:
+        '''Scores of (batch, m, degree+1) heads and relations against (batch, num_targets, m, degree+1) tails'''
+        return full_precision(torch.einsum('bpk,bspk->bs', self.query(h, r, score_func), t))
+
+
+class FunctionValueCache:
+    """ Evaluations of all entity functions on a fixed grid, i.e., a contiguous |E| x k x |grid| tensor.
+
+    The evaluations are recomputed whenever the embedding matrix is modified in-place (e.g. by an optimizer step or
+    load_state_dict), replaced, moved to another device or evaluated on another grid."""
+
+    def __init__(self, dtype: torch.dtype = torch.float32):
+        self.dtype = dtype
+        self.key = None
+        self.values = None
+
+    def __call__(self, weight: torch.Tensor, grid: torch.Tensor, func) -> torch.FloatTensor:
+        key = (weight.data_ptr(), weight._version, tuple(weight.shape), weight.device, grid.data_ptr(), grid._version)
+        if key != self.key:
+            with torch.no_grad():
+                self.values = func(weight, x=grid).to(self.dtype).contiguous()
+            self.key = key
+        return self.values
+
+    def clear(self):
+        self.key, self.values = None, None
+
+
+def init_inference_cache(args) -> FunctionValueCache:
+    """ Inference cache of FMult and GFMult from args["inference_cache"]: "float32", "float16" or None """
+    dtype = {"float32": torch.float32, "float16": torch.float16}.get(args.get("inference_cache", "float32"))
+    return FunctionValueCache(dtype) if dtype is not None else None
+
+
+def cached_entity_values(model, grid: torch.Tensor):
+    """ |E| x k x |grid| evaluations from model.inference_cache or None if they cannot be used,
+    i.e., during training, when gradients are required or when entity embeddings are normalized """
+    weight = model.entity_embeddings.weight
+    if (model.inference_cache is None or model.training or (torch.is_grad_enabled() and weight.requires_grad)
+            or not isinstance(model.normalize_head_entity_embeddings, IdentityClass)
+            or not isinstance(model.normalize_tail_entity_embeddings, IdentityClass)):
+        return None
+    return model.inference_cache(weight, grid, model.compute_func)
+
+
+def hidden_width(embedding_dim: int, low_rank: int = None) -> int:
+    """ Width k of the two layers of FMult and GFMult stored in an embedding_dim vector:
+    two k x k matrices or, with low_rank=r, two pairs of k x r factors """
+    if low_rank is None:
+        return int(np.sqrt(embedding_dim // 2))
+    if low_rank < 1 or embedding_dim % (4 * low_rank) != 0:
+        raise ValueError(f"Invalid low_rank: {low_rank}. embedding_dim={embedding_dim} must be a multiple of 4 * low_rank")
+    return embedding_dim // (4 * low_rank)
+
+
+def low_rank_network(weights: torch.FloatTensor, x: torch.FloatTensor, low_rank: int) -> torch.FloatTensor:
+    """ W2 tanh(W1 x) with W = U V^T for a batch of (n, 4 k r) weights and (k, p) or (n, k, p) inputs.
+
+    W is never materialized, i.e., a layer costs O(k r p) instead of O(k^2 p). """
+    n = len(weights)
+    # U1, V1, U2, V2: n, k, r
+    u1, v1, u2, v2 = weights.view(n, 4, -1, low_rank).unbind(dim=1)
+    out1 = torch.tanh(u1 @ (v1.transpose(1, 2) @ x))
+    return u2 @ (v2.transpose(1, 2) @ out1)
+
+
 class FMult(BaseKGE):
     """ Learning Knowledge Neural Graphs"""
     """ Learning Neural Networks for Knowledge Graphs"""
@@ -13,19 +159,26 @@ class FMult(BaseKGE):
         self.relation_embeddings = torch.nn.Embedding(self.num_relations, self.embedding_dim)
         self.param_init(self.entity_embeddings.weight.data), self.param_init(self.relation_embeddings.weight.data)
         #number of layers for NNs = 2 
-        self.k = int(np.sqrt(self.embedding_dim // 2))
-        self.num_sample = 50
-        # self.gamma = torch.rand(self.k, self.num_sample) [0,1) uniform=> worse results
-        self.gamma = torch.randn(self.k, self.num_sample)  # N(0,1)
-        # Lazy import
-        from scipy.special import roots_legendre
-        from scipy.special import roots_legendre
-        roots, weights = roots_legendre(self.num_sample)
-        self.roots = torch.from_numpy(roots).repeat(self.k, 1).float()  # shape self.k by self.n
-        self.weights = torch.from_numpy(weights).reshape(1, -1).float()  # shape 1 by self.n
+        self.low_rank = self.args.get("low_rank")
+        self.k = hidden_width(self.embedding_dim, self.low_rank)
+        self.num_sample = self.args.get("num_quadrature_points") or 50
+        self.quadrature = self.args.get("quadrature")
+        if self.quadrature is None:
+            # self.gamma = torch.rand(self.k, self.num_sample) [0,1) uniform=> worse results
+            self.gamma = torch.randn(self.k, self.num_sample)  # N(0,1)
+            # Average over \Gamma
+            self.gamma_weights = torch.full((self.num_sample,), 1 / self.num_sample)
+        else:
+            nodes, weights = nodes_and_weights(fixed_scheme(self.quadrature, "FMult"), self.num_sample)
+            self.gamma = nodes.repeat(self.k, 1)
+            # Average over [-1,1]
+            self.gamma_weights = weights / 2
+        self.inference_cache = init_inference_cache(self.args)
 
 
     def compute_func(self, weights: torch.FloatTensor, x) -> torch.FloatTensor:
+        if self.low_rank is not None:
+            return low_rank_network(weights, x, self.low_rank)
         n = len(weights)
         # Weights for two linear layers.
         w1, w2 = torch.hsplit(weights, 2)
@@ -38,6 +191,8 @@ class FMult(BaseKGE):
         return out2  # no non-linearity => better results
 
     def chain_func(self, weights, x: torch.FloatTensor):
+        if self.low_rank is not None:
+            return low_rank_network(weights, x, self.low_rank)
         n = len(weights)
         # Weights for two linear layers.
         w1, w2 = torch.hsplit(weights, 2)
@@ -60,16 +215,61 @@ class FMult(BaseKGE):
         # out = h_x * r_x * t_x  # batch, \mathbb{R}^k, |gamma|
         # (2) Compute NNs on \Gamma
         self.gamma=self.gamma.to(head_ent_emb.device)
+        self.gamma_weights = self.gamma_weights.to(head_ent_emb.device)
 
-        h_x = self.compute_func(head_ent_emb, x=self.gamma)  # batch, \mathbb{R}^k, |\Gamma|
-        t_x = self.compute_func(tail_ent_emb, x=self.gamma)  # batch, \mathbb{R}^k, |\Gamma|
+        values = cached_entity_values(self, self.gamma)
+        if values is not None:
+            h_x = values[idx_triple[:, 0]].to(rel_ent_emb.dtype)
+            t_x = values[idx_triple[:, 2]].to(rel_ent_emb.dtype)
+        else:
+            h_x = self.compute_func(head_ent_emb, x=self.gamma)  # batch, \mathbb{R}^k, |\Gamma|
+            t_x = self.compute_func(tail_ent_emb, x=self.gamma)  # batch, \mathbb{R}^k, |\Gamma|
         r_h_x = self.chain_func(weights=rel_ent_emb, x=h_x)  # batch, \mathbb{R}^k, |\Gamma|
         # (3) Compute |\Gamma| predictions
-        out = torch.sum(r_h_x * t_x, dim=1)  # batch, |gamma| #
+        out = torch.sum(full_precision(r_h_x * t_x), dim=1)  # batch, |gamma| #
         # (4) Average (3) over \Gamma
-        out = torch.mean(out, dim=1)  # batch
+        out = torch.sum(out * self.gamma_weights, dim=1)  # batch
         return out
 
+    def tail_query(self, x: torch.LongTensor) -> torch.FloatTensor:
+        """ r(h(x)) on \Gamma scaled by the averaging weights so that the score with any tail is a dot product """
+        head_ent_emb, rel_ent_emb = self.get_head_relation_representation(x)
+        self.gamma = self.gamma.to(head_ent_emb.device)
+        self.gamma_weights = self.gamma_weights.to(head_ent_emb.device)
+        values = cached_entity_values(self, self.gamma)
+        if values is not None:
+            h_x = values[x[:, 0]].to(rel_ent_emb.dtype)
+        else:
+            h_x = self.compute_func(head_ent_emb, x=self.gamma)  # batch, \mathbb{R}^k, |\Gamma|
+        r_h_x = self.chain_func(weights=rel_ent_emb, x=h_x)  # batch, \mathbb{R}^k, |\Gamma|
+        return r_h_x * self.gamma_weights
+
+    def forward_k_vs_all(self, x: torch.LongTensor) -> torch.FloatTensor:
+        # (1) batch, k * |\Gamma|
+        r_h_x = self.tail_query(x).flatten(1)
+        # (2) Evaluate every entity once: |E|, k * |\Gamma|
+        values = cached_entity_values(self, self.gamma)
+        if values is not None:
+            t_x = values.flatten(1).to(r_h_x.dtype)
+        else:
+            t_x = self.compute_func(self.normalize_tail_entity_embeddings(self.entity_embeddings.weight),
+                                    x=self.gamma).flatten(1)
+        # (3) batch, |E|
+        return full_precision(r_h_x @ t_x.transpose(0, 1))
+
+    def forward_k_vs_sample(self, x: torch.LongTensor, target_entity_idx: torch.LongTensor) -> torch.FloatTensor:
+        batch_size, num_targets = target_entity_idx.shape
+        r_h_x = self.tail_query(x).flatten(1).unsqueeze(-1)
+        values = cached_entity_values(self, self.gamma)
+        if values is not None:
+            t_x = values[target_entity_idx].to(r_h_x.dtype)
+        else:
+            t_x = self.compute_func(self.normalize_tail_entity_embeddings(
+                self.entity_embeddings(target_entity_idx.flatten())), x=self.gamma)
+        # batch, num_targets, k * |\Gamma|
+        t_x = t_x.reshape(batch_size, num_targets, -1)
+        return full_precision(torch.bmm(t_x, r_h_x).squeeze(-1))
+
 class GFMult(BaseKGE):
     """ Learning Knowledge Neural Graphs"""
     """ Learning Neural Networks for Knowledge Graphs"""
@@ -80,13 +280,16 @@ class GFMult(BaseKGE):
         self.entity_embeddings = torch.nn.Embedding(self.num_entities, self.embedding_dim)
         self.relation_embeddings = torch.nn.Embedding(self.num_relations, self.embedding_dim)
         self.param_init(self.entity_embeddings.weight.data), self.param_init(self.relation_embeddings.weight.data)
-        self.k = int(np.sqrt(self.embedding_dim // 2))
-        self.num_sample = 250
-        roots, weights = roots_legendre(self.num_sample)
-        self.roots = torch.from_numpy(roots).repeat(self.k, 1).float()  # shape self.k by self.n
-        self.weights = torch.from_numpy(weights).reshape(1, -1).float()  # shape 1 by self.n
+        self.low_rank = self.args.get("low_rank")
+        self.k = hidden_width(self.embedding_dim, self.low_rank)
+        self.num_sample = self.args.get("num_quadrature_points") or 250
+        self.quadrature = fixed_scheme(self.args.get("quadrature") or "gauss_legendre", "GFMult")
+        self.roots, self.weights = self.quadrature_rule(None)
+        self.inference_cache = init_inference_cache(self.args)
 
     def compute_func(self, weights: torch.FloatTensor, x) -> torch.FloatTensor:
+        if self.low_rank is not None:
+            return low_rank_network(weights, x, self.low_rank)
         n = len(weights)
         # Weights for two linear layers.
         w1, w2 = torch.hsplit(weights, 2)
@@ -99,6 +302,8 @@ class GFMult(BaseKGE):
         return out2  # no non-linearity => better results
 
     def chain_func(self, weights, x: torch.FloatTensor):
+        if self.low_rank is not None:
+            return low_rank_network(weights, x, self.low_rank)
         n = len(weights)
         # Weights for two linear layers.
         w1, w2 = torch.hsplit(weights, 2)
@@ -110,22 +315,69 @@ class GFMult(BaseKGE):
         out2 = torch.bmm(w2, out1)
         return out2
 
+    def quadrature_rule(self, device):
+        """ Nodes (k, n) and weights (1, n) of the quadrature on [-1,1] """
+        nodes, weights = nodes_and_weights(self.quadrature, self.num_sample, device=device)
+        return nodes.expand(self.k, -1), weights.reshape(1, -1)
+
     def forward_triples(self, idx_triple: torch.Tensor) -> torch.Tensor:
         # (1) Retrieve embeddings: batch, \mathbb R^d
         head_ent_emb, rel_ent_emb, tail_ent_emb = self.get_triple_representation(idx_triple)
         # (2) Compute NNs on \Gamma
-        self.roots=self.roots.to(head_ent_emb.device)
-        self.weights=self.weights.to(head_ent_emb.device)
+        self.roots, self.weights = self.quadrature_rule(head_ent_emb.device)
 
-        h_x = self.compute_func(head_ent_emb, x=self.roots)  # batch, \mathbb{R}^k, |\Gamma|
-        t_x = self.compute_func(tail_ent_emb, x=self.roots)  # batch, \mathbb{R}^k, |\Gamma|
+        values = cached_entity_values(self, self.roots)
+        if values is not None:
+            h_x = values[idx_triple[:, 0]].to(rel_ent_emb.dtype)
+            t_x = values[idx_triple[:, 2]].to(rel_ent_emb.dtype)
+        else:
+            h_x = self.compute_func(head_ent_emb, x=self.roots)  # batch, \mathbb{R}^k, |\Gamma|
+            t_x = self.compute_func(tail_ent_emb, x=self.roots)  # batch, \mathbb{R}^k, |\Gamma|
         r_h_x = self.chain_func(weights=rel_ent_emb, x=h_x)  # batch, \mathbb{R}^k, |\Gamma|
         # (3) Compute |\Gamma| predictions.
-        out = torch.sum(r_h_x * t_x, dim=1)*self.weights  # batch, |gamma| #
+        out = torch.sum(full_precision(r_h_x * t_x), dim=1)*self.weights  # batch, |gamma| #
         # (4) Average (3) over \Gamma
         out = torch.mean(out, dim=1)  # batch
         return out
 
+    def tail_query(self, x: torch.LongTensor) -> torch.FloatTensor:
+        """ r(h(x)) on the roots scaled by the quadrature weights so that the score with any tail is a dot product """
+        head_ent_emb, rel_ent_emb = self.get_head_relation_representation(x)
+        self.roots, self.weights = self.quadrature_rule(head_ent_emb.device)
+        values = cached_entity_values(self, self.roots)
+        if values is not None:
+            h_x = values[x[:, 0]].to(rel_ent_emb.dtype)
+        else:
+            h_x = self.compute_func(head_ent_emb, x=self.roots)  # batch, \mathbb{R}^k, |\Gamma|
+        r_h_x = self.chain_func(weights=rel_ent_emb, x=h_x)  # batch, \mathbb{R}^k, |\Gamma|
+        return r_h_x * self.weights / self.num_sample
+
+    def forward_k_vs_all(self, x: torch.LongTensor) -> torch.FloatTensor:
+        # (1) batch, k * |\Gamma|
+        r_h_x = self.tail_query(x).flatten(1)
+        # (2) Evaluate every entity once: |E|, k * |\Gamma|
+        values = cached_entity_values(self, self.roots)
+        if values is not None:
+            t_x = values.flatten(1).to(r_h_x.dtype)
+        else:
+            t_x = self.compute_func(self.normalize_tail_entity_embeddings(self.entity_embeddings.weight),
+                                    x=self.roots).flatten(1)
+        # (3) batch, |E|
+        return full_precision(r_h_x @ t_x.transpose(0, 1))
+
+    def forward_k_vs_sample(self, x: torch.LongTensor, target_entity_idx: torch.LongTensor) -> torch.FloatTensor:
+        batch_size, num_targets = target_entity_idx.shape
+        r_h_x = self.tail_query(x).flatten(1).unsqueeze(-1)
+        values = cached_entity_values(self, self.roots)
+        if values is not None:
+            t_x = values[target_entity_idx].to(r_h_x.dtype)
+        else:
+            t_x = self.compute_func(self.normalize_tail_entity_embeddings(
+                self.entity_embeddings(target_entity_idx.flatten())), x=self.roots)
+        # batch, num_targets, k * |\Gamma|
+        t_x = t_x.reshape(batch_size, num_targets, -1)
+        return full_precision(torch.bmm(t_x, r_h_x).squeeze(-1))
+
 
 class FMult2(BaseKGE):
     """ Learning Knowledge Neural Graphs"""
@@ -143,95 +395,147 @@ class FMult2(BaseKGE):
         if tuned_embedding_dim:
             print(f"\n\n*****Embedding dimension reset to {self.embedding_dim} to fit model architecture!*****\n")
         self.k = int(np.sqrt((self.embedding_dim - 1) // self.n_layers))
-        self.n = 50
+        self.n = self.args.get("num_quadrature_points") or 50
+        self.quadrature = fixed_scheme(self.args.get("quadrature") or "trapezoid", "FMult2")
         self.a, self.b = -1.0, 1.0
         # self.score_func = "vtp" # "vector triple product"
         # self.score_func = "trilinear"
         self.score_func = "compositional"
         # self.score_func = "full-compositional"
         # self.discrete_points = torch.linspace(self.a, self.b, steps=self.n)
-        self.discrete_points = torch.linspace(self.a, self.b, steps=self.n).repeat(self.k, 1)
+        self.discrete_points, self.quadrature_weights = self.quadrature_rule(None)
 
         self.entity_embeddings = torch.nn.Embedding(self.num_entities, self.embedding_dim)
         self.relation_embeddings = torch.nn.Embedding(self.num_relations, self.embedding_dim)
         self.param_init(self.entity_embeddings.weight.data), self.param_init(self.relation_embeddings.weight.data)
 
     def build_func(self, Vec):
-        n = len(Vec)
-        # (1) Construct self.n_layers layered neural network
-        W = list(torch.hsplit(Vec[:, :-1], self.n_layers))
-        # (2) Reshape weights of the layers
-        for i, w in enumerate(W):
-            W[i] = w.reshape(n, self.k, self.k)
-        return W, Vec[:, -1]
+        # (1) Construct self.n_layers layered neural network: a view of the weights of all layers, (..., n_layers, k, k)
+        W = Vec[..., :-1].unflatten(-1, (self.n_layers, self.k, self.k))
+        return W, Vec[..., -1]
 
     def build_chain_funcs(self, list_Vec):
-        list_W = []
-        list_b = []
-        for Vec in list_Vec:
-            W_, b = self.build_func(Vec)
-            list_W.append(W_)
-            list_b.append(b)
-
-        W = list_W[-1][1:]
-        for i in range(len(list_W) - 1):
-            for j, w in enumerate(list_W[i]):
-                if i == 0 and j == 0:
-                    W_temp = w
-                else:
-                    W_temp = w @ W_temp
-            W_temp = W_temp + list_b[i].reshape(-1, 1, 1)
-        W_temp = list_W[-1][0] @ W_temp / ((len(list_Vec) - 1) * w.shape[1])
-        W.insert(0, W_temp)
-        return W, list_b[-1]
+        # (1) Weights of all functions at once: len(list_Vec), batch, n_layers, k, k
+        W, b = self.build_func(torch.stack(list_Vec))
+        # (2) W_{n_layers-1} ... W_1 W_0 of every inner function via one batched matmul per layer.
+        layers = W[:-1].movedim(2, 0).contiguous()
+        product = layers[0]
+        for w in layers[1:]:
+            product = w @ product
+        # (3) Chain the inner functions.
+        chain = product[0] + b[0, :, None, None]
+        for i in range(1, len(list_Vec) - 1):
+            chain = product[i] @ chain + b[i, :, None, None]
+        chain = W[-1, :, 0].contiguous() @ chain / ((len(list_Vec) - 1) * self.k)
+        return torch.cat((chain.unsqueeze(1), W[-1, :, 1:]), dim=1), b[-1]
 
     def compute_func(self, W, b, x) -> torch.FloatTensor:
+        # W: ..., n_layers, k, k and b: ... => ..., k, |x|
+        # (1) Layer-major contiguous weights so that every layer is a single batched matmul.
+        W = W.movedim(-3, 0).contiguous()
         out = W[0] @ x
         for i, w in enumerate(W[1:]):
             if i % 2 == 0:  # no non-linearity => better results
                 out = out + torch.tanh(w @ out)
             else:
                 out = out + w @ out
-        return out + b.reshape(-1, 1, 1)
+        return out + b[..., None, None]
 
     def function(self, list_W, list_b):
         def f(x):
             if len(list_W) == 1:
                 return self.compute_func(list_W[0], list_b[0], x)
-            score = self.compute_func(list_W[0], list_b[0], x)
-            for W, b in zip(list_W[1:], list_b[1:]):
-                score = score * self.compute_func(W, b, x)
-            return score
+            # Evaluate all functions in one pass and multiply them.
+            return torch.prod(self.compute_func(torch.stack(list_W), torch.stack(list_b), x), dim=0)
 
         return f
 
-    def trapezoid(self, list_W, list_b):
-        return torch.trapezoid(self.function(list_W, list_b)(self.discrete_points), x=self.discrete_points, dim=-1).sum(
-            dim=-1)
+    def quadrature_rule(self, device):
+        """ Nodes (k, n) and weights (n,) of the quadrature on [a,b] """
+        nodes, weights = nodes_and_weights(self.quadrature, self.n, self.a, self.b, device=device)
+        return nodes.expand(self.k, -1), weights
+
+    def integrate(self, list_W, list_b):
+        return torch.sum(full_precision(self.function(list_W, list_b)(self.discrete_points)) * self.quadrature_weights,
+                         dim=-1).sum(dim=-1)
 
     def forward_triples(self, idx_triple: torch.Tensor) -> torch.Tensor:
         # (1) Retrieve embeddings: batch, \mathbb R^d
         head_ent_emb, rel_emb, tail_ent_emb = self.get_triple_representation(idx_triple)
-        if self.discrete_points.device != head_ent_emb.device:
-            self.discrete_points = self.discrete_points.to(head_ent_emb.device)
+        self.discrete_points, self.quadrature_weights = self.quadrature_rule(head_ent_emb.device)
         if self.score_func == "vtp":
             h_W, h_b = self.build_func(head_ent_emb)
             r_W, r_b = self.build_func(rel_emb)
             t_W, t_b = self.build_func(tail_ent_emb)
-            out = -self.trapezoid([t_W], [t_b]) * self.trapezoid([h_W, r_W], [h_b, r_b]) + self.trapezoid([r_W], [
-                r_b]) * self.trapezoid([t_W, h_W], [t_b, h_b])
+            out = -self.integrate([t_W], [t_b]) * self.integrate([h_W, r_W], [h_b, r_b]) + self.integrate([r_W], [
+                r_b]) * self.integrate([t_W, h_W], [t_b, h_b])
         elif self.score_func == "compositional":
             t_W, t_b = self.build_func(tail_ent_emb)
             chain_W, chain_b = self.build_chain_funcs([head_ent_emb, rel_emb])
-            out = self.trapezoid([chain_W, t_W], [chain_b, t_b])
+            out = self.integrate([chain_W, t_W], [chain_b, t_b])
         elif self.score_func == "full-compositional":
             chain_W, chain_b = self.build_chain_funcs([head_ent_emb, rel_emb, tail_ent_emb])
-            out = self.trapezoid([chain_W], [chain_b])
+            out = self.integrate([chain_W], [chain_b])
         elif self.score_func == "trilinear":
             h_W, h_b = self.build_func(head_ent_emb)
             r_W, r_b = self.build_func(rel_emb)
             t_W, t_b = self.build_func(tail_ent_emb)
-            out = self.trapezoid([h_W, r_W, t_W], [h_b, r_b, t_b])
+            out = self.integrate([h_W, r_W, t_W], [h_b, r_b, t_b])
+        return out
+
+    def tail_query(self, x: torch.LongTensor):
+        """ Evaluations q on the discrete points such that the score with any tail t is
+        sum_{k,i} q_{k,i} t(x_i)_k (+ a term depending only on t for vtp) """
+        head_ent_emb, rel_emb = self.get_head_relation_representation(x)
+        self.discrete_points, self.quadrature_weights = self.quadrature_rule(head_ent_emb.device)
+        c = self.quadrature_weights
+        if self.score_func == "vtp":
+            h_W, h_b = self.build_func(head_ent_emb)
+            r_W, r_b = self.build_func(rel_emb)
+            # -\int t \int hr + \int r \int th
+            hr = self.integrate([h_W, r_W], [h_b, r_b])
+            h_x = self.function([h_W], [h_b])(self.discrete_points)
+            return self.integrate([r_W], [r_b]).view(-1, 1, 1) * h_x * c, -hr
+        elif self.score_func == "compositional":
+            chain_W, chain_b = self.build_chain_funcs([head_ent_emb, rel_emb])
+            return self.function([chain_W], [chain_b])(self.discrete_points) * c, None
+        elif self.score_func == "trilinear":
+            h_W, h_b = self.build_func(head_ent_emb)
+            r_W, r_b = self.build_func(rel_emb)
+            return self.function([h_W, r_W], [h_b, r_b])(self.discrete_points) * c, None
+        else:
+            raise ValueError(f"forward_k_vs_all is not supported with score_func={self.score_func}")
+
+    def forward_k_vs_all(self, x: torch.LongTensor) -> torch.FloatTensor:
+        if self.score_func == "full-compositional":
+            # The tail is chained into the function itself, i.e., there is no shared evaluation of tails.
+            num_entities = self.entity_embeddings.num_embeddings
+            tails = torch.arange(num_entities, device=x.device).repeat(len(x), 1)
+            return self.forward_k_vs_sample(x, tails)
+        # (1) batch, k * n
+        q, coeff = self.tail_query(x)
+        # (2) Evaluate every entity once: |E|, k, n
+        t_W, t_b = self.build_func(self.normalize_tail_entity_embeddings(self.entity_embeddings.weight))
+        t_x = self.function([t_W], [t_b])(self.discrete_points)
+        # (3) batch, |E|
+        out = full_precision(q.flatten(1) @ t_x.flatten(1).transpose(0, 1))
+        if coeff is not None:
+            out = out + torch.outer(coeff, (t_x * self.quadrature_weights).sum(dim=(1, 2)))
+        return out
+
+    def forward_k_vs_sample(self, x: torch.LongTensor, target_entity_idx: torch.LongTensor) -> torch.FloatTensor:
+        batch_size, num_targets = target_entity_idx.shape
+        if self.score_func == "full-compositional":
+            triples = torch.cat((x.repeat_interleave(num_targets, dim=0), target_entity_idx.reshape(-1, 1)), dim=1)
+            return self.forward_triples(triples).view(batch_size, num_targets)
+        q, coeff = self.tail_query(x)
+        t_W, t_b = self.build_func(self.normalize_tail_entity_embeddings(
+            self.entity_embeddings(target_entity_idx.flatten())))
+        # batch, num_targets, k, n
+        t_x = self.function([t_W], [t_b])(self.discrete_points).view(batch_size, num_targets, self.k, self.n)
+        out = full_precision(torch.einsum('bkn,bskn->bs', q, t_x))
+        if coeff is not None:
+            out = out + coeff.unsqueeze(1) * (t_x * self.quadrature_weights).sum(dim=(2, 3))
         return out
     
 
@@ -249,33 +553,46 @@ class LFMult(BaseKGE):
     def __init__(self,args):
         super().__init__(args)
         self.name = 'LFMult'
-        self.device_ = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.entity_embeddings = torch.nn.Embedding(self.num_entities, self.embedding_dim)
         self.relation_embeddings = torch.nn.Embedding(self.num_relations, self.embedding_dim)
         self.degree = self.args.get("degree",0)
         self.m = int(self.embedding_dim/(1+self.degree))
         self.num_layers = 1
-        self.score_func = "comp"#"tri"
-        self.weight_bias = "diff"# "same"
+        self.score_func = self.args.get("score_func") or "comp"#"tri"
+        if self.score_func == "vtp" and not self.args.get("closed_form_scoring", False):
+            raise ValueError(f"{self.name} computes score_func=vtp only with closed_form_scoring=True")
+        self.weight_bias = self.args.get("weight_bias") or "diff"# "same"
         #boundaries of the integral
         self.a =-1
         self.b = 1
         
         self.lamda = 0.001 #torch.nn.Parameter(torch.tensor(0.001))
+        self.quadrature = fixed_scheme(self.args.get("quadrature") or "gauss_legendre", "LFMult")
+        self.num_quadrature_points = self.args.get("num_quadrature_points") or 5
+
+        if self.args.get("closed_form_scoring", False):
+            # Only a single linear layer with the same weights and bias yields polynomials, i.e., w*x+b.
+            if self.weight_bias != "same" or self.num_layers != 1 or self.degree < 1:
+                raise ValueError(f"Closed-form scoring of {self.name} requires weight_bias='same', a single layer "
+                                 f"and degree >= 1. Currently: weight_bias={self.weight_bias}, "
+                                 f"num_layers={self.num_layers}, degree={self.degree}")
+            self.closed_form = PolynomialIntegrals(1, a=self.a, b=self.b)
+        else:
+            self.closed_form = None
         
     def forward_triples(self, idx_triple): 
 
         head_ent_emb, rel_emb, tail_ent_emb = self.get_triple_representation(idx_triple)
 
-        head_ent_emb = head_ent_emb.to(self.device_)
-        rel_emb = rel_emb.to(self.device_)
-        tail_ent_emb = tail_ent_emb.to(self.device_)
+        coeff_head = self.construct_multi_coeff(head_ent_emb)
+        coeff_rel = self.construct_multi_coeff(rel_emb)
+        coeff_tail = self.construct_multi_coeff(tail_ent_emb)
 
-        coeff_head = self.construct_multi_coeff(head_ent_emb)#.to(self.device_)
-        coeff_rel = self.construct_multi_coeff(rel_emb)#.to(self.device_)
-        coeff_tail = self.construct_multi_coeff(tail_ent_emb)#.to(self.device_)
+        if self.closed_form is not None:
+            # Coefficients of b + w*x as in construct_multi_layers_same.
+            return self.closed_form(coeff_head[:, :, :2], coeff_rel[:, :, :2], coeff_tail[:, :, :2],
+                                    score_func=self.score_func)
 
-        
 
         if self.weight_bias == "same":
 
@@ -305,7 +622,7 @@ class LFMult(BaseKGE):
 
                     return self.scalar_batch_NN(h,r(x),t(x))
 
-                score = torch.trapezoid(self.a, self.b, f)
+                score = self.Gauss_quad(self.a, self.b, f)
 
         
             return score 
@@ -362,7 +679,7 @@ class LFMult(BaseKGE):
         w_expanded = w.unsqueeze(-1)
         b_expanded = b.unsqueeze(-1)
 
-        out = x.to(self.device_)
+        out = x
         
 
         for _ in range(self.num_layers-1):
@@ -389,7 +706,7 @@ class LFMult(BaseKGE):
         bias = torch.stack(list_b,dim=1)
        
 
-        out = x.to(self.device_) 
+        out = x
 
         for i in range(self.num_layers-1):
 
@@ -398,7 +715,8 @@ class LFMult(BaseKGE):
         # we apply only a linear transformation on the last layer (works better)
         out = torch.tanh(weights[:,:,self.num_layers-1].unsqueeze(-1)*out  + bias[:,:,self.num_layers-1].unsqueeze(-1))
 
-        l2_regularization_term = self.lamda * (torch.norm(weights[self.num_layers - 1])**2)
+        # Squared norm of the last layer weights of each function: batch x 1 x 1
+        l2_regularization_term = self.lamda * (torch.norm(weights[:, :, self.num_layers - 1], dim=1)**2).view(-1, 1, 1)
 
         out = (1-self.lamda) *out - l2_regularization_term
 
@@ -432,17 +750,61 @@ class LFMult(BaseKGE):
     
     def Gauss_quad(self,a ,b,f):
 
-        '''Integral approximation using Gaussian Quadrature with 5 points'''
+        '''Integral approximation with the configured quadrature (by default Gaussian Quadrature with 5 points)'''
 
-        u = (b-a)/2
-        v = (a+b)/2
-        point = torch.tensor([v,  1/3*(5-2*(10/7)**.5)**.5*u + v, - 1/3*(5-2*(10/7)**.5)**.5*u + v,  1/3*(5+2*(10/7)**.5)**.5*u+v, \
-                               - 1/3*(5+2*(10/7)**.5)**.5*u+v], device = self.device_)
-        
-        
-        weight = torch.tensor([128/225, (322+13*70**.5)/900, (322+13*70**.5)/900, (322-13*70**.5)/900, (322-13*70**.5)/900], device = self.device_)
-        
-        return u * torch.sum(weight*f(point), dim=-1)
+        weight = self.entity_embeddings.weight
+        return integrate(f, a, b, self.quadrature, self.num_quadrature_points, device=weight.device, dtype=weight.dtype)
+
+    def quadrature_points_weights(self, a, b):
+
+        '''Points and weights of the configured quadrature on [a,b]'''
+
+        weight = self.entity_embeddings.weight
+        return nodes_and_weights(self.quadrature, self.num_quadrature_points, a, b, device=weight.device, dtype=weight.dtype)
+
+    def tail_query(self, x: torch.LongTensor):
+        '''Evaluations q of (h,r) such that the score with any tail is sum_{m,i} q_{m,i} t_{m,i},
+        where t_{m,i} are the tail evaluations returned by tail_values.'''
+
+        head_ent_emb, rel_emb = self.get_head_relation_representation(x)
+        coeff_head = self.construct_multi_coeff(head_ent_emb)
+        coeff_rel = self.construct_multi_coeff(rel_emb)
+
+        if self.closed_form is not None:
+            return self.closed_form.query(coeff_head[:, :, :2], coeff_rel[:, :, :2], score_func=self.score_func)
+
+        layers = self.construct_multi_layers_same if self.weight_bias == "same" else self.construct_multi_layers_diff
+        point, weight = self.quadrature_points_weights(self.a, self.b)
+
+        if self.score_func == "comp":
+            q = layers(layers(point, coeff_rel), coeff_head)
+        else:
+            q = layers(point, coeff_head) * layers(point, coeff_rel)
+        return q * weight
+
+    def tail_values(self, emb):
+        '''Tail representations matching tail_query: batch x m x (2 or number of quadrature points)'''
+
+        coeff = self.construct_multi_coeff(self.normalize_tail_entity_embeddings(emb))
+        if self.closed_form is not None:
+            return coeff[:, :, :2]
+        layers = self.construct_multi_layers_same if self.weight_bias == "same" else self.construct_multi_layers_diff
+        point, _ = self.quadrature_points_weights(self.a, self.b)
+        return layers(point, coeff)
+
+    def forward_k_vs_all(self, x: torch.LongTensor) -> torch.FloatTensor:
+        # (1) batch, m * n
+        q = self.tail_query(x).flatten(1)
+        # (2) Evaluate every entity once: |E|, m * n
+        t = self.tail_values(self.entity_embeddings.weight).flatten(1)
+        # (3) batch, |E|
+        return full_precision(q @ t.transpose(0, 1))
+
+    def forward_k_vs_sample(self, x: torch.LongTensor, target_entity_idx: torch.LongTensor) -> torch.FloatTensor:
+        batch_size, num_targets = target_entity_idx.shape
+        q = self.tail_query(x).flatten(1).unsqueeze(-1)
+        t = self.tail_values(self.entity_embeddings(target_entity_idx.flatten())).reshape(batch_size, num_targets, -1)
+        return full_precision(torch.bmm(t, q).squeeze(-1))
 
     
     
@@ -460,7 +822,27 @@ class PolyMult(BaseKGE):
         self.relation_embeddings = torch.nn.Embedding(self.num_relations, self.embedding_dim)
         self.degree = self.args.get("degree",0)
         self.m = int(self.embedding_dim/(1+self.degree))
-        self.x_values = torch.linspace(-1, 1, 100)
+        # Constants of the scoring functions: non-persistent buffers following model.to()
+        degrees = torch.arange(self.degree + 1)
+        i_range, j_range, k_range = torch.meshgrid(degrees, degrees, degrees, indexing="ij")
+        if self.degree == 0:
+            terms = 1 / (1 + i_range + j_range + k_range) #%self.degree
+        else:
+            terms = 1 / (1 + (i_range + j_range + k_range)%self.degree) #%self.degree
+        self.register_buffer("tri_terms", terms.float(), persistent=False)
+        self.register_buffer("x_values", torch.linspace(-1, 1, 100), persistent=False)
+        self.register_buffer("degrees", degrees.float(), persistent=False)
+        self.register_buffer("x_powers", self.x_values.unsqueeze(1) ** self.degrees, persistent=False)
+        self.score_func = self.args.get("score_func") or "tri"
+        if self.args.get("closed_form_scoring", False):
+            # tri and vtp are defined over [0,1], comp over the points x_values in [-1,1].
+            a = -1.0 if self.score_func == "comp" else 0.0
+            self.closed_form = PolynomialIntegrals(self.degree, a=a, b=1.0)
+        elif self.score_func == "tri":
+            # Sums over tri_terms 1/(1+(i+j+k)%degree) instead of the exact integral.
+            self.closed_form = None
+        else:
+            raise ValueError(f"{self.name} computes score_func={self.score_func} only with closed_form_scoring=True")
 
     def forward_triples(self, idx_triple): # idx_triplet = (h_idx, r_idx, t_idx) #change this to the forward_triples
 
@@ -468,6 +850,9 @@ class PolyMult(BaseKGE):
 
         coeff_head, coeff_rel, coeff_tail = self.construct_multi_coeff(head_ent_emb), self.construct_multi_coeff(rel_emb), self.construct_multi_coeff(tail_ent_emb)
 
+        if self.closed_form is not None:
+            return self.closed_form(coeff_head, coeff_rel, coeff_tail, score_func=self.score_func)
+
         ###### polynomial score with trilinear scoring
 
         score = self.tri_score(coeff_head,coeff_rel,coeff_tail)
@@ -483,7 +868,31 @@ class PolyMult(BaseKGE):
         coeffs = torch.stack(coeffs,dim=1)
 
         return coeffs.transpose(1,2)
-    
+
+    def tail_query(self, x: torch.LongTensor) -> torch.FloatTensor:
+        '''Coefficients q of (h,r) such that the score with any tail is sum_{m,k} q_{m,k} c_{m,k},
+        where c_{m,k} are the coefficients of the tail.'''
+
+        head_ent_emb, rel_emb = self.get_head_relation_representation(x)
+        coeff_head, coeff_rel = self.construct_multi_coeff(head_ent_emb), self.construct_multi_coeff(rel_emb)
+        if self.closed_form is not None:
+            return self.closed_form.query(coeff_head, coeff_rel, score_func=self.score_func)
+        return torch.einsum('bpi,bpj,ijk->bpk', coeff_head, coeff_rel, self.tri_terms)
+
+    def forward_k_vs_all(self, x: torch.LongTensor) -> torch.FloatTensor:
+        # (1) batch, m * (degree+1)
+        q = self.tail_query(x).flatten(1)
+        # (2) |E|, m * (degree+1)
+        coeff_tail = self.construct_multi_coeff(self.normalize_tail_entity_embeddings(self.entity_embeddings.weight))
+        # (3) batch, |E|
+        return full_precision(q @ coeff_tail.flatten(1).transpose(0, 1))
+
+    def forward_k_vs_sample(self, x: torch.LongTensor, target_entity_idx: torch.LongTensor) -> torch.FloatTensor:
+        batch_size, num_targets = target_entity_idx.shape
+        q = self.tail_query(x).flatten(1).unsqueeze(-1)
+        coeff_tail = self.construct_multi_coeff(self.normalize_tail_entity_embeddings(
+            self.entity_embeddings(target_entity_idx.flatten())))
+        return full_precision(torch.bmm(coeff_tail.reshape(batch_size, num_targets, -1), q).squeeze(-1))
 
     def tri_score(self, coeff_h, coeff_r, coeff_t):
 
@@ -500,63 +909,22 @@ class PolyMult(BaseKGE):
 
         '''
 
-        i_range, j_range, k_range = torch.meshgrid(torch.arange(self.degree+1),torch.arange(self.degree+1),torch.arange(self.degree+1))
-
-        if self.degree == 0:
-
-            terms = 1 / (1 + i_range + j_range + k_range) #%self.degree
-        else:
-            terms = 1 / (1 + (i_range + j_range + k_range)%self.degree) #%self.degree
-
+        terms = self.tri_terms
 
         weighted_terms = terms.unsqueeze(0)*coeff_h.reshape(-1, 1, self.degree+1, 1) *coeff_r.reshape(-1, self.degree+1, 1, 1) * coeff_t.reshape(-1, 1, 1,self.degree+1)
         
-        result = torch.sum(weighted_terms, dim=[-3,-2,-1])
+        result = torch.sum(full_precision(weighted_terms), dim=[-3,-2,-1])
 
         return result
     
-    def vtp_score(self, h, r, t):
-            
-        '''this part implement the vector triple product scoring techniques: 
-
-        score(h,r,t) = \int_{0}{1} h(x)r(x)t(x) dx = \sum_{i,j,k = 0}^{d-1} \dfrac{a_i*c_j*b_k - b_i*c_j*a_k}{(1+(i+j)%d)(1+k)} 
-
-        1. generate the range for i,j and k from [0 d-1]
-
-        2. Compute the first and second terms of the sum
-
-        3.  Multiply with then denominator and take the sum
-        
-        4. take the sum over each batch
-        
-        '''
-            
-        i_range, j_range, k_range = torch.meshgrid(torch.arange(self.embedding_dim),torch.arange(self.embedding_dim),torch.arange(self.embedding_dim))
-
-        # terms = 1 / (1 + (i_range + j_range)%self.embedding_dim) / (1+ k_range) # with modulo
-
-        terms = 1 / (1 + i_range + j_range) / (1+ k_range)   #without dthe modulo
-
-
-        terms1 = h.view(-1, 1, self.embedding_dim, 1) * t.view(-1, self.embedding_dim, 1, 1) * r.view(-1, 1, 1,self.embedding_dim)
-        terms2 = r.view(-1, 1, self.embedding_dim, 1) * t.view(-1, self.embedding_dim, 1, 1) * h.view(-1, 1, 1,self.embedding_dim)
-
-        weighted_terms = terms * (terms1-terms2)
-        
-        result = torch.sum(weighted_terms, dim=[-3,-2,-1])
-
-        return result
-
     def comp_func(self,h,r,t): 
         '''this part implement the function composition scoring techniques: i.e. score = <hor, t>'''
 
-        degree = torch.arange(self.degree+1, dtype=torch.float32)
+        r_emb = torch.matmul(r, self.x_powers.T)
 
-        r_emb = self.polynomial(r,self.x_values, degree) 
+        t_emb = torch.matmul(t, self.x_powers.T)
 
-        t_emb = self.polynomial(t,self.x_values, degree) 
-
-        hor = self.pop(h,r_emb, degree) 
+        hor = self.pop(h,r_emb, self.degrees) 
         
         score = torch.trapz(hor*t_emb , self.x_values) #Computing the score with the trapezoid method
 
@@ -581,9 +949,9 @@ class PolyMult(BaseKGE):
             and return a tensor (coeff[0][0] + coeff[0][1]x +...+ coeff[0][d]x^d,
                                 coeff[1][0] + coeff[1][1]x +...+ coeff[1][d]x^d)
                                         ....'''
-        x_powers = x.unsqueeze(2) ** degree
+        x_powers = x.unsqueeze(-1) ** degree
 
-        Mat = (coeff.unsqueeze(1)*x_powers).sum(dim=-1)
+        Mat = (coeff.unsqueeze(-2)*x_powers).sum(dim=-1)
 
         return Mat
     
@@ -672,14 +1040,34 @@ class PolyMult(BaseKGE):
 class LFMult1(BaseKGE): 
 
     '''Embedding with trigonometric functions. We represent all entities and relations in the complex number space as:
-      f(x) = \sum_{k=0}^{k=d-1}wk e^{kix}. and use the three differents scoring function as in the paper to evaluate the score'''
+      f(x) = \sum_{k=0}^{k=d-1}wk e^{kix}. and use the three differents scoring function as in the paper to evaluate the score
+
+      All scores are sums of the form sum_{i,j,k} h_i r_j t_k g(i+j-k) (or sum_{i,j} h_i t_j g(i-j)), i.e., convolutions.
+      They are computed either with FFTs in O(batch d log d) ("fft") or exactly by direct convolution in chunks of the
+      batch with O(batch d) memory ("direct").'''
     
     def __init__(self,args):
         super().__init__(args)
         self.name = 'LFMult1'
         self.entity_embeddings = torch.nn.Embedding(self.num_entities, self.embedding_dim)
         self.relation_embeddings = torch.nn.Embedding(self.num_relations, self.embedding_dim)
-        
+        self.trig_scoring = self.args.get("trig_scoring") or "fft"
+        assert self.trig_scoring in ["fft", "direct"], f"Invalid trig_scoring: {self.trig_scoring}"
+        self.chunk_size = 1024
+        d = self.embedding_dim
+        eps = 10**-6   #for stability reason
+        # (1) g(n) = sin(n)/n for n = i+j-k in [-(d-1), 2(d-1)] with g(0) = 0 (the sum on i+j = k is computed apart)
+        n = torch.arange(-(d - 1), 2 * d - 1, dtype=torch.float64)
+        self.register_buffer("tri_kernel", torch.where(n == 0, 0.0, torch.sin(n) / (eps + n)).float(),
+                             persistent=False)
+        # (2) sinc(n) = sin(n)/n for n = i-j in [-(d-1), d-1] with sinc(0) = 1, i.e., \int_0^1 cos(nx) dx
+        n = torch.arange(-(d - 1), d, dtype=torch.float64)
+        self.register_buffer("vtp_kernel", torch.where(n == 0, 1.0, torch.sin(n) / (eps + n)).float(),
+                             persistent=False)
+        # (3) \int_0^1 f(x) dx = w_0 + sum_{i>0} w_i sin(i)/i
+        i = torch.arange(1, d, dtype=torch.float64)
+        self.register_buffer("integral_weights", torch.cat((torch.ones(1, dtype=torch.float64),
+                                                            torch.sin(i) / i)).float(), persistent=False)
 
     def forward_triples(self, idx_triple): # idx_triplet = (h_idx, r_idx, t_idx) #change this to the forward_triples
 
@@ -689,38 +1077,69 @@ class LFMult1(BaseKGE):
     
         return score
 
+    def convolve(self, h, r):
+
+        '''c_s = sum_{i+j=s} h_i r_j for s in [0, 2(d-1)]'''
+
+        d = self.embedding_dim
+        if self.trig_scoring == "fft":
+            n = 2 * d - 1
+            return torch.fft.irfft(torch.fft.rfft(h, n=n) * torch.fft.rfft(r, n=n), n=n)
+        # One group per triple: batch x (2d-1)
+        return torch.nn.functional.conv1d(torch.nn.functional.pad(h, (d - 1, d - 1)).unsqueeze(0),
+                                          r.flip(-1).unsqueeze(1), groups=len(h)).squeeze(0)
+
+    def correlate(self, t, kernel, size):
+
+        '''u_s = sum_k t_k kernel[s-k+d-1] for s in [0, size)'''
+
+        d = self.embedding_dim
+        if self.trig_scoring == "fft":
+            n = d + len(kernel) - 1
+            u = torch.fft.irfft(torch.fft.rfft(t, n=n) * torch.fft.rfft(kernel, n=n), n=n)
+            return u[:, d - 1:d - 1 + size]
+        idx = torch.arange(size, device=t.device).unsqueeze(0) - torch.arange(d, device=t.device).unsqueeze(1)
+        return t @ kernel[idx + d - 1]
+
+    def chunked(self, score_func, *embs):
+
+        '''Apply score_func on chunks of the batch in the direct computation'''
+
+        if self.trig_scoring == "fft" or len(embs[0]) <= self.chunk_size:
+            return score_func(*embs)
+        return torch.cat([score_func(*chunk) for chunk in zip(*[torch.split(e, self.chunk_size) for e in embs])])
+
     def tri_score(self,h,r,t):
 
-        i_range, j_range, k_range = torch.meshgrid(torch.arange(self.embedding_dim),torch.arange(self.embedding_dim),torch.arange(self.embedding_dim))
-        eps = 10**-6   #for stability reason
-        cond = i_range + j_range == k_range
+        return self.chunked(self._tri_score, h, r, t)
+
+    def _tri_score(self, h, r, t):
 
-        s1 = torch.sum(torch.where(~cond, torch.zeros_like(~cond),  h[:, i_range] * r[:, j_range] * t[:, k_range]),dim=(-3,-2,-1)) # sum on i+j = k
+        d = self.embedding_dim
+        c = self.convolve(h, r)
 
-        s2 = torch.sum(torch.where(cond, torch.zeros_like(cond), torch.sin(i_range + j_range - k_range) \
-                                * h[:, i_range] * r[:, j_range] * t[:, k_range] /(eps+i_range + j_range - k_range)),dim=(-3,-2,-1))# sum on i+j != k
+        s1 = torch.sum(c[:, :d] * t, dim=-1) # sum on i+j = k
+
+        s2 = torch.sum(c * self.correlate(t, self.tri_kernel, 2 * d - 1), dim=-1) # sum on i+j != k
         s = s1**2 + s2**2 # combine the two sums.
         return s
     
     def vtp_score(self,h,r,t):
 
-        i_range, j_range = torch.meshgrid(torch.arange(self.embedding_dim),torch.arange(self.embedding_dim))
-        eps = 10**-6   #for stability reason
-        cond = i_range == j_range
+        return self.chunked(self._vtp_score, h, r, t)
 
-        p1 = torch.sum(torch.where(cond, torch.zeros_like(cond), torch.sin(i_range - j_range) \
-                                * h[:, i_range] * t[:, j_range] /(eps+i_range - j_range)),dim=(-3,-2,-1)) \
-                                    + torch.sum(h[:, i_range] * t[:, i_range],dim=(-3,-2,-1))# sum on i != j
-        i_1 = torch.arange(1,self.embedding_dim)
-        p2 = torch.sum(r[:, i_1] * torch.sin(i_1)/(i_1) ,dim=-1) + r[:,0]
+    def _vtp_score(self, h, r, t):
+
+        d = self.embedding_dim
+        t_sinc = self.correlate(t, self.vtp_kernel, d)
+
+        p1 = torch.sum(h * t_sinc, dim=-1) # \int h t
+        p2 = r @ self.integral_weights # \int r
         
         s1 = p1*p2
 
-        p3 = torch.sum(torch.where(cond, torch.zeros_like(cond), torch.sin(i_range - j_range) \
-                                * r[:, i_range] * t[:, j_range] /(eps+i_range - j_range)),dim=(-3,-2,-1)) \
-                                    + torch.sum(r[:, i_range] * t[:, i_range],dim=(-3,-2,-1))# sum on i != j
-        
-        p4 = torch.sum(h[:, i_1] * torch.sin(i_1)/(i_1) ,dim=-1) + h[:,0]
+        p3 = torch.sum(r * t_sinc, dim=-1) # \int r t
+        p4 = h @ self.integral_weights # \int h
         s2 = p3*p4
 
 
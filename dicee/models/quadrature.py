@@ -0,0 +1,149 @@
+""" Numerical integration rules shared by the function-space models (FMult, GFMult, FMult2, LFMult).
+
+Nodes and weights are computed once per (scheme, n, interval, device, dtype) and reused afterwards.
+"""
+from typing import Callable, Dict, Tuple
+import functools
+import numpy as np
+import torch
+
+SCHEMES = ("gauss_legendre", "clenshaw_curtis", "trapezoid", "adaptive")
+
+_RULES: Dict[tuple, Tuple[torch.FloatTensor, torch.FloatTensor]] = dict()
+
+
+@functools.lru_cache(maxsize=None)
+def reference_rule(scheme: str, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Nodes in ascending order and weights of a rule with n points on [-1,1] in float64.
+
+    Parameters
+    ----------
+    scheme: "gauss_legendre", "clenshaw_curtis" or "trapezoid"
+    n: number of points
+
+    Returns
+    -------
+    nodes, weights
+    """
+    if scheme == "gauss_legendre":
+        assert n >= 1, f"Gauss-Legendre requires at least one point: {n}"
+        return np.polynomial.legendre.leggauss(n)
+    elif scheme == "clenshaw_curtis":
+        assert n >= 2, f"Clenshaw-Curtis requires at least two points: {n}"
+        N = n - 1
+        theta = np.pi * np.arange(n) / N
+        k = np.arange(1, N // 2 + 1)
+        b = np.where(2 * k == N, 1.0, 2.0)
+        c = np.where((np.arange(n) == 0) | (np.arange(n) == N), 1.0, 2.0)
+        weights = c / N * (1 - np.sum(b / (4 * k ** 2 - 1) * np.cos(np.outer(theta, 2 * k)), axis=1))
+        # cos(theta) is descending.
+        return np.cos(theta)[::-1].copy(), weights[::-1].copy()
+    elif scheme == "trapezoid":
+        assert n >= 2, f"Trapezoid rule requires at least two points: {n}"
+        nodes = np.linspace(-1.0, 1.0, n)
+        weights = np.full(n, 2.0 / (n - 1))
+        weights[[0, -1]] /= 2
+        return nodes, weights
+    else:
+        raise ValueError(f"Invalid quadrature scheme: {scheme}. Choices: {SCHEMES[:-1]}")
+
+
+def fixed_scheme(scheme: str, model: str) -> str:
+    """ scheme if its nodes and weights are fixed. "adaptive" depends on the integrand and is rejected for model """
+    if scheme not in SCHEMES[:-1]:
+        raise ValueError(f"{model} requires a quadrature with fixed nodes: {scheme}. Choices: {SCHEMES[:-1]}")
+    return scheme
+
+
+def full_precision(x: torch.Tensor) -> torch.Tensor:
+    """ Cast half precision values (e.g. from bfloat16 autocast) to float32 before they are accumulated """
+    return x.float() if x.dtype in (torch.bfloat16, torch.float16) else x
+
+
+def nodes_and_weights(scheme: str, n: int, a: float = -1.0, b: float = 1.0, device=None,
+                      dtype: torch.dtype = torch.float32) -> Tuple[torch.FloatTensor, torch.FloatTensor]:
+    """
+    Nodes and weights of a quadrature rule on [a,b] such that \\int_a^b f(x) dx ~ sum_i weights_i f(nodes_i).
+
+    Returned tensors are cached, i.e., they must not be modified in-place.
+
+    Parameters
+    ----------
+    scheme: "gauss_legendre", "clenshaw_curtis" or "trapezoid"
+    n: number of points
+    a: lower boundary
+    b: upper boundary
+    device: device of the tensors
+    dtype: dtype of the tensors
+
+    Returns
+    -------
+    nodes (n,), weights (n,)
+    """
+    device = torch.device(device) if device is not None else torch.device("cpu")
+    key = (scheme, n, float(a), float(b), device, dtype)
+    rule = _RULES.get(key)
+    if rule is None:
+        if scheme == "adaptive":
+            raise ValueError("Adaptive quadrature depends on the integrand and has no fixed nodes. "
+                             "Use integrate() or a fixed scheme.")
+        nodes, weights = reference_rule(scheme, n)
+        half = (b - a) / 2
+        nodes = torch.tensor(half * nodes + (a + b) / 2, device=device, dtype=dtype)
+        weights = torch.tensor(half * weights, device=device, dtype=dtype)
+        rule = _RULES[key] = (nodes, weights)
+    return rule
+
+
+def integrate(f: Callable[[torch.FloatTensor], torch.FloatTensor], a: float, b: float, scheme: str = "gauss_legendre",
+              n: int = 5, device=None, dtype: torch.dtype = torch.float32, tol: float = 1e-6,
+              max_depth: int = 10) -> torch.FloatTensor:
+    """
+    Integral of a batch of functions over [a,b].
+
+    Parameters
+    ----------
+    f: maps points of shape (p,) to evaluations of shape (..., p)
+    a: lower boundary
+    b: upper boundary
+    scheme: one of SCHEMES
+    n: number of points of the rule (per subinterval for "adaptive")
+    device: device of the points
+    dtype: dtype of the points
+    tol: "adaptive": absolute error tolerance over [a,b]
+    max_depth: "adaptive": maximum number of bisections of a subinterval
+
+    Returns
+    -------
+    integrals of shape (...)
+    """
+    if scheme != "adaptive":
+        nodes, weights = nodes_and_weights(scheme, n, a, b, device=device, dtype=dtype)
+        return torch.sum(weights * full_precision(f(nodes)), dim=-1)
+    # (1) Gauss-Legendre on [-1,1] applied to every subinterval.
+    nodes, weights = nodes_and_weights("gauss_legendre", n, device=device, dtype=dtype)
+    intervals = torch.tensor([[a, b]], device=device, dtype=dtype)
+    result = 0.0
+    for depth in range(max_depth + 1):
+        # (2) Each subinterval [l,r] and its halves [l,m], [m,r]: intervals x 3 x 2.
+        left, right = intervals[:, 0], intervals[:, 1]
+        mid = (left + right) / 2
+        parts = torch.stack((intervals, torch.stack((left, mid), dim=1), torch.stack((mid, right), dim=1)), dim=1)
+        half = (parts[..., 1] - parts[..., 0]) / 2
+        points = half.unsqueeze(-1) * nodes + ((parts[..., 0] + parts[..., 1]) / 2).unsqueeze(-1)
+        # (3) Evaluate all points of the current level at once: ..., intervals, 3, n.
+        values = full_precision(f(points.flatten()))
+        values = values.reshape(*values.shape[:-1], *points.shape)
+        estimates = torch.sum(values * (half.unsqueeze(-1) * weights), dim=-1)
+        coarse, fine = estimates[..., 0], estimates[..., 1] + estimates[..., 2]
+        # (4) Accept subintervals whose error is within their share of the tolerance over the whole batch.
+        error = (fine - coarse).abs().reshape(-1, len(intervals)).amax(dim=0)
+        done = error <= tol * (right - left) / (b - a)
+        if depth == max_depth:
+            done = torch.ones_like(done)
+        result = result + fine[..., done].sum(dim=-1)
+        if bool(done.all()):
+            break
+        intervals = parts[~done, 1:].reshape(-1, 2)
+    return result
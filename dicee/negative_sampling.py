@@ -0,0 +1,219 @@
+from typing import Tuple, Union
+import os
+import numpy as np
+import torch
+
+
+class SamplingGenerator:
+    """
+    torch.Generator of a sampler seeded with torch.initial_seed() of the process drawing the samples
+
+    Mini-batches constructed in a background thread (see BatchPrefetcher) do not draw from the global random number
+    generator, which the training loop uses concurrently, e.g. for dropout masks. Hence, runs with a fixed
+    --random_seed are reproducible. Each DataLoader worker process seeds its own generator with its worker seed.
+    """
+
+    def __init__(self):
+        self.generator = None
+        self.pid = None
+
+    def __call__(self) -> torch.Generator:
+        if self.generator is None or self.pid != os.getpid():
+            self.generator = torch.Generator().manual_seed(torch.initial_seed())
+            self.pid = os.getpid()
+        return self.generator
+
+    def __getstate__(self) -> dict:
+        # Processes receiving a copy, e.g. spawned workers, seed their own generators.
+        return {"generator": None, "pid": None}
+
+
+class TripleIndex:
+    """
+    Membership tests of integer indexed triples.
+
+    A triple (h, r, t) is hashed into the int64 h·|R|·|E| + r·|E| + t. Hashes of the indexed triples are sorted once
+    and a batch of triples is looked up via a single torch.searchsorted.
+    """
+
+    def __init__(self, triples: np.ndarray, num_entities: int, num_relations: int):
+        if num_entities * num_entities * num_relations >= np.iinfo(np.int64).max:
+            raise ValueError(f"Triples of {num_entities} entities and {num_relations} relations "
+                             f"cannot be hashed into int64")
+        self.num_entities = num_entities
+        self.num_relations = num_relations
+        self.hashes = torch.from_numpy(np.unique(self.hash(np.asarray(triples, dtype=np.int64))))
+
+    def hash(self, triples: Union[np.ndarray, torch.LongTensor]) -> Union[np.ndarray, torch.LongTensor]:
+        """ int64 hashes of n x 3 triples """
+        return (triples[:, 0] * self.num_relations + triples[:, 1]) * self.num_entities + triples[:, 2]
+
+    def contains(self, triples: torch.LongTensor) -> torch.BoolTensor:
+        """ Whether each of n x 3 triples is indexed """
+        if len(self.hashes) == 0:
+            return torch.zeros(len(triples), dtype=torch.bool)
+        hashes = self.hash(triples.long())
+        positions = torch.searchsorted(self.hashes, hashes).clamp_(max=len(self.hashes) - 1)
+        return self.hashes[positions] == hashes
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+
+class AliasTable:
+    """
+    Alias table of a discrete distribution (Vose's alias method).
+
+    The table is built once in O(n). Afterwards, drawing m samples requires two uniform draws and a single gather,
+    i.e., O(m) regardless of the number of outcomes n.
+    """
+
+    def __init__(self, weights: np.ndarray):
+        weights = np.asarray(weights, dtype=np.float64)
+        assert weights.ndim == 1 and len(weights) > 0 and weights.min() >= 0 and weights.sum() > 0
+        n = len(weights)
+        scaled = weights * n / weights.sum()
+        probabilities = np.ones(n, dtype=np.float64)
+        aliases = np.arange(n, dtype=np.int64)
+        small = np.flatnonzero(scaled < 1.0).tolist()
+        large = np.flatnonzero(scaled >= 1.0).tolist()
+        # Pair each outcome below the average with an outcome above the average that fills its column.
+        while small and large:
+            i, j = small.pop(), large.pop()
+            probabilities[i], aliases[i] = scaled[i], j
+            scaled[j] -= 1.0 - scaled[i]
+            if scaled[j] < 1.0:
+                small.append(j)
+            else:
+                large.append(j)
+        # Remaining columns are full up to rounding errors.
+        self.probabilities = torch.from_numpy(probabilities)
+        self.aliases = torch.from_numpy(aliases)
+
+    def sample(self, num_samples: int, generator: torch.Generator = None) -> torch.LongTensor:
+        columns = torch.randint(0, len(self.aliases), (num_samples,), generator=generator)
+        return torch.where(torch.rand(num_samples, dtype=torch.float64, generator=generator)
+                           < self.probabilities[columns], columns, self.aliases[columns])
+
+    def __len__(self) -> int:
+        return len(self.aliases)
+
+
+def head_corruption_probabilities(triples: np.ndarray, num_relations: int) -> torch.FloatTensor:
+    """
+    Probability of corrupting the head entity of a triple per relation (Bernoulli trick of Wang et al. 2014, TransH)
+
+    tph/(tph + hpt), where tph is the average number of tails per head and hpt is the average number of heads per tail.
+    Heads of 1-to-N relations are corrupted more often than their tails and vice versa for N-to-1 relations.
+    """
+    triples = np.asarray(triples, dtype=np.int64)
+    num_triples = np.bincount(triples[:, 1], minlength=num_relations).astype(np.float64)
+    # Number of unique (head, relation) and (relation, tail) pairs per relation.
+    num_heads = np.bincount(np.unique(triples[:, [0, 1]], axis=0)[:, 1], minlength=num_relations)
+    num_tails = np.bincount(np.unique(triples[:, [1, 2]], axis=0)[:, 0], minlength=num_relations)
+    tph = np.divide(num_triples, num_heads, out=np.ones(num_relations), where=num_heads > 0)
+    hpt = np.divide(num_triples, num_tails, out=np.ones(num_relations), where=num_tails > 0)
+    return torch.from_numpy(tph / (tph + hpt)).float()
+
+
+class NegativeSampler:
+    """
+    Batched negative sampler for NegSample training.
+
+    Each positive triple is corrupted neg_ratio times. Per negative, the head, the tail or the relation is replaced
+    according to corruption_ratios. With bernoulli=True, heads and tails are chosen per relation,
+    see head_corruption_probabilities(). Entities are drawn uniformly or, with entity_sampling="unigram",
+    proportional to degree^unigram_alpha via an alias table.
+    With filtered=True, negatives being training triples are rejected via a TripleIndex
+    and resampled in bulk for at most max_resampling_rounds rounds.
+    Samples are drawn from a SamplingGenerator instead of the global random number generator.
+
+    Parameters
+    ----------
+    train_set: n x 3 integer indexed training triples
+    num_entities: number of entities
+    num_relations: number of relations
+    neg_ratio: number of negatives per positive triple
+    corruption_ratios: probabilities of corrupting (heads, tails, relations). Defaults to (0.5, 0.5, 0.0)
+    filtered: reject negatives that are training triples
+    max_resampling_rounds: maximum number of rounds to resample rejected negatives
+    entity_sampling: "uniform" or "unigram"
+    unigram_alpha: exponent of degrees with entity_sampling="unigram". 0 is uniform over seen entities
+    bernoulli: choose heads or tails of entity corruptions per relation instead of corruption_ratios
+    """
+    # Columns of heads, tails and relations in a triple.
+    COLUMNS = (0, 2, 1)
+
+    def __init__(self, train_set: np.ndarray, num_entities: int, num_relations: int, neg_ratio: int,
+                 corruption_ratios: Tuple[float, float, float] = None, filtered: bool = False,
+                 max_resampling_rounds: int = 10, entity_sampling: str = "uniform", unigram_alpha: float = 0.75,
+                 bernoulli: bool = False):
+        assert neg_ratio >= 0
+        self.num_entities = int(num_entities)
+        self.num_relations = int(num_relations)
+        self.neg_ratio = int(neg_ratio)
+        corruption_ratios = (0.5, 0.5, 0.0) if corruption_ratios is None else tuple(corruption_ratios)
+        if len(corruption_ratios) != 3 or min(corruption_ratios) < 0 or sum(corruption_ratios) <= 0:
+            raise ValueError(f"corruption_ratios must be three non-negative probabilities of corrupting heads, "
+                             f"tails and relations. Currently:{corruption_ratios}")
+        self.corruption_ratios = torch.tensor(corruption_ratios, dtype=torch.float64) / sum(corruption_ratios)
+        self.triple_index = TripleIndex(train_set, self.num_entities, self.num_relations) if filtered else None
+        self.max_resampling_rounds = max_resampling_rounds
+        if entity_sampling == "uniform":
+            self.entity_alias_table = None
+        elif entity_sampling == "unigram":
+            degrees = np.bincount(np.asarray(train_set[:, [0, 2]], dtype=np.int64).flatten(),
+                                  minlength=self.num_entities)
+            self.entity_alias_table = AliasTable(np.power(degrees, unigram_alpha, where=degrees > 0,
+                                                          out=np.zeros(len(degrees))))
+        else:
+            raise ValueError(f"Invalid entity_sampling:{entity_sampling}. Choices: uniform, unigram")
+        self.head_probabilities = head_corruption_probabilities(train_set, self.num_relations) if bernoulli else None
+        self.generator = SamplingGenerator()
+
+    def corrupted_columns(self, triples: torch.LongTensor) -> torch.LongTensor:
+        """ Column (0: head, 1: relation, 2: tail) to be corrupted for each of n x 3 triples """
+        corruption = torch.multinomial(self.corruption_ratios, len(triples), replacement=True,
+                                       generator=self.generator())
+        if self.head_probabilities is not None:
+            # Heads or tails of entity corruptions are chosen per relation.
+            heads = torch.rand(len(triples), generator=self.generator()) < self.head_probabilities[triples[:, 1]]
+            corruption = torch.where(corruption == 2, corruption, torch.where(heads, 0, 1))
+        return torch.tensor(self.COLUMNS)[corruption]
+
+    def sample_entities(self, num_samples: int) -> torch.LongTensor:
+        """ Entities drawn from the entity distribution """
+        if self.entity_alias_table is not None:
+            return self.entity_alias_table.sample(num_samples, generator=self.generator())
+        return torch.randint(0, self.num_entities, (num_samples,), generator=self.generator())
+
+    def sample(self, triples: torch.LongTensor, columns: torch.LongTensor) -> torch.LongTensor:
+        """ Replacements of the columns of triples, i.e., sampled entities or uniformly sampled relations """
+        entities = self.sample_entities(len(columns))
+        relations = torch.randint(0, self.num_relations, (len(columns),), generator=self.generator())
+        return torch.where(columns == 1, relations, entities)
+
+    def corrupt(self, triples: torch.LongTensor) -> torch.LongTensor:
+        """
+        Corrupt a batch of triples
+
+        Parameters
+        ----------
+        triples: batch x 3 positive triples
+
+        Returns
+        -------
+        (neg_ratio · batch) x 3 negative triples, i.e., the i.th negative of the j.th triple is at i · batch + j
+        """
+        negatives = triples.long().repeat(self.neg_ratio, 1)
+        columns = self.corrupted_columns(negatives)
+        rows = torch.arange(len(negatives))
+        negatives[rows, columns] = self.sample(negatives, columns)
+        if self.triple_index is not None:
+            for _ in range(self.max_resampling_rounds):
+                # Resample all negatives being training triples at once.
+                rejected = torch.nonzero(self.triple_index.contains(negatives)).flatten()
+                if len(rejected) == 0:
+                    break
+                negatives[rejected, columns[rejected]] = self.sample(negatives[rejected], columns[rejected])
+        return negatives
@@ -0,0 +1,92 @@
+import math
+import torch
+
+
+class LazyAdam(torch.optim.Optimizer):
+    """
+    Adam with row-wise lazy updates of sparse gradients (--sparse_embeddings).
+
+    A sparse gradient of an embedding table, e.g. torch.nn.Embedding(..., sparse=True), only updates the moment
+    estimates and the rows of the entities occurring in a mini-batch. Hence, the cost of a step is proportional to the
+    number of rows touched by the batch instead of the number of rows of the table.
+    Dense gradients, e.g. of relation specific parameters or of entity tables used via .weight in KvsAll,
+    are updated as in torch.optim.Adam.
+    The bias corrections use the number of steps of a parameter (as in LazyAdam of TensorFlow Addons).
+
+    Parameters
+    ----------
+    params: parameters or parameter groups
+    lr: learning rate
+    betas: coefficients of the running averages of gradients and their squares
+    eps: term added to the denominator
+    weight_decay: L2 penalty of touched rows
+    decoupled_weight_decay: decay parameters as in AdamW instead of adding an L2 penalty to the gradient
+    """
+
+    def __init__(self, params, lr: float = 1e-3, betas=(0.9, 0.999), eps: float = 1e-8, weight_decay: float = 0.0,
+                 decoupled_weight_decay: bool = False):
+        if lr < 0.0 or eps < 0.0 or weight_decay < 0.0 or not (0.0 <= betas[0] < 1.0 and 0.0 <= betas[1] < 1.0):
+            raise ValueError(f"Invalid hyperparameters of LazyAdam: lr={lr}, betas={betas}, eps={eps}, "
+                             f"weight_decay={weight_decay}")
+        super().__init__(params, dict(lr=lr, betas=betas, eps=eps, weight_decay=weight_decay,
+                                      decoupled_weight_decay=decoupled_weight_decay))
+
+    @torch.no_grad()
+    def step(self, closure=None):
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+        for group in self.param_groups:
+            beta1, beta2 = group["betas"]
+            for param in group["params"]:
+                if param.grad is None:
+                    continue
+                state = self.state[param]
+                if len(state) == 0:
+                    state["step"] = 0
+                    state["exp_avg"] = torch.zeros_like(param, memory_format=torch.preserve_format)
+                    state["exp_avg_sq"] = torch.zeros_like(param, memory_format=torch.preserve_format)
+                state["step"] += 1
+                step_size = group["lr"] / (1 - beta1 ** state["step"])
+                bias_correction2_sqrt = math.sqrt(1 - beta2 ** state["step"])
+                if param.grad.is_sparse:
+                    self._sparse_update(param, param.grad.coalesce(), state, group, step_size, bias_correction2_sqrt)
+                else:
+                    self._dense_update(param, param.grad, state, group, step_size, bias_correction2_sqrt)
+        return loss
+
+    @staticmethod
+    def _dense_update(param, grad, state, group, step_size, bias_correction2_sqrt):
+        beta1, beta2 = group["betas"]
+        if group["weight_decay"]:
+            if group["decoupled_weight_decay"]:
+                param.mul_(1 - group["lr"] * group["weight_decay"])
+            else:
+                grad = grad.add(param, alpha=group["weight_decay"])
+        exp_avg, exp_avg_sq = state["exp_avg"], state["exp_avg_sq"]
+        exp_avg.mul_(beta1).add_(grad, alpha=1 - beta1)
+        exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+        denom = (exp_avg_sq.sqrt() / bias_correction2_sqrt).add_(group["eps"])
+        param.addcdiv_(exp_avg, denom, value=-step_size)
+
+    @staticmethod
+    def _sparse_update(param, grad, state, group, step_size, bias_correction2_sqrt):
+        beta1, beta2 = group["betas"]
+        # (1) Rows occurring in the mini-batch. Rows of a coalesced gradient are unique.
+        rows, values = grad._indices()[0], grad._values()
+        if len(rows) == 0:
+            return
+        if group["weight_decay"]:
+            if group["decoupled_weight_decay"]:
+                param[rows] = param[rows] * (1 - group["lr"] * group["weight_decay"])
+            else:
+                values = values.add(param[rows], alpha=group["weight_decay"])
+        # (2) Moment estimates of the rows.
+        exp_avg = state["exp_avg"][rows].mul_(beta1).add_(values, alpha=1 - beta1)
+        exp_avg_sq = state["exp_avg_sq"][rows].mul_(beta2).addcmul_(values, values, value=1 - beta2)
+        state["exp_avg"][rows] = exp_avg
+        state["exp_avg_sq"][rows] = exp_avg_sq
+        # (3) Update the rows.
+        denom = (exp_avg_sq.sqrt_() / bias_correction2_sqrt).add_(group["eps"])
+        param.index_add_(0, rows, exp_avg.div_(denom), alpha=-step_size)
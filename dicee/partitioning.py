@@ -0,0 +1,148 @@
+import os
+from typing import Dict, List, Tuple
+import numpy as np
+import torch
+
+from dicee.static_funcs_training import initialize_embedding_rows
+
+
+def partition_sizes(num_entities: int, num_partitions: int) -> List[int]:
+    """ Number of entities per partition. The entity e belongs to the partition e % num_partitions """
+    return [len(range(p, num_entities, num_partitions)) for p in range(num_partitions)]
+
+
+def bucket_path(path: str, i: int, j: int) -> str:
+    return os.path.join(path, f'bucket_{i}_{j}.bin')
+
+
+def bucket_triples(triples: np.ndarray, num_partitions: int, path: str,
+                   chunk_size: int = 10_000_000) -> Dict[Tuple[int, int], int]:
+    """
+    Write triples into buckets given by the partitions of their heads and tails (PyTorch-BigGraph)
+
+    The entity e is the (e // num_partitions).th entity of the partition e % num_partitions.
+    The bucket (i, j) stores (head, relation, tail) triples with heads of the partition i and tails of the partition j
+    as int64 rows of local indices in path/bucket_i_j.bin. Triples are processed in chunks, i.e.,
+    memory-mapped triples are not loaded at once.
+
+    Parameters
+    ----------
+    triples: n x 3 integer indexed triples
+    num_partitions: number of entity partitions
+    path: folder of the buckets
+    chunk_size: number of triples processed at once
+
+    Returns
+    -------
+    Number of triples of non-empty buckets
+    """
+    os.makedirs(path, exist_ok=True)
+    files = dict()
+    counts = dict()
+    try:
+        for start in range(0, len(triples), chunk_size):
+            chunk = np.asarray(triples[start:start + chunk_size], dtype=np.int64)
+            # (1) Group the triples of the chunk by their buckets.
+            buckets = (chunk[:, 0] % num_partitions) * num_partitions + chunk[:, 2] % num_partitions
+            order = np.argsort(buckets, kind='stable')
+            chunk, buckets = chunk[order], buckets[order]
+            local = np.stack((chunk[:, 0] // num_partitions, chunk[:, 1], chunk[:, 2] // num_partitions), axis=1)
+            # (2) Append each group to its bucket.
+            ids, starts = np.unique(buckets, return_index=True)
+            for bucket, begin, end in zip(ids, starts, np.append(starts[1:], len(buckets))):
+                key = divmod(int(bucket), num_partitions)
+                if key not in files:
+                    files[key] = open(bucket_path(path, *key), 'wb')
+                files[key].write(local[begin:end].tobytes())
+                counts[key] = counts.get(key, 0) + int(end - begin)
+    finally:
+        for f in files.values():
+            f.close()
+    return counts
+
+
+def remove_buckets(path: str) -> None:
+    """ Delete the buckets written by bucket_triples() """
+    for name in os.listdir(path):
+        if name.startswith('bucket_') and name.endswith('.bin'):
+            os.remove(os.path.join(path, name))
+
+
+def load_bucket(path: str, i: int, j: int) -> np.memmap:
+    """ Memory-mapped triples of the bucket (i, j) written by bucket_triples() """
+    return np.memmap(bucket_path(path, i, j), dtype=np.int64, mode='r').reshape(-1, 3)
+
+
+class PartitionedEmbeddingStore:
+    """
+    Entity embeddings and their row-wise optimizer states partitioned into memory-mapped .npy files
+
+    The rows of the partition p are stored in path/entity_embeddings_p.npy and a row-wise optimizer state,
+    e.g. exp_avg of Adam, in path/{state}_p.npy. Scalar optimizer states, e.g. the number of steps, are kept
+    in memory. Only the partitions of the current bucket are loaded via load() and written back via save().
+    The full table is never allocated, i.e., the i.th row of the partition p is the embedding of the entity
+    i * num_partitions + p.
+
+    Parameters
+    ----------
+    path: folder of the partitions
+    num_entities: number of entities
+    embedding_dim: number of columns of the embeddings
+    num_partitions: number of partitions
+    """
+
+    def __init__(self, path: str, num_entities: int, embedding_dim: int, num_partitions: int):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.num_entities = num_entities
+        self.embedding_dim = embedding_dim
+        self.num_partitions = num_partitions
+        self.sizes = partition_sizes(num_entities, num_partitions)
+        self.row_states = set()
+        self.scalar_states = [dict() for _ in range(num_partitions)]
+
+    def file_path(self, name: str, p: int) -> str:
+        return os.path.join(self.path, f'{name}_{p}.npy')
+
+    def initialize(self, param_init) -> None:
+        """ Write partitions initialized as param_init of BaseKGE initializes the full table """
+        for p in range(self.num_partitions):
+            rows = torch.empty(self.sizes[p], self.embedding_dim)
+            self._write('entity_embeddings', p, initialize_embedding_rows(rows, self.num_entities, param_init))
+
+    def _write(self, name: str, p: int, tensor: torch.Tensor) -> None:
+        array = tensor.detach().cpu().numpy()
+        storage = None
+        if os.path.isfile(self.file_path(name, p)):
+            storage = np.load(self.file_path(name, p), mmap_mode='r+')
+        if storage is None or storage.shape != array.shape or storage.dtype != array.dtype:
+            storage = np.lib.format.open_memmap(self.file_path(name, p), mode='w+', dtype=array.dtype,
+                                                shape=array.shape)
+        storage[:] = array
+        storage.flush()
+        del storage
+
+    def _read(self, name: str, p: int) -> torch.Tensor:
+        return torch.from_numpy(np.array(np.load(self.file_path(name, p), mmap_mode='r')))
+
+    def load(self, p: int) -> Tuple[torch.Tensor, Dict[str, torch.Tensor], Dict]:
+        """ Embeddings, row-wise and scalar optimizer states of the partition p """
+        row_states = {name: self._read(name, p) for name in self.row_states
+                      if os.path.isfile(self.file_path(name, p))}
+        return self._read('entity_embeddings', p), row_states, dict(self.scalar_states[p])
+
+    def save(self, p: int, weight: torch.Tensor, row_states: Dict[str, torch.Tensor], scalar_states: Dict) -> None:
+        self._write('entity_embeddings', p, weight)
+        for name, state in row_states.items():
+            self._write(name, p, state)
+            self.row_states.add(name)
+        self.scalar_states[p] = dict(scalar_states)
+
+    def remove_optimizer_states(self) -> None:
+        """ Delete the row-wise optimizer states, i.e., only the entity embeddings are kept """
+        for name in self.row_states:
+            for p in range(self.num_partitions):
+                if os.path.isfile(self.file_path(name, p)):
+                    os.remove(self.file_path(name, p))
+        self.row_states = set()
+        self.scalar_states = [dict() for _ in range(self.num_partitions)]
@@ -1,3 +1,6 @@
 from .preprocess import PreprocessKG # noqa
 from .save_load_disk import LoadSaveToDisk # noqa
 from .read_from_disk import ReadFromDisk # noqa
+from .filter_index import FilterIndex # noqa
+from .constraint_index import RelationConstraints # noqa
+from .string_index import StringIndex # noqa
@@ -0,0 +1,125 @@
+import os
+from typing import Tuple, Union, List
+import numpy as np
+import torch
+
+
+class RelationConstraints:
+    """
+    Domains and ranges of relations, i.e., entities occurring as heads (domain) and tails (range) of each relation.
+
+    The allowed entities of relation r are entities[offsets[r]:offsets[r+1]] (CSR) for each side.
+    Entities not occurring in the triples the constraints are built from are never constrained.
+    The memory is O(|unique (relation, entity) pairs|) instead of O(|R|·|E|) of complement lists.
+    """
+    SIDES = ("domain", "range")
+
+    def __init__(self, domain_offsets: np.ndarray, domain_entities: np.ndarray, range_offsets: np.ndarray,
+                 range_entities: np.ndarray, seen_entities: np.ndarray):
+        assert len(domain_offsets) == len(range_offsets)
+        self.sides = {"domain": (domain_offsets, domain_entities), "range": (range_offsets, range_entities)}
+        self.seen_entities = seen_entities
+        self.num_relations = len(domain_offsets) - 1
+
+    @staticmethod
+    def _allowed_per_relation(relations: np.ndarray, entities: np.ndarray, num_relations: int,
+                              num_entities: int) -> Tuple[np.ndarray, np.ndarray]:
+        # (1) Unique (relation, entity) pairs sorted by relations and entities.
+        pairs = np.unique(relations.astype(np.int64) * num_entities + entities.astype(np.int64))
+        # (2) Offsets of relations.
+        offsets = np.searchsorted(pairs // num_entities, np.arange(num_relations + 1)).astype(np.int64)
+        dtype = np.int32 if num_entities <= np.iinfo(np.int32).max else np.int64
+        return offsets, (pairs % num_entities).astype(dtype)
+
+    @classmethod
+    def from_triples(cls, triples: np.ndarray, num_entities: int = None, num_relations: int = None):
+        """
+        Extract domains and ranges of relations from integer indexed triples via np.unique
+
+        Parameters
+        ----------
+        triples: n x 3 integer indexed triples
+        num_entities: number of entities. Defaults to the maximum entity index + 1
+        num_relations: number of relations. Defaults to the maximum relation index + 1
+
+        Returns
+        -------
+        RelationConstraints
+        """
+        assert isinstance(triples, np.ndarray)
+        assert triples.shape[1] == 3
+        heads, relations, tails = triples[:, 0], triples[:, 1], triples[:, 2]
+        if num_entities is None:
+            num_entities = int(max(heads.max(), tails.max())) + 1 if len(triples) > 0 else 0
+        if num_relations is None:
+            num_relations = int(relations.max()) + 1 if len(triples) > 0 else 0
+        seen_entities = np.zeros(num_entities, dtype=bool)
+        seen_entities[heads] = True
+        seen_entities[tails] = True
+        domain_offsets, domain_entities = cls._allowed_per_relation(relations, heads, num_relations, num_entities)
+        range_offsets, range_entities = cls._allowed_per_relation(relations, tails, num_relations, num_entities)
+        return cls(domain_offsets, domain_entities, range_offsets, range_entities, seen_entities)
+
+    def save(self, path: str) -> None:
+        """ Store the constraints into path_{domain,range}_{offsets,entities}.npy and path_seen_entities.npy """
+        for side, (offsets, entities) in self.sides.items():
+            np.save(path + f'_{side}_offsets.npy', offsets)
+            np.save(path + f'_{side}_entities.npy', entities)
+        np.save(path + '_seen_entities.npy', self.seen_entities)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = 'r'):
+        """ Load constraints stored via save(). By default, the arrays are memory-mapped (read-only) """
+        arrays = [np.load(path + f'_{side}_{name}.npy', mmap_mode=mmap_mode)
+                  for side in cls.SIDES for name in ("offsets", "entities")]
+        return cls(*arrays, seen_entities=np.load(path + '_seen_entities.npy', mmap_mode=mmap_mode))
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(path + '_seen_entities.npy')
+
+    def allowed(self, relation: int, side: str = "range") -> np.ndarray:
+        """ Entities occurring in the domain or range of a relation """
+        offsets, entities = self.sides[side]
+        return np.asarray(entities[offsets[relation]:offsets[relation + 1]], dtype=np.int64)
+
+    def mask(self, scores: torch.FloatTensor, relations: Union[np.ndarray, torch.LongTensor, List[int]],
+             side: str = "range", keep: torch.LongTensor = None, value: float = -np.inf) -> torch.FloatTensor:
+        """
+        Set scores of entities outside of the domain or range of relations to value in-place.
+
+        Parameters
+        ----------
+        scores: batch x |E| scores of entities
+        relations: batch relations
+        side: "domain" to constrain heads, "range" to constrain tails
+        keep: batch entity indices that are never masked, e.g., the targets in the evaluation
+        value: score of entities violating the constraints
+
+        Returns
+        -------
+        scores
+        """
+        offsets, entities = self.sides[side]
+        relations = np.asarray(relations.cpu() if isinstance(relations, torch.Tensor) else relations, dtype=np.int64)
+        # (1) Relations without constraints, e.g. unseen relations, allow all entities.
+        known = (relations >= 0) & (relations < self.num_relations)
+        relations = np.where(known, relations, 0)
+        starts = np.asarray(offsets[relations])
+        lengths = np.where(known, np.asarray(offsets[relations + 1]) - starts, 0)
+        crow_indices = np.zeros(len(relations) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=crow_indices[1:])
+        within = np.arange(crow_indices[-1], dtype=np.int64) - np.repeat(crow_indices[:-1], lengths)
+        cols = torch.from_numpy(np.asarray(entities[np.repeat(starts, lengths) + within], dtype=np.int64))
+        rows = torch.repeat_interleave(torch.arange(len(relations)), torch.from_numpy(lengths))
+        # (2) Allowed entities via a single scatter.
+        allowed = torch.zeros(scores.shape, dtype=torch.bool, device=scores.device)
+        allowed[rows.to(scores.device), cols.to(scores.device)] = True
+        allowed[torch.from_numpy(~known).to(scores.device)] = True
+        seen = torch.zeros(scores.shape[1], dtype=torch.bool)
+        num_seen = min(len(self.seen_entities), scores.shape[1])
+        seen[:num_seen] = torch.from_numpy(np.array(self.seen_entities[:num_seen]))
+        allowed |= ~seen.to(scores.device)
+        if keep is not None:
+            allowed[torch.arange(len(scores), device=scores.device), keep.to(scores.device)] = True
+        return scores.masked_fill_(~allowed, value)
@@ -0,0 +1,131 @@
+import os
+from typing import Tuple
+import numpy as np
+
+
+class FilterIndex:
+    """
+    Compact replacement of the er_vocab, re_vocab and ee_vocab dictionaries of integer indexed triples.
+
+    Two key columns of the triples are combined into sorted int64 keys (key_0 * key_base + key_1).
+    The values of the i.th key are values[offsets[i]:offsets[i+1]] (CSR), e.g.,
+    er_vocab[(h, r)] := all tails t of (h, r, t).
+
+    The arrays are stored as .npy files and memory-mapped when they are loaded.
+    """
+
+    def __init__(self, keys: np.ndarray, offsets: np.ndarray, values: np.ndarray, key_base: int):
+        assert len(keys) + 1 == len(offsets)
+        self.keys = keys
+        self.offsets = offsets
+        self.values = values
+        self.key_base = int(key_base)
+
+    @classmethod
+    def from_triples(cls, triples: np.ndarray, key_columns: Tuple[int, int], value_column: int,
+                     key_base: int = None):
+        """
+        Build the index with a single lexsort, e.g., er_vocab = FilterIndex.from_triples(triples, (0, 1), 2)
+
+        Parameters
+        ----------
+        triples: n x 3 integer indexed triples
+        key_columns: columns forming the keys
+        value_column: column of the values
+        key_base: upper bound of the second key column. Defaults to its maximum + 1
+
+        Returns
+        -------
+        FilterIndex
+        """
+        assert isinstance(triples, np.ndarray) and triples.ndim == 2 and triples.shape[1] == 3
+        first, second = triples[:, key_columns[0]].astype(np.int64), triples[:, key_columns[1]].astype(np.int64)
+        values = triples[:, value_column]
+        if key_base is None:
+            key_base = int(second.max()) + 1 if len(second) > 0 else 1
+        # (1) Sort triples by keys and values.
+        order = np.lexsort((values, second, first))
+        keys = first[order] * key_base + second[order]
+        # (2) Positions where a new key starts.
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) > 0 else np.zeros(0, dtype=np.int64)
+        offsets = np.append(starts, len(keys)).astype(np.int64)
+        dtype = np.int32 if len(values) == 0 or values.max() < np.iinfo(np.int32).max else np.int64
+        return cls(keys=keys[starts], offsets=offsets, values=values[order].astype(dtype), key_base=key_base)
+
+    def save(self, path: str) -> None:
+        """ Store the index into path_keys.npy, path_offsets.npy and path_values.npy """
+        np.save(path + '_keys.npy', self.keys)
+        np.save(path + '_offsets.npy', self.offsets)
+        np.save(path + '_values.npy', self.values)
+        np.save(path + '_key_base.npy', np.array(self.key_base, dtype=np.int64))
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = 'r'):
+        """ Load an index stored via save(). By default, the arrays are memory-mapped (read-only) """
+        return cls(keys=np.load(path + '_keys.npy', mmap_mode=mmap_mode),
+                   offsets=np.load(path + '_offsets.npy', mmap_mode=mmap_mode),
+                   values=np.load(path + '_values.npy', mmap_mode=mmap_mode),
+                   key_base=int(np.load(path + '_key_base.npy')))
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(path + '_keys.npy')
+
+    def key_pairs(self) -> np.ndarray:
+        """ Keys as n x 2 int64 array of the two key columns """
+        keys = np.asarray(self.keys, dtype=np.int64)
+        return np.stack((keys // self.key_base, keys % self.key_base), axis=1)
+
+    def values_at(self, position: int) -> np.ndarray:
+        """ Values of the position.th key """
+        return self.values[self.offsets[position]:self.offsets[position + 1]]
+
+    def _positions(self, first, second) -> Tuple[np.ndarray, np.ndarray]:
+        """ Positions of keys and whether the keys exist """
+        first, second = np.asarray(first, dtype=np.int64), np.asarray(second, dtype=np.int64)
+        query = first * self.key_base + second
+        positions = np.searchsorted(self.keys, query)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == query[found]
+        # Keys of the second column out of the range of the index do not exist.
+        found &= (second >= 0) & (second < self.key_base)
+        return positions, found
+
+    def __getitem__(self, key: Tuple[int, int]) -> np.ndarray:
+        """ Values of a key as int64 array. Unknown keys have no values, i.e. the same lookups as defaultdict(list) """
+        position, found = self._positions([key[0]], [key[1]])
+        if not found[0]:
+            return np.zeros(0, dtype=np.int64)
+        return np.asarray(self.values[self.offsets[position[0]]:self.offsets[position[0] + 1]], dtype=np.int64)
+
+    def __contains__(self, key: Tuple[int, int]) -> bool:
+        return bool(self._positions([key[0]], [key[1]])[1][0])
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def csr(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Values of a batch of keys as CSR, i.e., the values of keys[i] are col_indices[crow_indices[i]:crow_indices[i+1]]
+
+        Parameters
+        ----------
+        keys: batch x 2 keys
+
+        Returns
+        -------
+        crow_indices (batch + 1,) and col_indices (nnz,) as int64 arrays
+        """
+        keys = np.asarray(keys)
+        positions, found = self._positions(keys[:, 0], keys[:, 1])
+        positions = np.where(found, positions, 0)
+        # (1) Range of values of each key. Unknown keys have an empty range.
+        starts = np.asarray(self.offsets[positions])
+        lengths = np.where(found, np.asarray(self.offsets[positions + 1]) - starts, 0) if len(self.keys) > 0 \
+            else np.zeros(len(keys), dtype=np.int64)
+        crow_indices = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=crow_indices[1:])
+        # (2) Gather all ranges at once: start of the range of the row + position within the row.
+        within = np.arange(crow_indices[-1], dtype=np.int64) - np.repeat(crow_indices[:-1], lengths)
+        col_indices = np.asarray(self.values[np.repeat(starts, lengths) + within], dtype=np.int64)
+        return crow_indices, col_indices
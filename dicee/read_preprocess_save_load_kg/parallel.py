@@ -0,0 +1,245 @@
+import concurrent.futures
+import itertools
+import io
+import os
+import threading
+import time
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from .streaming import (COLUMNS, NpyTripleWriter, StreamingIndexer, iter_raw_triples, parse_n_triples, is_rdf,
+                        index_chunk, index_values)
+from .util import timeit
+
+COMPRESSED_SUFFIXES = ('.gz', '.bz2', '.zip', '.xz', '.zst', '.tar')
+
+
+def shards_of_file(data_path: str, num_shards: int) -> List[Tuple[int, int]]:
+    """
+    Split a file into at most num_shards contiguous shards
+
+    Text files are split into byte ranges [start, end). A line belongs to the shard in which it starts.
+    Parquet files are split into ranges of row groups.
+    """
+    if data_path.endswith('.parquet'):
+        # Lazy import
+        import pyarrow.parquet as pq
+        size = pq.ParquetFile(data_path).num_row_groups
+    else:
+        size = os.path.getsize(data_path)
+    num_shards = max(1, min(num_shards, size))
+    bounds = [size * i // num_shards for i in range(num_shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def iter_lines_of_shard(data_path: str, start: int, end: int, chunk_size: int) -> Iterator[List[bytes]]:
+    """ Lists of at most chunk_size lines starting within the byte range [start, end) """
+    with open(data_path, 'rb') as f:
+        if start > 0:
+            # Skip the line started in the previous shard. A line starting at start is preceded by a newline.
+            f.seek(start - 1)
+            f.readline()
+        position = f.tell()
+        while position < end:
+            lines = []
+            for line in itertools.islice(f, chunk_size):
+                lines.append(line)
+                position += len(line)
+                if position >= end:
+                    break
+            if len(lines) == 0:
+                break
+            yield lines
+
+
+def iter_raw_triples_of_shard(data_path: str, shard: Tuple[int, int], chunk_size: int) -> Iterator[pd.DataFrame]:
+    """ iter_raw_triples() restricted to a shard created by shards_of_file() """
+    start, end = shard
+    if data_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        if start == end:
+            return
+        for batch in pq.ParquetFile(data_path).iter_batches(batch_size=chunk_size, row_groups=range(start, end)):
+            df = batch.to_pandas().iloc[:, :3].astype(str)
+            df.columns = COLUMNS
+            yield df
+        return
+    for lines in iter_lines_of_shard(data_path, start, end, chunk_size):
+        if data_path.endswith('.nt'):
+            yield parse_n_triples([line.decode('utf-8') for line in lines])
+        else:
+            text = b''.join(lines)
+            if len(text.strip()) == 0:
+                continue
+            yield pd.read_csv(io.BytesIO(text), sep=r"\s+", header=None, usecols=[0, 1, 2], names=COLUMNS,
+                              dtype=str)
+
+
+def index_shard(data_path: str, shard: Tuple[int, int], shard_path: str, chunk_size: int, remove_literals: bool,
+                add_reciprocal: bool, sample_triples_ratio: float = None,
+                seed: int = 0) -> Tuple[List[str], List[str], int]:
+    """
+    Parse, filter and index a shard with shard-local indices written into shard_path (executed in a worker).
+
+    Returns
+    -------
+    Entities and relations ordered by their local indices and the number of indexed triples
+    """
+    entity_to_idx, relation_to_idx = dict(), dict()
+    rng = np.random.default_rng(seed)
+    writer = NpyTripleWriter(shard_path)
+    for df in iter_raw_triples_of_shard(data_path, shard, chunk_size):
+        if sample_triples_ratio:
+            df = df[rng.random(len(df)) < sample_triples_ratio]
+        writer.write(index_chunk(df, remove_literals, add_reciprocal, entity_to_idx, relation_to_idx))
+    return list(entity_to_idx), list(relation_to_idx), writer.close()
+
+
+def remap_shard(shard_path: str, file_path: str, offset: int, entity_map: np.ndarray, relation_map: np.ndarray,
+                chunk_size: int) -> None:
+    """ Write the globally indexed triples of a shard into rows [offset, offset + n) of file_path (executed in a worker)
+    """
+    local = np.load(shard_path, mmap_mode='r')
+    merged = np.load(file_path, mmap_mode='r+')
+    for i in range(0, len(local), chunk_size):
+        chunk = np.asarray(local[i:i + chunk_size])
+        merged[offset + i:offset + i + len(chunk)] = np.stack((entity_map[chunk[:, 0]], relation_map[chunk[:, 1]],
+                                                               entity_map[chunk[:, 2]]), axis=1)
+    merged.flush()
+    del local, merged
+    os.remove(shard_path)
+
+
+class ParallelStreamingIndexer(StreamingIndexer):
+    """
+    Read and index splits with num_workers processes (--backend streaming --num_preprocess_workers N).
+
+    (1) A file is split into N contiguous shards that are parsed, filtered and indexed with shard-local indices.
+    (2) The local vocabularies are merged in the order of the shards, i.e., the indices are deterministic for N.
+    (3) The shards are remapped to the global indices in parallel and written into the memory-mapped {split}_set.npy.
+    """
+
+    def __init__(self, kg, chunk_size: int = None, num_workers: int = None):
+        super().__init__(kg, chunk_size)
+        self.num_workers = num_workers or os.cpu_count()
+
+    @timeit
+    def index_split(self, data_path: str, split: str, read_only_few: int = None,
+                    sample_triples_ratio: float = None) -> Optional[np.memmap]:
+        if read_only_few is not None or data_path.endswith(COMPRESSED_SUFFIXES):
+            # The first few triples and compressed files can not be sharded.
+            return super().index_split(data_path, split, read_only_few, sample_triples_ratio)
+        print(f'*** Streaming {data_path} with {self.num_workers} workers in chunks of {self.chunk_size} triples ***')
+        timings = self.kg.preprocessing_timings
+        file_path = self.kg.path_for_serialization + f'/{split}_set.npy'
+        # (1) Type heuristic on the head of the file: If KG is an RDF KG, remove all triples with literal values.
+        head = next(iter_raw_triples(data_path, chunk_size=5), None)
+        remove_literals = head is not None and is_rdf(head)
+        shards = shards_of_file(data_path, self.num_workers)
+        shard_paths = [self.kg.path_for_serialization + f'/{split}_set_shard_{i}.npy' for i in range(len(shards))]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(self.num_workers, len(shards))) as executor:
+            # (2) Parse, filter and index shards with local indices.
+            start_time = time.perf_counter()
+            results = list(executor.map(index_shard, itertools.repeat(data_path), shards, shard_paths,
+                                        itertools.repeat(self.chunk_size), itertools.repeat(remove_literals),
+                                        itertools.repeat(self.add_reciprocal),
+                                        itertools.repeat(sample_triples_ratio), range(len(shards))))
+            timings[f'{split}_parse_and_index'] = time.perf_counter() - start_time
+            # (3) Merge vocabularies in the order of the shards.
+            start_time = time.perf_counter()
+            entity_maps, relation_maps, offsets = [], [], [0]
+            for entities, relations, num_triples in results:
+                entity_maps.append(index_values(np.array(entities, dtype=object), self.kg.entity_to_idx))
+                relation_maps.append(index_values(np.array(relations, dtype=object), self.kg.relation_to_idx))
+                offsets.append(offsets[-1] + num_triples)
+            timings[f'{split}_merge_vocabularies'] = time.perf_counter() - start_time
+            num_triples = offsets[-1]
+            if num_triples == 0:
+                for i in shard_paths:
+                    os.remove(i)
+                print(f'0 triples indexed into {file_path}')
+                return None
+            # (4) Remap shards into their rows of the memory-mapped array.
+            start_time = time.perf_counter()
+            np.lib.format.open_memmap(file_path, mode='w+', dtype=np.int64, shape=(num_triples, 3)).flush()
+            list(executor.map(remap_shard, shard_paths, itertools.repeat(file_path), offsets[:-1], entity_maps,
+                              relation_maps, itertools.repeat(self.chunk_size)))
+            timings[f'{split}_remap'] = time.perf_counter() - start_time
+        print(f'{num_triples} triples indexed into {file_path}')
+        # Copy-on-write: in-place modifications are not written back to the file.
+        return np.load(file_path, mmap_mode='c')
+
+
+def run_on_shared_triples(spec: Tuple[str, Tuple[int, int], str], func: Callable, file_path: str,
+                          num_rows: int = None) -> float:
+    """ Attach to triples in shared memory and call func(triples[:num_rows], file_path) (executed in a worker)
+
+    Returns
+    -------
+    Runtime in seconds
+    """
+    start_time = time.perf_counter()
+    name, shape, dtype = spec
+    shm = SharedMemory(name=name)
+    try:
+        func(np.ndarray(shape, dtype=dtype, buffer=shm.buf)[:num_rows], file_path)
+    finally:
+        shm.close()
+    return time.perf_counter() - start_time
+
+
+class SharedTriples:
+    """
+    Integer indexed triples copied once into shared memory.
+
+    Workers attach to the shared memory block instead of receiving a pickled copy of the triples per task.
+    The block is released after close() has been called and all submitted tasks are done.
+    """
+
+    def __init__(self, triples: np.ndarray):
+        assert isinstance(triples, np.ndarray) and triples.ndim == 2
+        self.shm = SharedMemory(create=True, size=max(triples.nbytes, 1))
+        np.ndarray(triples.shape, dtype=triples.dtype, buffer=self.shm.buf)[:] = triples
+        self.spec = (self.shm.name, triples.shape, triples.dtype.str)
+        # The reference of the parent is released in close().
+        self.references = 1
+        self.lock = threading.Lock()
+
+    def submit(self, executor: concurrent.futures.Executor, func: Callable, file_path: str, load: Callable,
+               num_rows: int = None, timings: dict = None) -> concurrent.futures.Future:
+        """
+        Compute func(triples[:num_rows], file_path) in a worker that stores its result into file_path
+
+        Returns
+        -------
+        Future of load(file_path), i.e., the result is loaded from disk instead of being pickled by the worker
+        """
+        future = concurrent.futures.Future()
+        with self.lock:
+            self.references += 1
+
+        def done(task: concurrent.futures.Future):
+            try:
+                runtime = task.result()
+                if timings is not None:
+                    timings[os.path.basename(file_path)] = runtime
+                future.set_result(load(file_path))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self.release()
+
+        executor.submit(run_on_shared_triples, self.spec, func, file_path, num_rows).add_done_callback(done)
+        return future
+
+    def close(self) -> None:
+        """ Release the reference of the parent after all tasks have been submitted """
+        self.release()
+
+    def release(self) -> None:
+        with self.lock:
+            self.references -= 1
+            if self.references == 0:
+                self.shm.close()
+                self.shm.unlink()
@@ -3,6 +3,8 @@ import polars as pl
 from .util import timeit, index_triples_with_pandas, dataset_sanity_checking
 from dicee.static_funcs import numpy_data_type_changer
 from .util import get_er_vocab, get_re_vocab, get_ee_vocab, create_constraints, apply_reciprical_or_noise
+from .util import load_vocab, load_constraints
+from .parallel import SharedTriples
 import numpy as np
 import concurrent
 from typing import List, Tuple
@@ -36,6 +38,8 @@ class PreprocessKG:
             self.preprocess_with_polars()
         elif self.kg.backend in ["pandas", "rdflib"]:
             self.preprocess_with_pandas()
+        elif self.kg.backend == "streaming":
+            """Indexed while reading, see StreamingIndexer"""
         else:
             raise KeyError(f'{self.kg.backend} not found')
 
@@ -54,17 +58,33 @@ class PreprocessKG:
                     data = self.kg.train_set
             print('Submit er-vocab, re-vocab, and ee-vocab via  ProcessPoolExecutor...')
             # We need to benchmark the benefits of using futures  ?
-            executor = concurrent.futures.ProcessPoolExecutor()
-            self.kg.er_vocab = executor.submit(get_er_vocab, data, self.kg.path_for_serialization + '/er_vocab.p')
-            self.kg.re_vocab = executor.submit(get_re_vocab, data, self.kg.path_for_serialization + '/re_vocab.p')
-            self.kg.ee_vocab = executor.submit(get_ee_vocab, data, self.kg.path_for_serialization + '/ee_vocab.p')
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.kg.num_preprocess_workers)
+            if isinstance(data, np.ndarray):
+                # Workers attach to the indexed triples in shared memory instead of receiving a pickled copy per task.
+                # The train set is the head of data.
+                shared = SharedTriples(data)
+                path, timings = self.kg.path_for_serialization, self.kg.preprocessing_timings
+                self.kg.er_vocab = shared.submit(executor, get_er_vocab, path + '/er_vocab', load_vocab,
+                                                 timings=timings)
+                self.kg.re_vocab = shared.submit(executor, get_re_vocab, path + '/re_vocab', load_vocab,
+                                                 timings=timings)
+                self.kg.ee_vocab = shared.submit(executor, get_ee_vocab, path + '/ee_vocab', load_vocab,
+                                                 timings=timings)
+                self.kg.constraints = shared.submit(executor, create_constraints, path + '/constraints',
+                                                    load_constraints, num_rows=len(self.kg.train_set),
+                                                    timings=timings)
+                shared.close()
+            else:
+                self.kg.er_vocab = executor.submit(get_er_vocab, data, self.kg.path_for_serialization + '/er_vocab')
+                self.kg.re_vocab = executor.submit(get_re_vocab, data, self.kg.path_for_serialization + '/re_vocab')
+                self.kg.ee_vocab = executor.submit(get_ee_vocab, data, self.kg.path_for_serialization + '/ee_vocab')
 
-            self.kg.constraints = executor.submit(create_constraints, self.kg.train_set,
-                                                  self.kg.path_for_serialization + '/constraints.p')
-            self.kg.domain_constraints_per_rel, self.kg.range_constraints_per_rel = None, None
+                self.kg.constraints = executor.submit(create_constraints, self.kg.train_set,
+                                                      self.kg.path_for_serialization + '/constraints')
 
         # string containing
-        assert isinstance(self.kg.raw_train_set, pd.DataFrame) or isinstance(self.kg.raw_train_set, pl.DataFrame)
+        assert isinstance(self.kg.raw_train_set, pd.DataFrame) or isinstance(self.kg.raw_train_set, pl.DataFrame) \
+               or self.kg.backend == "streaming"
 
         print("Creating dataset...")
         if self.kg.byte_pair_encoding and self.kg.padding:
@@ -150,6 +170,8 @@ class PreprocessKG:
                 triples.extend(x)
             self.kg.train_set = np.array(triples)
 
+        elif self.kg.backend == "streaming":
+            """Memory-mapped int64 triples are kept as they are"""
         else:
             """No need to do anything. We create datasets for other models in the pyorch dataset construction"""
             # @TODO: Either we should move the all pytorch dataset construciton into here
@@ -1,4 +1,6 @@
 from .util import read_from_disk, read_from_triple_store
+from .streaming import StreamingIndexer
+from .parallel import ParallelStreamingIndexer
 import glob
 import pandas as pd
 import numpy as np
@@ -24,7 +26,14 @@ class ReadFromDisk:
         -------
         None
         """
-        if self.kg.path_single_kg is not None:
+        if self.kg.backend == "streaming":
+            # Read and index the data chunk by chunk into memory-mapped train_set, valid_set and test_set.
+            if self.kg.num_preprocess_workers is not None and self.kg.num_preprocess_workers > 1:
+                ParallelStreamingIndexer(kg=self.kg, chunk_size=self.kg.read_chunk_size,
+                                         num_workers=self.kg.num_preprocess_workers).start()
+            else:
+                StreamingIndexer(kg=self.kg, chunk_size=self.kg.read_chunk_size).start()
+        elif self.kg.path_single_kg is not None:
             self.kg.raw_train_set = read_from_disk(self.kg.path_single_kg,
                                                    self.kg.read_only_few,
                                                    self.kg.sample_triples_ratio,
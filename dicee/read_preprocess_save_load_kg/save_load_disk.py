@@ -1,5 +1,5 @@
 import numpy as np
-from .util import load_pickle, load_numpy_ndarray
+from .util import load_numpy_ndarray, load_vocab, load_constraints, is_stored, save_string_index, load_string_index
 import os
 from dicee.static_funcs import save_pickle, save_numpy_ndarray
 
@@ -21,28 +21,25 @@ class LoadSaveToDisk:
             save_pickle(data=self.kg.ordered_bpe_entities, file_path=self.kg.path_for_serialization + '/ordered_bpe_entities.p')
             save_pickle(data=self.kg.ordered_bpe_relations, file_path=self.kg.path_for_serialization + '/ordered_bpe_relations.p')
         else:
-            assert isinstance(self.kg.entity_to_idx, dict)
-            assert isinstance(self.kg.relation_to_idx, dict)
             assert isinstance(self.kg.train_set, np.ndarray)
 
-            # (1) Save dictionary mappings into disk
-            save_pickle(data=self.kg.entity_to_idx, file_path=self.kg.path_for_serialization + '/entity_to_idx.p')
-            save_pickle(data=self.kg.relation_to_idx, file_path=self.kg.path_for_serialization + '/relation_to_idx.p')
+            # (1) Save mappings into disk as memory-mappable string tables
+            save_string_index(self.kg.entity_to_idx, file_path=self.kg.path_for_serialization + '/entity_to_idx')
+            save_string_index(self.kg.relation_to_idx, file_path=self.kg.path_for_serialization + '/relation_to_idx')
 
-            save_numpy_ndarray(data=self.kg.train_set, file_path=self.kg.path_for_serialization + '/train_set.npy')
-            if self.kg.valid_set is not None:
-                save_numpy_ndarray(data=self.kg.valid_set, file_path=self.kg.path_for_serialization + '/valid_set.npy')
-            if self.kg.test_set is not None:
-                save_numpy_ndarray(data=self.kg.test_set, file_path=self.kg.path_for_serialization + '/test_set.npy')
+            for split in ['train', 'valid', 'test']:
+                data = getattr(self.kg, f'{split}_set')
+                file_path = self.kg.path_for_serialization + f'/{split}_set.npy'
+                # Memory-mapped splits (--backend streaming) are already stored.
+                if data is not None and not is_stored(data, file_path):
+                    save_numpy_ndarray(data=data, file_path=file_path)
 
     def load(self):
         assert self.kg.path_for_deserialization is not None
         assert self.kg.path_for_serialization == self.kg.path_for_deserialization
 
-        self.kg.entity_to_idx = load_pickle(file_path=self.kg.path_for_deserialization + '/entity_to_idx.p')
-        self.kg.relation_to_idx = load_pickle(file_path=self.kg.path_for_deserialization + '/relation_to_idx.p')
-        assert isinstance(self.kg.entity_to_idx, dict)
-        assert isinstance(self.kg.relation_to_idx, dict)
+        self.kg.entity_to_idx = load_string_index(self.kg.path_for_deserialization + '/entity_to_idx')
+        self.kg.relation_to_idx = load_string_index(self.kg.path_for_deserialization + '/relation_to_idx')
         self.kg.num_entities = len(self.kg.entity_to_idx)
         self.kg.num_relations = len(self.kg.relation_to_idx)
 
@@ -54,8 +51,7 @@ class LoadSaveToDisk:
             self.kg.test_set = load_numpy_ndarray(file_path=self.kg.path_for_deserialization + '/test_set.npy')
 
         if self.kg.eval_model:
-            self.kg.er_vocab = load_pickle(file_path=self.kg.path_for_deserialization + '/er_vocab.p')
-            self.kg.re_vocab = load_pickle(file_path=self.kg.path_for_deserialization + '/re_vocab.p')
-            self.kg.ee_vocab = load_pickle(file_path=self.kg.path_for_deserialization + '/ee_vocab.p')
-            self.kg.domain_constraints_per_rel, self.kg.range_constraints_per_rel = load_pickle(
-                file_path=self.kg.path_for_deserialization + '/constraints.p')
+            self.kg.er_vocab = load_vocab(self.kg.path_for_deserialization + '/er_vocab')
+            self.kg.re_vocab = load_vocab(self.kg.path_for_deserialization + '/re_vocab')
+            self.kg.ee_vocab = load_vocab(self.kg.path_for_deserialization + '/ee_vocab')
+            self.kg.constraints = load_constraints(self.kg.path_for_deserialization + '/constraints')
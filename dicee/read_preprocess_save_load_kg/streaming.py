@@ -0,0 +1,197 @@
+import glob
+import itertools
+import os
+from typing import Iterator, Optional, Tuple
+import numpy as np
+import pandas as pd
+from .util import timeit
+
+COLUMNS = ['subject', 'relation', 'object']
+
+
+class NpyTripleWriter:
+    """
+    Append n x 3 int64 chunks to a .npy file without holding the array in memory.
+
+    The data is written after a fixed size header, which is rewritten with the final shape in close().
+    """
+    HEADER_SIZE = 128
+
+    def __init__(self, file_path: str, dtype=np.int64):
+        self.file_path = file_path
+        self.dtype = np.dtype(dtype)
+        self.num_rows = 0
+        self.file = open(file_path, 'wb')
+        self.file.write(self._header(0))
+
+    def _header(self, num_rows: int) -> bytes:
+        # See numpy.lib.format: magic string, version 1.0, header length and a dictionary padded with spaces.
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d, 3), }" % (
+            np.lib.format.dtype_to_descr(self.dtype), num_rows)
+        header = header.ljust(self.HEADER_SIZE - 10 - 1) + '\n'
+        return b'\x93NUMPY\x01\x00' + np.uint16(len(header)).tobytes() + header.encode('latin1')
+
+    def write(self, triples: np.ndarray) -> None:
+        assert triples.ndim == 2 and triples.shape[1] == 3
+        self.file.write(np.ascontiguousarray(triples, dtype=self.dtype).tobytes())
+        self.num_rows += len(triples)
+
+    def close(self) -> int:
+        self.file.seek(0)
+        self.file.write(self._header(self.num_rows))
+        self.file.close()
+        return self.num_rows
+
+
+def iter_raw_triples(data_path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Read a TSV/whitespace separated, N-Triples (.nt) or Parquet file in chunks of at most chunk_size triples
+
+    Parameters
+    ----------
+    data_path: path of a file
+    chunk_size: number of triples per chunk
+
+    Returns
+    -------
+    Generator of pandas DataFrames with subject, relation and object columns of strings
+    """
+    if data_path.endswith('.parquet'):
+        # Lazy import
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(data_path).iter_batches(batch_size=chunk_size):
+            df = batch.to_pandas().iloc[:, :3].astype(str)
+            df.columns = COLUMNS
+            yield df
+    elif data_path.endswith('.nt'):
+        with open(data_path, 'r', encoding='utf-8') as f:
+            while True:
+                lines = list(itertools.islice(f, chunk_size))
+                if len(lines) == 0:
+                    break
+                yield parse_n_triples(lines)
+    else:
+        yield from pd.read_csv(data_path, sep=r"\s+", header=None, usecols=[0, 1, 2], names=COLUMNS, dtype=str,
+                               chunksize=chunk_size)
+
+
+def parse_n_triples(lines) -> pd.DataFrame:
+    """ Subject, predicate and the rest of a line without the trailing dot as the object. Comments are dropped """
+    df = pd.Series(lines, dtype=object).str.extract(r'^\s*(\S+)\s+(\S+)\s+(.*?)\s*\.\s*$').dropna()
+    df.columns = COLUMNS
+    return df
+
+
+def is_rdf(df: pd.DataFrame) -> bool:
+    """ Type heuristic: If KG is an RDF KG, triples with literal values are removed """
+    head = df.head()
+    return sum(head["subject"].str.startswith('<')) + sum(head["relation"].str.startswith('<')) > 2
+
+
+def chunk_to_triples(df: pd.DataFrame, remove_literals: bool,
+                     add_reciprocal: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Subjects, relations and objects of a chunk after removing literals and adding reciprocal triples,
+    e.g. KG:= {(s,p,o)} union {(o,p_inverse,s)} """
+    if remove_literals:
+        df = df[df["object"].str.startswith('<', na=False)]
+    subjects, relations, objects = df['subject'].values, df['relation'].values, df['object'].values
+    if add_reciprocal:
+        subjects, objects = np.concatenate((subjects, objects)), np.concatenate((objects, subjects))
+        relations = np.concatenate((relations, relations.astype(object) + '_inverse'))
+    return subjects, relations, objects
+
+
+def index_chunk(df: pd.DataFrame, remove_literals: bool, add_reciprocal: bool, entity_to_idx: dict,
+                relation_to_idx: dict) -> np.ndarray:
+    """ n x 3 integer indexed triples of a chunk. entity_to_idx and relation_to_idx grow incrementally """
+    subjects, relations, objects = chunk_to_triples(df, remove_literals, add_reciprocal)
+    entities = index_values(np.concatenate((subjects, objects)), entity_to_idx)
+    return np.stack((entities[:len(subjects)], index_values(relations, relation_to_idx), entities[len(subjects):]),
+                    axis=1)
+
+
+def index_values(values: np.ndarray, vocab: dict) -> np.ndarray:
+    """ Integer indices of values. Unseen values are appended to vocab, i.e., vocab grows incrementally """
+    codes, uniques = pd.factorize(values)
+    ids = np.fromiter((vocab.setdefault(i, len(vocab)) for i in uniques), dtype=np.int64, count=len(uniques))
+    return ids[codes]
+
+
+class StreamingIndexer:
+    """
+    Read and index train, valid and test splits chunk by chunk (--backend streaming).
+
+    Entity and relation indices are assigned incrementally and the indexed triples are written to
+    train_set.npy, valid_set.npy and test_set.npy in the serialization folder, which are memory-mapped afterwards.
+    Raw string triples are never held in memory beyond a single chunk.
+    """
+
+    def __init__(self, kg, chunk_size: int = None):
+        self.kg = kg
+        self.chunk_size = chunk_size or 1_000_000
+        self.rng = np.random.default_rng(0)
+
+    @property
+    def add_reciprocal(self) -> bool:
+        return bool(self.kg.add_reciprical and self.kg.eval_model)
+
+    def start(self) -> None:
+        if self.kg.path_for_serialization is None:
+            raise RuntimeError("--backend streaming writes the indexed triples into the experiment folder")
+        if self.kg.add_noise_rate:
+            raise NotImplementedError("--add_noise_rate is not implemented for --backend streaming")
+        self.kg.entity_to_idx, self.kg.relation_to_idx = dict(), dict()
+        # (1) Find splits.
+        if self.kg.path_single_kg is not None:
+            splits = {'train': self.kg.path_single_kg}
+        elif self.kg.dataset_dir:
+            splits = dict()
+            for i in glob.glob(self.kg.dataset_dir + '/*'):
+                if 'train' in i:
+                    splits['train'] = i
+                elif 'test' in i and self.kg.eval_model is not None:
+                    splits['test'] = i
+                elif 'valid' in i and self.kg.eval_model is not None:
+                    splits['valid'] = i
+                else:
+                    print(f'Not processed data: {i}')
+        else:
+            raise RuntimeError("--backend streaming requires --dataset_dir or --path_single_kg")
+        # (2) Index splits. Training triples are indexed first so that they obtain the first indices.
+        self.kg.train_set = self.index_split(splits['train'], 'train', read_only_few=self.kg.read_only_few,
+                                             sample_triples_ratio=self.kg.sample_triples_ratio)
+        self.kg.valid_set = self.index_split(splits['valid'], 'valid') if 'valid' in splits else None
+        self.kg.test_set = self.index_split(splits['test'], 'test') if 'test' in splits else None
+        self.kg.num_entities, self.kg.num_relations = len(self.kg.entity_to_idx), len(self.kg.relation_to_idx)
+
+    @timeit
+    def index_split(self, data_path: str, split: str, read_only_few: int = None,
+                    sample_triples_ratio: float = None) -> Optional[np.memmap]:
+        """ Index a file chunk by chunk into the memory-mapped {split}_set.npy """
+        print(f'*** Streaming {data_path} in chunks of {self.chunk_size} triples ***')
+        file_path = self.kg.path_for_serialization + f'/{split}_set.npy'
+        writer = NpyTripleWriter(file_path)
+        remove_literals = None
+        num_read = 0
+        for df in iter_raw_triples(data_path, self.chunk_size):
+            # (1) Read only few and sample.
+            if read_only_few is not None:
+                df = df.iloc[:read_only_few - num_read]
+                num_read += len(df)
+            if sample_triples_ratio:
+                df = df[self.rng.random(len(df)) < sample_triples_ratio]
+            # (2) Type heuristic on the first chunk: If KG is an RDF KG, remove all triples with literal values.
+            if remove_literals is None and len(df) > 0:
+                remove_literals = is_rdf(df)
+            # (3) Index entities and relations.
+            writer.write(index_chunk(df, remove_literals, self.add_reciprocal, self.kg.entity_to_idx,
+                                     self.kg.relation_to_idx))
+            if read_only_few is not None and num_read >= read_only_few:
+                break
+        num_triples = writer.close()
+        print(f'{num_triples} triples indexed into {file_path}')
+        if num_triples == 0:
+            os.remove(file_path)
+            return None
+        # Copy-on-write: in-place modifications are not written back to the file.
+        return np.load(file_path, mmap_mode='c')
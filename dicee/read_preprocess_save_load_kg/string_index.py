@@ -0,0 +1,183 @@
+import os
+from collections.abc import Mapping
+from typing import Iterable, Iterator, Tuple, Union
+import numpy as np
+
+
+class StringIndex(Mapping):
+    """
+    Memory-mappable replacement of the entity_to_idx and relation_to_idx dictionaries.
+
+    The i.th string is stored as UTF-8 bytes in blob[offsets[i]:offsets[i+1]] (string table).
+    order holds the indices of the strings sorted by their bytes, i.e., a string is looked up by binary search in
+    O(log n) slices of the blob. The i.th string is retrieved in O(1) via inverse, e.g.,
+    entity_to_idx[s] := i and entity_to_idx.inverse[i] := s.
+
+    The arrays are stored as .npy files and memory-mapped when they are loaded, i.e., processes loading the same index
+    share its pages. Strings added after loading, e.g. new entities, are kept in memory and appended to the index.
+    """
+
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray, order: np.ndarray):
+        assert len(offsets) == len(order) + 1
+        self.offsets = offsets
+        self.blob = blob
+        self.order = order
+        # Strings appended after construction.
+        self.appended = dict()
+        self.appended_strings = []
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str]):
+        """
+        Build the index of strings ordered by their indices, e.g., StringIndex.from_strings(entity_to_idx)
+
+        Parameters
+        ----------
+        strings: unique strings. The i.th string obtains the index i
+
+        Returns
+        -------
+        StringIndex
+        """
+        encoded = [i.encode('utf-8') for i in strings]
+        # (1) String table.
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(i) for i in encoded], out=offsets[1:])
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        # (2) Indices sorted by bytes, i.e., the order of the binary search.
+        dtype = np.int32 if len(encoded) < np.iinfo(np.int32).max else np.int64
+        order = np.array(sorted(range(len(encoded)), key=encoded.__getitem__), dtype=dtype)
+        for i, j in zip(order[:-1], order[1:]):
+            if encoded[i] == encoded[j]:
+                raise ValueError(f"Duplicate string:{encoded[i].decode('utf-8')}")
+        return cls(offsets=offsets, blob=blob, order=order)
+
+    def save(self, path: str) -> None:
+        """ Store the index into path_offsets.npy, path_blob.npy and path_order.npy """
+        index = self if len(self.appended_strings) == 0 else StringIndex.from_strings(self)
+        for name, array in (('offsets', index.offsets), ('blob', index.blob), ('order', index.order)):
+            # Replace files instead of truncating them, as they may be memory-mapped.
+            with open(path + f'_{name}.npy.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(path + f'_{name}.npy.tmp', path + f'_{name}.npy')
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = 'r'):
+        """ Load an index stored via save(). By default, the arrays are memory-mapped (read-only) """
+        return cls(offsets=np.load(path + '_offsets.npy', mmap_mode=mmap_mode),
+                   blob=np.load(path + '_blob.npy', mmap_mode=mmap_mode),
+                   order=np.load(path + '_order.npy', mmap_mode=mmap_mode))
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(path + '_offsets.npy')
+
+    @property
+    def num_stored(self) -> int:
+        return len(self.order)
+
+    def _bytes_at(self, idx: int) -> bytes:
+        return self.blob[self.offsets[idx]:self.offsets[idx + 1]].tobytes()
+
+    def string_at(self, idx: int) -> str:
+        """ The idx.th string """
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if 0 <= idx < self.num_stored:
+            return self._bytes_at(idx).decode('utf-8')
+        if self.num_stored <= idx < len(self):
+            return self.appended_strings[idx - self.num_stored]
+        raise KeyError(idx)
+
+    def _search(self, key: bytes) -> Union[int, None]:
+        """ Index of a stored string via binary search over order """
+        low, high = 0, self.num_stored
+        while low < high:
+            mid = (low + high) // 2
+            idx = int(self.order[mid])
+            candidate = self._bytes_at(idx)
+            if candidate == key:
+                return idx
+            if candidate < key:
+                low = mid + 1
+            else:
+                high = mid
+        return None
+
+    def __getitem__(self, key: str) -> int:
+        if not isinstance(key, str):
+            raise KeyError(key)
+        idx = self._search(key.encode('utf-8'))
+        if idx is None:
+            return self.appended[key]
+        return idx
+
+    def __setitem__(self, key: str, idx: int) -> None:
+        """ Append a new string. Stored strings are immutable """
+        if key in self:
+            if self[key] != idx:
+                raise ValueError(f"{key} is already indexed by {self[key]}")
+            return
+        if idx != len(self):
+            raise ValueError(f"A new string must obtain the next index {len(self)}. Currently:{idx}")
+        self.appended[key] = idx
+        self.appended_strings.append(key)
+
+    def __contains__(self, key) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return self.num_stored + len(self.appended_strings)
+
+    def __iter__(self) -> Iterator[str]:
+        """ Strings ordered by their indices, i.e., the insertion order of a dictionary """
+        for idx in range(self.num_stored):
+            yield self._bytes_at(idx).decode('utf-8')
+        yield from self.appended_strings
+
+    def values(self) -> range:
+        return range(len(self))
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        return zip(self, range(len(self)))
+
+    @property
+    def inverse(self) -> "InverseStringIndex":
+        """ idx -> string view, e.g., idx_to_entity """
+        return InverseStringIndex(self)
+
+
+class InverseStringIndex(Mapping):
+    """ Dictionary-like view of a StringIndex from indices to strings """
+
+    def __init__(self, string_index: StringIndex):
+        self.string_index = string_index
+
+    def __getitem__(self, idx: int) -> str:
+        if not 0 <= idx < len(self):
+            raise KeyError(idx)
+        return self.string_index.string_at(idx)
+
+    def __setitem__(self, idx: int, key: str) -> None:
+        """ Append a new string, see StringIndex.__setitem__ """
+        self.string_index[key] = idx
+
+    def __contains__(self, idx) -> bool:
+        return isinstance(idx, (int, np.integer)) and 0 <= idx < len(self)
+
+    def __len__(self) -> int:
+        return len(self.string_index)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self)))
+
+    def values(self) -> Iterator[str]:
+        return iter(self.string_index)
+
+    def items(self) -> Iterator[Tuple[int, str]]:
+        return zip(range(len(self)), self.string_index)
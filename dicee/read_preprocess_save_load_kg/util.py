@@ -9,6 +9,9 @@ import pickle
 import os
 import psutil
 import requests
+from .filter_index import FilterIndex
+from .constraint_index import RelationConstraints
+from .string_index import StringIndex
 
 
 def apply_reciprical_or_noise(add_reciprical: bool, eval_model: str, df: object = None, info: str = None):
@@ -156,68 +159,126 @@ def read_from_triple_store(endpoint: str = None):
     return pd.DataFrame(data=triples, index=None, columns=["subject", "relation", "object"], dtype=str)
 
 
+def is_integer_indexed(data) -> bool:
+    return isinstance(data, np.ndarray) and np.issubdtype(data.dtype, np.integer)
+
+
 def get_er_vocab(data, file_path: str = None):
+    """ Mapping from head entities and relations to tail entities, e.g. er_vocab[(h, r)].
+
+    Integer indexed triples are indexed in a FilterIndex stored as file_path_*.npy,
+    otherwise (e.g. byte pair encoded triples) in a dictionary stored as file_path.p """
+    if is_integer_indexed(data):
+        er_vocab = FilterIndex.from_triples(data, key_columns=(0, 1), value_column=2)
+        if file_path:
+            er_vocab.save(file_path)
+        return er_vocab
     # head entity and relation
     er_vocab = defaultdict(list)
     for triple in data:
         h, r, t = triple
         er_vocab[(h, r)].append(t)
     if file_path:
-        save_pickle(data=er_vocab, file_path=file_path)
+        save_pickle(data=er_vocab, file_path=file_path + '.p')
     return er_vocab
 
 
 def get_re_vocab(data, file_path: str = None):
+    """ Mapping from relations and tail entities to head entities, e.g. re_vocab[(r, t)], see get_er_vocab """
+    if is_integer_indexed(data):
+        re_vocab = FilterIndex.from_triples(data, key_columns=(1, 2), value_column=0)
+        if file_path:
+            re_vocab.save(file_path)
+        return re_vocab
     # head entity and relation
     re_vocab = defaultdict(list)
     for triple in data:
         re_vocab[(triple[1], triple[2])].append(triple[0])
     if file_path:
-        save_pickle(data=re_vocab, file_path=file_path)
+        save_pickle(data=re_vocab, file_path=file_path + '.p')
     return re_vocab
 
 
 def get_ee_vocab(data, file_path: str = None):
+    """ Mapping from head and tail entities to relations, e.g. ee_vocab[(h, t)], see get_er_vocab """
+    if is_integer_indexed(data):
+        ee_vocab = FilterIndex.from_triples(data, key_columns=(0, 2), value_column=1)
+        if file_path:
+            ee_vocab.save(file_path)
+        return ee_vocab
     # head entity and relation
     ee_vocab = defaultdict(list)
     for triple in data:
         ee_vocab[(triple[0], triple[2])].append(triple[1])
     if file_path:
-        save_pickle(data=ee_vocab, file_path=file_path)
+        save_pickle(data=ee_vocab, file_path=file_path + '.p')
     return ee_vocab
 
 
+def is_stored(data: np.ndarray, file_path: str) -> bool:
+    """ Whether data is memory-mapped from file_path """
+    return isinstance(data, np.memmap) and data.filename is not None and \
+        os.path.abspath(data.filename) == os.path.abspath(file_path)
+
+
+def save_vocab(vocab, file_path: str) -> None:
+    """ Store an er/re/ee vocab created by get_er_vocab, get_re_vocab or get_ee_vocab """
+    if isinstance(vocab, FilterIndex):
+        # A FilterIndex loaded from file_path is already stored.
+        if not is_stored(vocab.keys, file_path + '_keys.npy'):
+            vocab.save(file_path)
+    else:
+        save_pickle(data=vocab, file_path=file_path + '.p')
+
+
+def load_vocab(file_path: str):
+    """ Load an er/re/ee vocab stored via save_vocab. FilterIndex arrays are memory-mapped """
+    if FilterIndex.exists(file_path):
+        return FilterIndex.load(file_path)
+    return load_pickle(file_path=file_path + '.p')
+
+
+def save_string_index(index, file_path: str) -> None:
+    """ Store an entity_to_idx or relation_to_idx mapping as StringIndex into file_path_{offsets,blob,order}.npy """
+    if isinstance(index, StringIndex):
+        # A StringIndex loaded from file_path without new strings is already stored.
+        if len(index.appended_strings) == 0 and is_stored(index.offsets, file_path + '_offsets.npy'):
+            return
+    else:
+        assert isinstance(index, dict)
+        # Strings must be ordered by their indices.
+        assert all(i == idx for i, idx in enumerate(index.values()))
+        index = StringIndex.from_strings(index)
+    index.save(file_path)
+
+
+def load_string_index(file_path: str):
+    """ Load an entity_to_idx or relation_to_idx mapping stored via save_string_index. Arrays are memory-mapped.
+    Mappings of earlier experiments are loaded from pickled dictionaries (file_path.p) """
+    if StringIndex.exists(file_path):
+        return StringIndex.load(file_path)
+    return load_pickle(file_path=file_path + '.p')
+
+
 def create_constraints(triples, file_path: str = None):
     """
     (1) Extract domains and ranges of relations
-    (2) Store a mapping from relations to entities that are outside of the domain and range.
-    Crete constrainted entities based on the range of relations
+    (2) Store them as CSR lists of allowed entities per relation, see RelationConstraints.
     :param triples:
     :return:
-    Tuple[dict, dict]
+    RelationConstraints
     """
     assert isinstance(triples, np.ndarray)
     assert triples.shape[1] == 3
+    constraints = RelationConstraints.from_triples(triples)
+    if file_path:
+        constraints.save(file_path)
+    return constraints
 
-    # (1) Compute the range and domain of each relation
-    range_constraints_per_rel = dict()
-    domain_constraints_per_rel = dict()
-    set_of_entities = set()
-    set_of_relations = set()
-    for (e1, p, e2) in triples:
-        range_constraints_per_rel.setdefault(p, set()).add(e2)
-        domain_constraints_per_rel.setdefault(p, set()).add(e1)
-        set_of_entities.add(e1)
-        set_of_relations.add(p)
-        set_of_entities.add(e2)
-
-    for rel in set_of_relations:
-        range_constraints_per_rel[rel] = list(set_of_entities - range_constraints_per_rel[rel])
-        domain_constraints_per_rel[rel] = list(set_of_entities - domain_constraints_per_rel[rel])
 
-    if file_path:
-        save_pickle(data=(domain_constraints_per_rel, range_constraints_per_rel), file_path=file_path)
-    return domain_constraints_per_rel, range_constraints_per_rel
+def load_constraints(file_path: str):
+    """ Load constraints stored by create_constraints. Arrays are memory-mapped """
+    return RelationConstraints.load(file_path)
 
 
 @timeit
@@ -277,8 +338,7 @@ def load_with_pandas(self) -> None:
         self.kg.re_vocab = get_re_vocab(data)
         # 17. Create a bijection mapping from subject-object pairs to relations.
         self.kg.ee_vocab = get_ee_vocab(data)
-        self.kg.domain_constraints_per_rel, self.kg.range_constraints_per_rel = create_constraints(
-            self.kg.train_set)
+        self.kg.constraints = create_constraints(self.kg.train_set)
         print(f'Done !\t{time.time() - start_time:.3f} seconds\n')
 
 
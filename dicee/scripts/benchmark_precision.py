@@ -0,0 +1,70 @@
+""" Compare link prediction performance and training throughput of float32 and bfloat16 mixed precision training
+
+python -m dicee.scripts.benchmark_precision --dataset_dir KGs/UMLS --model FMult --num_epochs 50
+"""
+import argparse
+import time
+
+
+def get_default_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset_dir", type=str, required=True,
+                        help="The path of a folder containing train.txt, and/or valid.txt and/or test.txt")
+    parser.add_argument("--model", type=str, default="FMult",
+                        help="Model to be benchmarked, e.g. FMult, GFMult, FMult2, LFMult, PolyMult")
+    parser.add_argument("--precisions", type=str, nargs="+", default=["32", "bf16-mixed"],
+                        help="Precisions to be compared")
+    parser.add_argument("--embedding_dim", type=int, default=32)
+    parser.add_argument("--num_epochs", type=int, default=10)
+    parser.add_argument("--batch_size", type=int, default=1024)
+    parser.add_argument("--lr", type=float, default=0.02)
+    parser.add_argument("--scoring_technique", type=str, default="NegSample")
+    parser.add_argument("--neg_ratio", type=int, default=10)
+    parser.add_argument("--degree", type=int, default=1)
+    parser.add_argument("--eval_model", type=str, default="test",
+                        choices=["train", "train_val", "train_val_test", "test"])
+    parser.add_argument("--random_seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def benchmark(args, precision: str) -> dict:
+    from dicee.config import Namespace
+    from dicee.executer import Execute
+    from dicee.evaluator import Evaluator
+    from dicee.trainer import DICE_Trainer
+    # (1) Configuration
+    config = Namespace()
+    for k, v in vars(args).items():
+        if k != "precisions":
+            setattr(config, k, v)
+    config.trainer = "torchCPUTrainer"
+    config.precision = precision
+    # (2) Steps of Execute.start() so that the training is timed without data loading and evaluation.
+    executor = Execute(config)
+    executor.start_time = time.time()
+    executor.read_preprocess_index_serialize_data()
+    executor.evaluator = Evaluator(args=executor.args)
+    executor.trainer = DICE_Trainer(args=executor.args, is_continual_training=False,
+                                    storage_path=executor.storage_path, evaluator=executor.evaluator)
+    start_time = time.time()
+    executor.trained_model, form_of_labelling = executor.trainer.start(knowledge_graph=executor.knowledge_graph)
+    runtime = time.time() - start_time
+    # (3) Evaluate the trained model.
+    report = executor.end(form_of_labelling)
+    return {"precision": precision,
+            "Runtime": runtime,
+            "TriplesPerSecond": report["num_train_triples"] * args.num_epochs / runtime,
+            **{f"{split}MRR": res["MRR"] for split, res in report.items()
+               if isinstance(res, dict) and "MRR" in res}}
+
+
+def main():
+    args = get_default_arguments()
+    rows = [benchmark(args, precision) for precision in args.precisions]
+    import pandas as pd
+    print(pd.DataFrame(rows).to_string(index=False))
+    return rows
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,7 @@ import torch
 import datetime
 from typing import Tuple, List
 from .models import CMult, Pyke, DistMult, KeciBase, Keci, TransE,\
-    ComplEx, ConvQ, ConvO, ConEx, QMult, OMult, LFMult, FMult, PolyMult, LFMult1
+    ComplEx, ConvQ, ConvO, ConEx, QMult, OMult, LFMult, FMult, GFMult, FMult2, PolyMult, LFMult1
 from .models.pykeen_models import PykeenKGE
 from .models.transformers import BytE
 import time
@@ -150,18 +150,18 @@ def load_model(path_of_experiment_folder: str, model_name='model.pt',verbose=0)
     else:
         if verbose>0:
             print('Loading entity and relation indexes...', end=' ')
+        # Lazy import to avoid a circular import.
+        from .read_preprocess_save_load_kg.util import load_string_index
+        # String tables are memory-mapped, i.e., processes loading the same model share the pages.
         try:
-            # Maybe ? https://docs.python.org/3/library/mmap.html
-            with open(path_of_experiment_folder + '/entity_to_idx.p', 'rb') as f:
-                entity_to_idx = pickle.load(f)
+            entity_to_idx = load_string_index(path_of_experiment_folder + '/entity_to_idx')
         except FileNotFoundError:
-            print("entity_to_idx.p not found")
+            print("entity_to_idx not found")
             entity_to_idx = dict()
         try:
-            with open(path_of_experiment_folder + '/relation_to_idx.p', 'rb') as f:
-                relation_to_idx = pickle.load(f)
+            relation_to_idx = load_string_index(path_of_experiment_folder + '/relation_to_idx')
         except FileNotFoundError:
-            print("relation_to_idx.p not found")
+            print("relation_to_idx not found")
             relation_to_idx = dict()
         if verbose > 0:
             print(f'Done! It took {time.time() - start_time:.4f}')
@@ -218,12 +218,10 @@ def load_model_ensemble(path_of_experiment_folder: str) -> Tuple[BaseKGE, Tuple[
     model.eval()
     start_time = time.time()
     print('Loading entity and relation indexes...', end=' ')
-    with open(path_of_experiment_folder + '/entity_to_idx.p', 'rb') as f:
-        entity_to_idx = pickle.load(f)
-    with open(path_of_experiment_folder + '/relation_to_idx.p', 'rb') as f:
-        relation_to_idx = pickle.load(f)
-    assert isinstance(entity_to_idx, dict)
-    assert isinstance(relation_to_idx, dict)
+    # Lazy import to avoid a circular import.
+    from .read_preprocess_save_load_kg.util import load_string_index
+    entity_to_idx = load_string_index(path_of_experiment_folder + '/entity_to_idx')
+    relation_to_idx = load_string_index(path_of_experiment_folder + '/relation_to_idx')
     print(f'Done! It took {time.time() - start_time:.4f}')
     return model, (entity_to_idx, relation_to_idx)
 
@@ -288,7 +286,9 @@ def store(trainer,
     save_checkpoint_model(model=trained_model, path=full_storage_path + f'/{model_name}.pt')
     if save_embeddings_as_csv:
         entity_emb, relation_ebm = trained_model.get_embeddings()
-        entity_to_idx = pickle.load(open(full_storage_path + '/entity_to_idx.p', 'rb'))
+        # Lazy import to avoid a circular import.
+        from .read_preprocess_save_load_kg.util import load_string_index
+        entity_to_idx = load_string_index(full_storage_path + '/entity_to_idx')
         entity_str = entity_to_idx.keys()
         # Ensure that the ordering is correct.
         assert list(range(0, len(entity_str))) == list(entity_to_idx.values())
@@ -296,7 +296,7 @@ def store(trainer,
                         path=full_storage_path + '/' + trained_model.name + '_entity_embeddings.csv')
         del entity_to_idx, entity_str, entity_emb
         if relation_ebm is not None:
-            relation_to_idx = pickle.load(open(full_storage_path + '/relation_to_idx.p', 'rb'))
+            relation_to_idx = load_string_index(full_storage_path + '/relation_to_idx')
             relations_str = relation_to_idx.keys()
 
             save_embeddings(relation_ebm.numpy(), indexes=relations_str,
@@ -424,6 +424,12 @@ def intialize_model(args: dict,verbose=0) -> Tuple[object, str]:
     elif model_name == 'FMult':
         model =FMult(args=args)
         form_of_labelling = 'EntityPrediction'
+    elif model_name == 'GFMult':
+        model =GFMult(args=args)
+        form_of_labelling = 'EntityPrediction'
+    elif model_name == 'FMult2':
+        model =FMult2(args=args)
+        form_of_labelling = 'EntityPrediction'
     elif model_name == 'PolyMult':
         model =PolyMult(args=args)
         form_of_labelling = 'EntityPrediction'
@@ -432,6 +438,21 @@ def intialize_model(args: dict,verbose=0) -> Tuple[object, str]:
         form_of_labelling = 'EntityPrediction'
     else:
         raise ValueError(f"--model_name: {model_name} is not found.")
+    if args.get("sparse_embeddings", False):
+        # Gradients of entity and relation embeddings are restricted to the rows occurring in a mini-batch.
+        model.use_sparse_embeddings()
+    return model, form_of_labelling
+
+
+def initialize_model_without_entity_embeddings(args: dict) -> Tuple[object, str]:
+    """ Model with an empty entity embedding table (--sharded_embeddings and --num_partitions)
+
+    The trainer creates the rows held in memory, e.g. the shard of a rank or a partition,
+    i.e., the full table is never allocated.
+    """
+    model, form_of_labelling = intialize_model({**args, 'num_entities': 0})
+    model.num_entities = args['num_entities']
+    model.args['num_entities'] = args['num_entities']
     return model, form_of_labelling
 
 
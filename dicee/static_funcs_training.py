@@ -1,8 +1,117 @@
+import math
 import torch
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Iterable
+import itertools
 import numpy as np
 from tqdm import tqdm
 
+
+def csr_filter(filters: List[Iterable[int]], device=None) -> Tuple[torch.LongTensor, torch.LongTensor]:
+    """
+    Sparse CSR boolean mask of a batch, i.e., the i.th row contains filters[i]
+
+    Parameters
+    ----------
+    filters: entity/relation indices to be filtered for each row of a batch
+    device: device of the tensors
+
+    Returns
+    -------
+    crow_indices (batch + 1,) and col_indices (nnz,)
+    """
+    lengths = np.fromiter((len(i) for i in filters), dtype=np.int64, count=len(filters))
+    crow_indices = np.zeros(len(filters) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=crow_indices[1:])
+    col_indices = np.fromiter(itertools.chain.from_iterable(filters), dtype=np.int64, count=int(crow_indices[-1]))
+    return torch.from_numpy(crow_indices).to(device), torch.from_numpy(col_indices).to(device)
+
+
+def multi_labels_to_dense(y_batch: torch.Tensor, label_smoothing_rate: float = None) -> torch.FloatTensor:
+    """
+    Dense batch x |E| multi-labels of a sparse batch of positive indices (see KvsAll.__getitems__)
+
+    The labels are created on the device of y_batch via a single scatter and smoothed in-place.
+    Dense labels are returned as they are.
+
+    Parameters
+    ----------
+    y_batch: sparse COO tensor of positive (row, col) indices or dense labels
+    label_smoothing_rate: label smoothing rate
+
+    Returns
+    -------
+    batch x |E| labels
+    """
+    if not y_batch.is_sparse:
+        return y_batch
+    # Indices of an uncoalesced tensor. Duplicated positives are set to 1 once.
+    rows, cols = y_batch._indices()
+    labels = torch.zeros(y_batch.shape, device=y_batch.device)
+    labels[rows, cols] = 1.0
+    if label_smoothing_rate:
+        labels.mul_(1 - label_smoothing_rate).add_(1 / labels.size(1))
+    return labels
+
+
+def initialize_embedding_rows(rows: torch.Tensor, num_embeddings: int, param_init) -> torch.Tensor:
+    """
+    Initialize rows of a table with num_embeddings rows in-place as BaseKGE initializes the full table
+
+    Rows are drawn from N(0, 1) as in torch.nn.Embedding. The standard deviation of xavier_normal depends on
+    the number of rows and is computed for num_embeddings rows. Hence, a shard or a partition of a table is
+    initialized without allocating the table.
+
+    Parameters
+    ----------
+    rows: rows of the table, e.g., a shard or a partition
+    num_embeddings: number of rows of the table
+    param_init: param_init of BaseKGE
+
+    Returns
+    -------
+    rows
+    """
+    with torch.no_grad():
+        if param_init is torch.nn.init.xavier_normal_:
+            return rows.normal_(0, math.sqrt(2.0 / (num_embeddings + rows.shape[1])))
+        return rows.normal_()
+
+
+def filtered_ranks(predictions: torch.FloatTensor, target_idx: torch.LongTensor, crow_indices: torch.LongTensor,
+                   col_indices: torch.LongTensor) -> torch.FloatTensor:
+    """
+    Filtered ranks of the targets, i.e., 1 + the number of non-filtered scores being greater than the score of the target
+    + half of the number of other non-filtered scores being equal to the score of the target (realistic rank).
+    Hence, constant scores do not obtain the rank 1.
+
+    predictions are filtered in-place with a single scatter.
+
+    Parameters
+    ----------
+    predictions: batch x N scores
+    target_idx: batch indices of the targets
+    crow_indices: CSR row offsets of the filter, see csr_filter
+    col_indices: CSR column indices of the filter
+
+    Returns
+    -------
+    ranks (batch,) between 1 and N, multiples of 0.5
+    """
+    target_idx = target_idx.to(predictions.device)
+    # (1) Scores of the targets are kept aside so that they are not filtered.
+    target_scores = predictions.gather(1, target_idx.unsqueeze(1))
+    # (2) Filter all known entities at once.
+    rows = torch.repeat_interleave(torch.arange(len(predictions), device=predictions.device),
+                                   crow_indices.diff().to(predictions.device))
+    predictions.index_put_((rows, col_indices.to(predictions.device)),
+                           torch.tensor(-np.inf, dtype=predictions.dtype, device=predictions.device))
+    predictions.scatter_(1, target_idx.unsqueeze(1), target_scores)
+    # (3) Count instead of sorting: O(N) per row. Ties include the target itself.
+    greater = (predictions > target_scores).sum(dim=1)
+    equal = (predictions == target_scores).sum(dim=1)
+    return 1 + greater + (equal - 1) / 2
+
+
 def evaluate_lp(model, triple_idx, num_entities, er_vocab: Dict[Tuple, List], re_vocab: Dict[Tuple, List],
                 info='Eval Starts'):
     """
@@ -5,11 +5,13 @@ import gc
 from typing import Union
 
 from dicee.models.base_model import BaseKGE
-from dicee.static_funcs import select_model
+from dicee.static_funcs import select_model, initialize_model_without_entity_embeddings
 from dicee.callbacks import ASWA, Eval, KronE, PrintCallback, AccumulateEpochLossCallback, Perturb
 from dicee.dataset_classes import construct_dataset, reload_dataset
 from .torch_trainer import TorchTrainer
 from .torch_trainer_ddp import TorchDDPTrainer
+from .torch_trainer_ddp_cpu import TorchCPUDDPTrainer
+from .torch_trainer_partitioned import TorchPartitionedTrainer
 from ..static_funcs import timeit
 import os
 import torch
@@ -20,6 +22,13 @@ from ..knowledge_graph import KG
 
 
 def initialize_trainer(args, callbacks):
+    if getattr(args, "sharded_embeddings", False) and (args.trainer != 'torchDDP' or torch.cuda.is_available()):
+        raise NotImplementedError("--sharded_embeddings is only implemented for --trainer torchDDP on CPUs (gloo)")
+    if getattr(args, "num_partitions", None):
+        if args.trainer != 'torchCPUTrainer':
+            raise NotImplementedError("--num_partitions is only implemented for --trainer torchCPUTrainer")
+        print('Initializing TorchPartitionedTrainer...', end='\t')
+        return TorchPartitionedTrainer(args, callbacks=callbacks)
     if args.trainer == 'torchCPUTrainer':
         print('Initializing TorchTrainer CPU Trainer...', end='\t')
         return TorchTrainer(args, callbacks=callbacks)
@@ -28,8 +37,8 @@ def initialize_trainer(args, callbacks):
             print('Initializing TorchDDPTrainer GPU', end='\t')
             return TorchDDPTrainer(args, callbacks=callbacks)
         else:
-            print('Initializing TorchTrainer CPU Trainer', end='\t')
-            return TorchTrainer(args, callbacks=callbacks)
+            print('Initializing TorchCPUDDPTrainer (gloo)', end='\t')
+            return TorchCPUDDPTrainer(args, callbacks=callbacks)
     elif args.trainer == 'PL':
         print('Initializing Pytorch-lightning Trainer', end='\t')
         kwargs = vars(args)
@@ -109,6 +118,15 @@ def get_callbacks(args):
     return callbacks
 
 
+def negative_sampling_args(args) -> dict:
+    """ Keyword arguments of NegativeSampler for NegSample training """
+    return {"corruption_ratios": args.corruption_ratios,
+            "filtered": args.filtered_negatives,
+            "entity_sampling": args.entity_sampling,
+            "unigram_alpha": args.unigram_alpha,
+            "bernoulli": args.bernoulli_corruption}
+
+
 class DICE_Trainer:
     """
    DICE_Trainer implement
@@ -170,7 +188,9 @@ class DICE_Trainer:
             reload_dataset(path=self.storage_path, form_of_labelling=form_of_labelling,
                            scoring_technique=self.args.scoring_technique,
                            neg_ratio=self.args.neg_ratio,
-                           label_smoothing_rate=self.args.label_smoothing_rate))
+                           label_smoothing_rate=self.args.label_smoothing_rate,
+                           negative_sampling=negative_sampling_args(self.args),
+                           num_shared_negatives=self.args.num_shared_negatives))
         self.trainer.fit(model, train_dataloaders=train_loader)
         return model, form_of_labelling
 
@@ -182,7 +202,13 @@ class DICE_Trainer:
     @timeit
     def initialize_or_load_model(self):
         print('Initializing Model...', end='\t')
-        model, form_of_labelling = select_model(vars(self.args), self.is_continual_training, self.storage_path)
+        if getattr(self.args, "sharded_embeddings", False) or getattr(self.args, "num_partitions", None):
+            if self.is_continual_training:
+                raise NotImplementedError("--sharded_embeddings and --num_partitions do not support continual training")
+            # Ranks create their shards and TorchPartitionedTrainer its partitions of the entity embeddings.
+            model, form_of_labelling = initialize_model_without_entity_embeddings(vars(self.args))
+        else:
+            model, form_of_labelling = select_model(vars(self.args), self.is_continual_training, self.storage_path)
         self.report['form_of_labelling'] = form_of_labelling
         assert form_of_labelling in ['EntityPrediction', 'RelationPrediction']
         return model, form_of_labelling
@@ -192,9 +218,11 @@ class DICE_Trainer:
         print('Initializing Dataloader...', end='\t')
         # https://pytorch.org/docs/stable/data.html#multi-process-data-loading
         # https://github.com/pytorch/pytorch/issues/13246#issuecomment-905703662
+        # Shuffling does not draw from the global random number generator, e.g. in a BatchPrefetcher thread.
         return torch.utils.data.DataLoader(dataset=dataset, batch_size=self.args.batch_size,
                                            shuffle=True, collate_fn=dataset.collate_fn,
-                                           num_workers=self.args.num_core, persistent_workers=False)
+                                           num_workers=self.args.num_core, persistent_workers=False,
+                                           generator=torch.Generator().manual_seed(self.args.random_seed))
 
     @timeit
     def initialize_dataset(self, dataset: KG, form_of_labelling) -> torch.utils.data.Dataset:
@@ -212,7 +240,9 @@ class DICE_Trainer:
                                           neg_ratio=self.args.neg_ratio,
                                           label_smoothing_rate=self.args.label_smoothing_rate,
                                           byte_pair_encoding=self.args.byte_pair_encoding,
-                                          block_size=self.args.block_size)
+                                          block_size=self.args.block_size,
+                                          negative_sampling=negative_sampling_args(self.args),
+                                          num_shared_negatives=self.args.num_shared_negatives)
         if self.args.eval_model is None:
             del dataset.train_set
             gc.collect()
@@ -224,15 +254,20 @@ class DICE_Trainer:
 
         if self.args.num_folds_for_cv == 0:
             # Initialize Trainer
-            self.trainer: Union[TorchTrainer, TorchDDPTrainer, pl.Trainer]
+            self.trainer: Union[TorchTrainer, TorchDDPTrainer, TorchCPUDDPTrainer, TorchPartitionedTrainer,
+                                pl.Trainer]
             self.trainer = self.initialize_trainer(callbacks=get_callbacks(self.args))
             # Initialize or load model
             model, form_of_labelling = self.initialize_or_load_model()
             self.trainer.evaluator = self.evaluator
             self.trainer.dataset = knowledge_graph
             self.trainer.form_of_labelling = form_of_labelling
-            self.trainer.fit(model, train_dataloaders=self.initialize_dataloader(
-                self.initialize_dataset(knowledge_graph, form_of_labelling)))
+            if isinstance(self.trainer, TorchPartitionedTrainer):
+                # Buckets of the training triples are constructed and streamed from disk by the trainer.
+                self.trainer.fit(model, train_set=knowledge_graph.train_set)
+            else:
+                self.trainer.fit(model, train_dataloaders=self.initialize_dataloader(
+                    self.initialize_dataset(knowledge_graph, form_of_labelling)))
             return model, form_of_labelling
         else:
             return self.k_fold_cross_validation(knowledge_graph)
@@ -277,7 +312,9 @@ class DICE_Trainer:
                                   form_of_labelling=form_of_labelling,
                                   scoring_technique=self.args.scoring_technique,
                                   neg_ratio=self.args.neg_ratio,
-                                  label_smoothing_rate=self.args.label_smoothing_rate)))
+                                  label_smoothing_rate=self.args.label_smoothing_rate,
+                                  negative_sampling=negative_sampling_args(self.args),
+                                  num_shared_negatives=self.args.num_shared_negatives)))
 
             res = self.evaluator.eval_with_data(dataset=dataset, trained_model=model, triple_idx=test_set_for_i_th_fold,
                                                 form_of_labelling=form_of_labelling)
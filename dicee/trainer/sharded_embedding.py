@@ -0,0 +1,100 @@
+from typing import List
+import torch
+import torch.distributed as dist
+
+from dicee.static_funcs_training import initialize_embedding_rows
+
+
+def all_to_all(tensor: torch.Tensor, input_split_sizes: List[int], output_split_sizes: List[int]) -> torch.Tensor:
+    """ Send input_split_sizes[i] rows of tensor to rank i and receive output_split_sizes[i] rows from rank i """
+    output = tensor.new_empty((sum(output_split_sizes),) + tuple(tensor.shape[1:]))
+    dist.all_to_all_single(output, tensor.contiguous(), output_split_sizes=output_split_sizes,
+                           input_split_sizes=input_split_sizes)
+    return output
+
+
+class ShardedLookup(torch.autograd.Function):
+    """
+    Lookup of rows of a table sharded across ranks, i.e., the i.th row is the (i // world_size).th row of the shard
+    of rank i % world_size
+
+    Forward: (1) Each rank sends the unique indices of its batch to their owners and (2) the owners reply with
+    the rows (two all-to-all exchanges).
+    Backward: Gradients of the requested rows are sent back to their owners (one all-to-all exchange), which obtain
+    a sparse gradient of their shard. As in DistributedDataParallel, gradients are averaged over ranks.
+    All ranks must call forward and backward equally often.
+    """
+
+    @staticmethod
+    def forward(ctx, idx: torch.LongTensor, shard: torch.Tensor, world_size: int) -> torch.Tensor:
+        # (1) Unique indices of the batch ordered by their owners.
+        unique, inverse = torch.unique(idx.flatten(), return_inverse=True)
+        owners = unique % world_size
+        order = torch.argsort(owners, stable=True)
+        send_counts = torch.bincount(owners, minlength=world_size)
+        # (2) Number of rows requested by each rank from this rank.
+        recv_counts = all_to_all(send_counts, [1] * world_size, [1] * world_size)
+        send_counts, recv_counts = send_counts.tolist(), recv_counts.tolist()
+        # (3) Send indices to their owners that reply with the rows of their shards.
+        rows = all_to_all(unique[order], send_counts, recv_counts) // world_size
+        received = all_to_all(shard[rows], recv_counts, send_counts)
+        # (4) Restore the order of the unique indices and of the batch.
+        unique_embeddings = torch.empty_like(received)
+        unique_embeddings[order] = received
+        ctx.save_for_backward(inverse, order, rows)
+        ctx.send_counts, ctx.recv_counts = send_counts, recv_counts
+        ctx.shard_shape, ctx.world_size = shard.shape, world_size
+        return unique_embeddings[inverse].view(*idx.shape, shard.shape[1])
+
+    @staticmethod
+    def backward(ctx, grad_output: torch.Tensor):
+        inverse, order, rows = ctx.saved_tensors
+        grad_output = grad_output.reshape(-1, ctx.shard_shape[1])
+        # (1) Sum gradients of duplicate indices.
+        grad_unique = grad_output.new_zeros(len(order), grad_output.shape[1]).index_add_(0, inverse, grad_output)
+        # (2) Send gradients to the owners of the rows.
+        grad_rows = all_to_all(grad_unique[order], ctx.send_counts, ctx.recv_counts)
+        # (3) Gradients of a row received from several ranks are summed by the optimizer (coalesce).
+        grad_shard = torch.sparse_coo_tensor(rows.unsqueeze(0), grad_rows / ctx.world_size, ctx.shard_shape)
+        return None, grad_shard, None
+
+
+class ShardedEmbedding(torch.nn.Module):
+    """
+    Embedding table partitioned row-wise across the ranks of the default process group (--sharded_embeddings)
+
+    A rank stores only the rows i with i % world_size == rank as well as their optimizer states, i.e., the i.th row
+    of the table is the (i // world_size).th row of the shard of rank i % world_size.
+    Lookups are routed to the owners of the rows via ShardedLookup and the shard obtains sparse gradients.
+    The table is never materialized. Hence, .weight is not available, e.g. in KvsAll training or evaluation.
+
+    Parameters
+    ----------
+    num_embeddings: number of rows of the full table
+    embedding_dim: number of columns
+    rank: rank owning the shard
+    world_size: number of shards
+    """
+
+    def __init__(self, num_embeddings: int, embedding_dim: int, rank: int, world_size: int):
+        super().__init__()
+        self.num_embeddings = num_embeddings
+        self.embedding_dim = embedding_dim
+        self.rank = rank
+        self.world_size = world_size
+        self.shard = torch.nn.Parameter(torch.empty(self.num_rows_of_rank(rank), embedding_dim))
+
+    def reset_parameters(self, param_init) -> None:
+        """ Initialize the shard as param_init of BaseKGE initializes the full table """
+        initialize_embedding_rows(self.shard.data, self.num_embeddings, param_init)
+
+    def num_rows_of_rank(self, rank: int) -> int:
+        return len(range(rank, self.num_embeddings, self.world_size))
+
+    def forward(self, idx: torch.LongTensor) -> torch.Tensor:
+        return ShardedLookup.apply(idx, self.shard, self.world_size)
+
+    @property
+    def weight(self):
+        raise NotImplementedError("The entity embeddings are sharded across ranks (--sharded_embeddings). "
+                                  "Scoring all entities is not available. Use --scoring_technique NegSample or KvsSample")
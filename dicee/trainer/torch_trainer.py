@@ -1,11 +1,116 @@
 import torch
-from typing import Tuple
+from typing import Callable, Iterator, Tuple
 from dicee.abstracts import AbstractTrainer
+import queue
+import threading
 import time
 import os
 import psutil
 
 
+def pin_memory(batch):
+    """ Page-locked copies of the tensors of a (nested) mini-batch """
+    if isinstance(batch, torch.Tensor):
+        return batch.pin_memory()
+    if isinstance(batch, (tuple, list)):
+        return type(batch)(pin_memory(i) for i in batch)
+    return batch
+
+
+def record_stream(batch, stream) -> None:
+    """ Mark the memory of the tensors of a (nested) mini-batch as used by stream, e.g. for sparse labels """
+    if isinstance(batch, torch.Tensor):
+        if batch.is_sparse:
+            record_stream(batch._indices(), stream)
+            record_stream(batch._values(), stream)
+        else:
+            batch.record_stream(stream)
+    elif isinstance(batch, (tuple, list)):
+        for i in batch:
+            record_stream(i, stream)
+
+
+class BatchPrefetcher:
+    """
+    Fetch the next num_batches mini-batches of a DataLoader in a background thread.
+
+    The thread constructs a mini-batch, pins its memory and moves it to the device with non-blocking copies
+    on a separate CUDA stream while the current mini-batch is processed. Iterating yields the outputs of
+    transfer(batch) and the seconds the consumer waited for them.
+    Runs are only reproducible if the DataLoader and the dataset do not draw from the global random number
+    generator, which the consumer uses concurrently, e.g. for dropout. Hence, they use their own generators
+    (see SamplingGenerator).
+    """
+
+    def __init__(self, dataloader, transfer: Callable, device, num_batches: int = 2):
+        assert num_batches > 0
+        self.dataloader = dataloader
+        self.transfer = transfer
+        self.device = torch.device(device)
+        self.queue = queue.Queue(maxsize=num_batches)
+        self.stop = threading.Event()
+        self.thread = None
+
+    def _fetch(self) -> None:
+        cuda = self.device.type == 'cuda'
+        stream = torch.cuda.Stream(device=self.device) if cuda else None
+        try:
+            for batch in self.dataloader:
+                if self.stop.is_set():
+                    return
+                event = None
+                if cuda:
+                    with torch.cuda.stream(stream):
+                        batch = self.transfer(pin_memory(batch))
+                        event = torch.cuda.Event()
+                        event.record(stream)
+                else:
+                    batch = self.transfer(batch)
+                self._put((batch, event))
+        except BaseException as e:
+            self._put(e)
+        else:
+            self._put(None)
+
+    def _put(self, item) -> None:
+        # Give up if the consumer stopped iterating, e.g. due to an exception.
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def __iter__(self) -> Iterator[Tuple[object, float]]:
+        self.stop.clear()
+        self.thread = threading.Thread(target=self._fetch, daemon=True)
+        self.thread.start()
+        try:
+            while True:
+                start_time = time.time()
+                item = self.queue.get()
+                waiting_time = time.time() - start_time
+                if item is None:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                batch, event = item
+                if event is not None:
+                    # Copies on the side stream must be completed before the batch is used.
+                    current_stream = torch.cuda.current_stream(self.device)
+                    current_stream.wait_event(event)
+                    # The memory allocated on the side stream must not be reused before the batch is processed.
+                    record_stream(batch, current_stream)
+                yield batch, waiting_time
+        finally:
+            self.stop.set()
+            self.thread.join()
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+
+    def __len__(self) -> int:
+        return len(self.dataloader)
+
+
 class TorchTrainer(AbstractTrainer):
     """
         TorchTrainer for using single GPU or multi CPUs on a single node
@@ -31,6 +136,15 @@ class TorchTrainer(AbstractTrainer):
             self.device = torch.device(f'cuda:{self.attributes.gpus}' if torch.cuda.is_available() else 'cpu')
         else:
             self.device = 'cpu'
+        # Mixed precision: forward passes run under autocast, parameters and the loss stay in float32.
+        self.precision = getattr(self.attributes, "precision", None)
+        if self.precision in [None, "32", "32-true"]:
+            self.autocast_dtype = None
+        elif self.precision == "bf16-mixed":
+            self.autocast_dtype = torch.bfloat16
+        else:
+            raise ValueError(f"TorchTrainer does not support precision={self.precision}. "
+                             f"Choices: None, '32' or 'bf16-mixed'")
         
         # https://psutil.readthedocs.io/en/latest/#psutil.Process
         self.process = psutil.Process(os.getpid())
@@ -58,6 +172,31 @@ class TorchTrainer(AbstractTrainer):
         # (3) Loss Forward and Backward w.r.t the batch.
         return self.forward_backward_update(x_batch, y_batch)
 
+    def _iter_batches(self) -> Iterator[Tuple[int, Tuple, float]]:
+        """
+            Mini-batches on the selected device
+
+            With num_prefetch_batches > 0, the next mini-batches are constructed and moved to the device
+            by a BatchPrefetcher while the current mini-batch is processed.
+
+           Returns
+           -------
+           index of a batch, (x_batch, y_batch) and the seconds spent waiting for it
+       """
+        num_prefetch_batches = getattr(self.attributes, "num_prefetch_batches", None)
+        if num_prefetch_batches:
+            batches = BatchPrefetcher(self.train_dataloaders, self.extract_input_outputs_set_device,
+                                      device=self.device, num_batches=num_prefetch_batches)
+            for i, (batch, waiting_time) in enumerate(batches):
+                yield i, batch, waiting_time
+        else:
+            construct_mini_batch_time = time.time()
+            for i, batch in enumerate(self.train_dataloaders):
+                # (1) Extract Input and Outputs and set them on the device
+                batch = self.extract_input_outputs_set_device(batch)
+                yield i, batch, time.time() - construct_mini_batch_time
+                construct_mini_batch_time = time.time()
+
     def _run_epoch(self, epoch: int) -> float:
         """
             Iterate over the training dataset
@@ -70,34 +209,29 @@ class TorchTrainer(AbstractTrainer):
        """
         epoch_loss = 0
         i = 0
-        construct_mini_batch_time = None
-        batch: list
-        for i, batch in enumerate(self.train_dataloaders):
-            # (1) Extract Input and Outputs and set them on the dice
-            x_batch, y_batch = self.extract_input_outputs_set_device(batch)
+        # Aggregated over the last log_every_n_batches mini-batches.
+        window_loss, window_compute_time, window_waiting_time, window_size = 0.0, 0.0, 0.0, 0
+        log_every_n_batches = getattr(self.attributes, "log_every_n_batches", None) or 1
+        num_batches = len(self.train_dataloaders)
+        for i, (x_batch, y_batch), waiting_time in self._iter_batches():
             start_time = time.time()
-            if construct_mini_batch_time:
-                construct_mini_batch_time = start_time - construct_mini_batch_time
             # (2) Forward-Backward-Update.
             batch_loss = self._run_batch(i, x_batch, y_batch)
             epoch_loss += batch_loss
-            if construct_mini_batch_time:
+            window_loss += batch_loss
+            window_compute_time += time.time() - start_time
+            window_waiting_time += waiting_time
+            window_size += 1
+            if (i + 1) % log_every_n_batches == 0 or i + 1 == num_batches:
                 print(
                     f"Epoch:{epoch + 1} "
-                    f"| Batch:{i + 1} "
-                    f"| Loss:{batch_loss:.10f} "
-                    f"| ForwardBackwardUpdate:{(time.time() - start_time):.2f}sec "
-                    f"| BatchConst.:{construct_mini_batch_time:.2f}sec "
+                    f"| Batch:{i + 1}/{num_batches} "
+                    f"| Loss:{window_loss / window_size:.10f} "
+                    f"| ForwardBackwardUpdate:{window_compute_time / window_size:.4f}sec "
+                    f"| BatchConst.:{window_waiting_time / window_size:.4f}sec "
                     f"| Mem. Usage {self.process.memory_info().rss / 1_000_000: .5}MB "
                     f" ({psutil.virtual_memory().percent} %)")
-            else:
-                print(
-                    f"Epoch:{epoch + 1} "
-                    f"| Batch:{i + 1} "
-                    f"| Loss:{batch_loss} "
-                    f"| ForwardBackwardUpdate:{(time.time() - start_time):.2f}secs "
-                    f"| Mem. Usage {self.process.memory_info().rss / 1_000_000: .5}MB ")
-            construct_mini_batch_time = time.time()
+                window_loss, window_compute_time, window_waiting_time, window_size = 0.0, 0.0, 0.0, 0
         return epoch_loss / (i + 1)
 
     def fit(self, *args, train_dataloaders, **kwargs) -> None:
@@ -171,7 +305,9 @@ class TorchTrainer(AbstractTrainer):
            -------
            batch loss (float)
        """
-        batch_loss = self.training_step(batch=(x_batch, y_batch))
+        with torch.autocast(device_type=torch.device(self.device).type, dtype=self.autocast_dtype,
+                            enabled=self.autocast_dtype is not None):
+            batch_loss = self.training_step(batch=(x_batch, y_batch))
         batch_loss.backward()
         self.optimizer.step()
         return batch_loss.item()
@@ -197,11 +333,12 @@ class TorchTrainer(AbstractTrainer):
             else:
                 # (1) NegSample: x is a triple, y is a float
                 x_batch, y_batch = batch
-                return x_batch.to(self.device), y_batch.to(self.device)
+                return x_batch.to(self.device, non_blocking=True), y_batch.to(self.device, non_blocking=True)
         elif len(batch) == 3:
             x_batch, y_idx_batch, y_batch, = batch
-            x_batch, y_idx_batch, y_batch = x_batch.to(self.device), y_idx_batch.to(self.device), y_batch.to(
-                self.device)
+            x_batch, y_idx_batch, y_batch = (x_batch.to(self.device, non_blocking=True),
+                                             y_idx_batch.to(self.device, non_blocking=True),
+                                             y_batch.to(self.device, non_blocking=True))
             return (x_batch, y_idx_batch), y_batch
         else:
             print(len(batch))
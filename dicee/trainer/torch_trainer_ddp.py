@@ -4,7 +4,7 @@ import time
 from torch.nn.parallel import DistributedDataParallel as DDP
 
 from dicee.abstracts import AbstractTrainer
-from dicee.static_funcs_training import efficient_zero_grad
+from dicee.static_funcs_training import efficient_zero_grad, multi_labels_to_dense
 from torch.utils.data import DataLoader
 
 
@@ -89,7 +89,7 @@ class NodeTrainer:
         # (3) Send model to local trainer.
         self.model = model.to(self.local_rank)
         self.train_dataset_loader = train_dataset_loader
-        self.loss_func = self.model.loss
+        self.loss_func = self.model.loss_function
         self.optimizer = optimizer
         self.callbacks = callbacks
         # (3) Wrap the model with DDP() along with GPU ID that model lives on.
@@ -129,6 +129,7 @@ class NodeTrainer:
 
         """
         self.optimizer.zero_grad()
+        targets = multi_labels_to_dense(targets, self.model.module.args.get("label_smoothing_rate", None))
         output = self.model(source)
         loss = self.loss_func(output, targets)
         batch_loss = loss.item()
@@ -226,7 +227,7 @@ class DDPTrainer:
         self.gpu_id = gpu_id
         self.model = model.to(gpu_id)
         self.train_dataset_loader = train_dataset_loader
-        self.loss_func = self.model.loss
+        self.loss_func = self.model.loss_function
         self.optimizer = optimizer
         self.callbacks = callbacks
         # (1) Wrap the model with DDP() along with GPU ID that model lives on.
@@ -0,0 +1,297 @@
+import datetime
+import glob
+import os
+import socket
+import time
+from typing import List
+import torch
+import torch.multiprocessing as mp
+from torch.utils.data import DataLoader
+
+from dicee.abstracts import AbstractTrainer
+from dicee.trainer.sharded_embedding import ShardedEmbedding
+from dicee.static_funcs_training import efficient_zero_grad, multi_labels_to_dense
+
+
+def numa_nodes() -> List[List[int]]:
+    """ CPUs of NUMA nodes (sockets) available to the process. A single node without NUMA information """
+    available = sorted(os.sched_getaffinity(0))
+    nodes = []
+    for path in sorted(glob.glob('/sys/devices/system/node/node[0-9]*/cpulist')):
+        with open(path) as f:
+            cpus = []
+            for interval in f.read().strip().split(','):
+                if interval:
+                    start, _, end = interval.partition('-')
+                    cpus.extend(range(int(start), int(end or start) + 1))
+        cpus = [i for i in cpus if i in available]
+        if cpus:
+            nodes.append(cpus)
+    return nodes if nodes else [available]
+
+
+def cpus_of_rank(local_rank: int, local_world_size: int) -> List[int]:
+    """
+    CPUs a rank is pinned to
+
+    Ranks are assigned to NUMA nodes in a round-robin fashion and the CPUs of a node are split among its ranks.
+    Hence, a rank does not migrate across sockets and ranks do not compete for the same cores.
+    """
+    nodes = numa_nodes()
+    cpus = nodes[local_rank % len(nodes)]
+    ranks_of_node = list(range(local_rank % len(nodes), local_world_size, len(nodes)))
+    chunk = cpus[ranks_of_node.index(local_rank)::len(ranks_of_node)]
+    # More ranks than CPUs: ranks share the CPUs of the node.
+    return sorted(chunk) if chunk else cpus
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def callbacks_of_args(args) -> dict:
+    """ Callbacks given via --callbacks, which are known to all ranks (callback instances exist only on rank 0) """
+    return args.callbacks if isinstance(getattr(args, "callbacks", None), dict) else dict()
+
+
+def run_rank(rank: int, world_size: int, init_method: str, args, model: torch.nn.Module,
+             dataset: torch.utils.data.Dataset) -> None:
+    """ Train model on a shard of dataset as a rank > 0 of a locally spawned TorchCPUDDPTrainer (executed in a child)
+    """
+    torch.manual_seed(args.random_seed + rank)
+    CPUNodeTrainer(args, model, dataset, rank=rank, local_rank=rank, world_size=world_size,
+                   local_world_size=world_size, init_method=init_method).train()
+
+
+class TorchCPUDDPTrainer(AbstractTrainer):
+    """
+        Data parallel training on CPUs via torch.nn.parallel.DistributedDataParallel with the gloo backend
+
+        (1) Launched via torchrun, RANK, LOCAL_RANK, WORLD_SIZE and LOCAL_WORLD_SIZE are read from the environment
+        and each process trains its shard.
+        (2) Otherwise, the current process becomes rank 0 and num_processes - 1 ranks are started via
+        torch.multiprocessing with the spawn start method.
+
+        Each rank iterates over its shard of the training data (DistributedSampler) and is pinned to the CPUs of
+        a NUMA node (socket), see cpus_of_rank(). Callbacks are only called on rank 0, i.e., only rank 0 writes
+        checkpoints. Parameters modified by callbacks are broadcast to all ranks after each epoch.
+
+        With --sharded_embeddings, entity embeddings are partitioned across ranks (ShardedEmbedding) instead of being
+        replicated and only the gradients of the remaining parameters are all-reduced. The model is built without
+        entity embeddings and each rank creates only its shard, i.e., the full table is never allocated.
+        After training, each rank writes its parameters into full_storage_path/checkpoint_rank_{rank}.pt.
+        Scoring all entities requires the full table. Hence, evaluation, the Eval, Perturb and KronE callbacks
+        as well as --save_embeddings_as_csv are not supported.
+
+        Arguments
+       ----------
+       args: Namespace with num_processes, batch_size, num_core, num_epochs and random_seed
+
+       callbacks: list of Abstract callback instances
+   """
+
+    def __init__(self, args, callbacks):
+        super().__init__(args, callbacks)
+        if getattr(args, "sharded_embeddings", False):
+            if args.scoring_technique not in ["NegSample", "KvsSample"]:
+                raise ValueError(f"--sharded_embeddings requires --scoring_technique NegSample or KvsSample. "
+                                 f"Currently:{args.scoring_technique}")
+            if args.swa or args.adaptive_swa:
+                raise ValueError("--sharded_embeddings does not support --swa and --adaptive_swa")
+            unsupported = [k for k in ["Eval", "Perturb", "KronE"] if k in callbacks_of_args(args)]
+            if unsupported:
+                raise ValueError(f"--sharded_embeddings does not support the callbacks {unsupported}")
+            if args.eval_model is not None:
+                raise ValueError(f"--sharded_embeddings does not support the evaluation of the model. "
+                                 f"Use --eval_model None. Currently:{args.eval_model}")
+            if args.save_embeddings_as_csv:
+                raise ValueError("--sharded_embeddings does not support --save_embeddings_as_csv")
+            if getattr(args, "num_folds_for_cv", 0):
+                raise NotImplementedError("--sharded_embeddings does not support --num_folds_for_cv")
+        if "RANK" in os.environ:
+            self.global_rank = int(os.environ["RANK"])
+            self.local_rank = int(os.environ.get("LOCAL_RANK", self.global_rank))
+            self.world_size = int(os.environ["WORLD_SIZE"])
+            self.local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", self.world_size))
+            self.spawn = False
+        else:
+            self.global_rank, self.local_rank = 0, 0
+            self.world_size = getattr(self.attributes, "num_processes", None) or max(len(numa_nodes()), 2)
+            self.local_world_size = self.world_size
+            self.spawn = True
+        self.is_global_zero = self.global_rank == 0
+
+    def fit(self, *args, train_dataloaders, **kwargs) -> None:
+        """ Train model        """
+        assert len(args) == 1
+        model, = args
+        dataset = train_dataloaders.dataset
+        entity_embeddings = getattr(model, "entity_embeddings", None)
+        if getattr(self.attributes, "sharded_embeddings", False) and not isinstance(entity_embeddings,
+                                                                                    torch.nn.Embedding):
+            raise NotImplementedError(f"{model.name} does not have an entity embedding table to be sharded")
+        # Only rank 0 calls callbacks, e.g., writes checkpoints and epoch losses.
+        if self.is_global_zero:
+            self.on_fit_start(self, model)
+        processes = []
+        init_method = "env://"
+        if self.spawn:
+            init_method = f"tcp://127.0.0.1:{free_port()}"
+            print(f"Spawning {self.world_size - 1} processes for torchCPUDDP....")
+            context = mp.get_context("spawn")
+            # With --sharded_embeddings, the model holds no entity embeddings, i.e., the table is not pickled.
+            for rank in range(1, self.world_size):
+                process = context.Process(target=run_rank,
+                                          args=(rank, self.world_size, init_method, self.attributes, model, dataset))
+                process.start()
+                processes.append(process)
+        # Pinning is reverted after the training, e.g., the evaluation uses all CPUs.
+        affinity, num_threads = os.sched_getaffinity(0), torch.get_num_threads()
+        try:
+            CPUNodeTrainer(self.attributes, model, dataset, rank=self.global_rank, local_rank=self.local_rank,
+                           world_size=self.world_size, local_world_size=self.local_world_size,
+                           init_method=init_method, trainer=self,
+                           callbacks=self.callbacks if self.is_global_zero else None).train()
+        finally:
+            os.sched_setaffinity(0, affinity)
+            torch.set_num_threads(num_threads)
+            for process in processes:
+                process.join()
+        failed = [process.exitcode for process in processes if process.exitcode != 0]
+        if failed:
+            raise RuntimeError(f"{len(failed)} torchCPUDDP processes failed with exit codes {failed}")
+        if self.is_global_zero:
+            self.on_fit_end(self, model)
+
+
+class CPUNodeTrainer:
+    """ Training loop of a single rank of TorchCPUDDPTrainer """
+
+    def __init__(self, args, model: torch.nn.Module, dataset: torch.utils.data.Dataset, rank: int, local_rank: int,
+                 world_size: int, local_world_size: int, init_method: str, trainer=None, callbacks=None) -> None:
+        self.args = args
+        self.rank = rank
+        self.world_size = world_size
+        self.trainer = trainer
+        self.callbacks = callbacks or []
+        self.num_epochs = args.num_epochs
+        self.sharded_embeddings = getattr(args, "sharded_embeddings", False)
+        # (1) Pin the rank to the CPUs of a NUMA node.
+        cpus = cpus_of_rank(local_rank, local_world_size)
+        os.sched_setaffinity(0, cpus)
+        torch.set_num_threads(len(cpus))
+        # (2) Join the process group.
+        torch.distributed.init_process_group(backend="gloo", init_method=init_method, rank=rank,
+                                             world_size=world_size, timeout=datetime.timedelta(minutes=30))
+        # (3) Shard the training data.
+        self.sampler = torch.utils.data.distributed.DistributedSampler(dataset, num_replicas=world_size, rank=rank,
+                                                                       shuffle=True, seed=args.random_seed)
+        self.train_dataset_loader = DataLoader(dataset, batch_size=args.batch_size, sampler=self.sampler,
+                                               num_workers=args.num_core, collate_fn=dataset.collate_fn,
+                                               persistent_workers=False)
+        # (4) Parameters of rank 0 are broadcast to all ranks.
+        self.module = model
+        if self.sharded_embeddings:
+            self.shard_entity_embeddings()
+            self.model = model
+            self._broadcast_parameters()
+            # Shards obtain sparse gradients.
+            self.optimizer = model.configure_sparse_optimizers(model.parameters())
+        else:
+            self.model = torch.nn.parallel.DistributedDataParallel(model)
+            self.optimizer = model.configure_optimizers()
+        print(f'Global Rank:{self.rank}/{self.world_size}'
+              f' | CPUs:{cpus}'
+              f' | NumOfDataPoints:{len(self.sampler)}'
+              f' | NumOfEpochs:{self.num_epochs}'
+              f' | BatchSize:{self.train_dataset_loader.batch_size}'
+              f' | EpochBatchsize:{len(self.train_dataset_loader)}')
+
+    def shard_entity_embeddings(self) -> None:
+        """ Create and initialize the shard of the rank as the entity embeddings of the model """
+        self.module.entity_embeddings = ShardedEmbedding(self.module.num_entities, self.module.embedding_dim,
+                                                         rank=self.rank, world_size=self.world_size)
+        self.module.entity_embeddings.reset_parameters(self.module.param_init)
+
+    def replicated_parameters(self) -> List[torch.nn.Parameter]:
+        """ Parameters held by every rank, i.e., all parameters except the shard of entity embeddings """
+        if self.sharded_embeddings:
+            return [p for p in self.module.parameters() if p is not self.module.entity_embeddings.shard]
+        return list(self.module.parameters())
+
+    def _all_reduce_gradients(self) -> None:
+        """ Average gradients of replicated parameters over ranks in a single all-reduce (as DDP) """
+        parameters = self.replicated_parameters()
+        if len(parameters) == 0:
+            return
+        grads = [torch.zeros_like(p) if p.grad is None else p.grad.to_dense() for p in parameters]
+        flat = torch.cat([g.flatten() for g in grads])
+        torch.distributed.all_reduce(flat)
+        flat /= self.world_size
+        for p, g in zip(parameters, torch.split(flat, [g.numel() for g in grads])):
+            p.grad = g.view_as(p)
+
+    def _run_batch(self, source, targets) -> float:
+        efficient_zero_grad(self.model)
+        targets = multi_labels_to_dense(targets, self.module.args.get("label_smoothing_rate", None))
+        output = self.model(source)
+        loss = self.module.loss_function(output, targets)
+        batch_loss = loss.item()
+        loss.backward()
+        if self.sharded_embeddings:
+            self._all_reduce_gradients()
+        self.optimizer.step()
+        return batch_loss
+
+    @staticmethod
+    def extract_input_outputs(z: list):
+        if len(z) == 2:
+            return z
+        elif len(z) == 3:
+            x_batch, y_idx_batch, y_batch, = z
+            return (x_batch, y_idx_batch), y_batch
+        else:
+            raise ValueError('Unexpected batch shape..')
+
+    def _run_epoch(self, epoch: int) -> float:
+        """ Average mini-batch loss of all ranks """
+        self.sampler.set_epoch(epoch)
+        epoch_loss = 0
+        i = 0
+        for i, z in enumerate(self.train_dataset_loader):
+            source, targets = self.extract_input_outputs(z)
+            epoch_loss += self._run_batch(source, targets)
+        epoch_loss = torch.tensor([epoch_loss / (i + 1)], dtype=torch.float64)
+        torch.distributed.all_reduce(epoch_loss)
+        return epoch_loss.item() / self.world_size
+
+    def _broadcast_parameters(self) -> None:
+        """ Synchronize parameters modified by callbacks on rank 0 """
+        for parameter in self.replicated_parameters():
+            torch.distributed.broadcast(parameter.data, src=0)
+
+    def train(self) -> None:
+        try:
+            for epoch in range(self.num_epochs):
+                start_time = time.time()
+                epoch_loss = self._run_epoch(epoch)
+                if self.rank == 0:
+                    print(f"Epoch:{epoch + 1}"
+                          f" | Loss:{epoch_loss:.8f}"
+                          f" | Runtime:{(time.time() - start_time) / 60:.3f}mins")
+                    self.module.loss_history.append(epoch_loss)
+                    for c in self.callbacks:
+                        c.on_train_epoch_end(self.trainer, self.module)
+                self._broadcast_parameters()
+            if self.sharded_embeddings:
+                # The table is not gathered, i.e., each rank stores its shard and the replicated parameters.
+                torch.save(self.module.state_dict(),
+                           os.path.join(self.args.full_storage_path, f'checkpoint_rank_{self.rank}.pt'))
+            # Ranks leave the process group together.
+            torch.distributed.barrier()
+        finally:
+            # The DDP wrapper must be released before its process group.
+            self.model = self.module
+            torch.distributed.destroy_process_group()
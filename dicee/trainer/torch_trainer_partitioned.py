@@ -0,0 +1,198 @@
+import os
+import time
+from typing import List, Tuple
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from dicee.callbacks import Eval
+from dicee.dataset_classes import construct_dataset
+from dicee.partitioning import PartitionedEmbeddingStore, bucket_triples, load_bucket, remove_buckets
+from .torch_trainer import TorchTrainer
+
+
+class TorchPartitionedTrainer(TorchTrainer):
+    """
+        Training on partitioned entity embeddings as in PyTorch-BigGraph (--num_partitions)
+
+        (1) Entities are split into num_partitions partitions and the training triples into buckets (i, j) of
+        triples with heads of the partition i and tails of the partition j, see bucket_triples().
+        Buckets, entity embeddings and their optimizer states are stored in full_storage_path/partitions.
+        (2) In an epoch, buckets are visited in a random order grouped by their head partitions. Only the (at most two)
+        partitions of the current bucket are kept in memory. Partitions not needed by the next bucket are written back.
+        (3) A bucket is trained as a NegSample or KvsSample dataset of dataset_classes over the entities of its
+        partitions, i.e., negatives are sampled from the loaded partitions.
+        (4) The model is built without entity embeddings and the partitions are initialized in the store, i.e.,
+        the full table is never allocated. After training, the partitions remain in
+        full_storage_path/partitions/entity_embeddings_{p}.npy as the entity embeddings of the model, while buckets
+        and optimizer states are deleted. Scoring all entities requires the full table. Hence, evaluation,
+        the Eval callback and --save_embeddings_as_csv are not supported.
+
+        Arguments
+       ----------
+       args: Namespace with num_partitions, full_storage_path, scoring_technique and the arguments of TorchTrainer
+
+       callbacks: list of Abstract callback instances
+   """
+
+    def __init__(self, args, callbacks):
+        super().__init__(args, callbacks)
+        if args.scoring_technique not in ["NegSample", "KvsSample"]:
+            raise ValueError(f"--num_partitions requires --scoring_technique NegSample or KvsSample. "
+                             f"Currently:{args.scoring_technique}")
+        if args.swa or args.adaptive_swa:
+            raise ValueError("--num_partitions does not support --swa and --adaptive_swa")
+        if getattr(args, "num_folds_for_cv", 0):
+            raise NotImplementedError("--num_partitions does not support --num_folds_for_cv")
+        if any(isinstance(c, Eval) for c in self.callbacks):
+            raise ValueError("--num_partitions does not support the Eval callback")
+        if args.eval_model is not None:
+            raise ValueError(f"--num_partitions does not support the evaluation of the model. "
+                             f"Use --eval_model None. Currently:{args.eval_model}")
+        if args.save_embeddings_as_csv:
+            raise ValueError("--num_partitions does not support --save_embeddings_as_csv")
+        self.num_partitions = args.num_partitions
+        self.path = os.path.join(args.full_storage_path, 'partitions')
+        self.store = None
+        # Number of triples per non-empty bucket.
+        self.buckets = None
+        # Partition -> (embeddings, row-wise optimizer states, scalar optimizer states) of loaded partitions.
+        self.loaded = dict()
+        # Optimizer states of the parameters except the entity embeddings.
+        self.states = dict()
+        # Shuffling of buckets does not draw from the global random number generator, see BatchPrefetcher.
+        self.generator = torch.Generator().manual_seed(args.random_seed)
+
+    def bucket_order(self) -> List[Tuple[int, int]]:
+        """ Non-empty buckets in a random order. Consecutive buckets share their head partitions """
+        order = []
+        for i in torch.randperm(self.num_partitions, generator=self.generator).tolist():
+            order.extend((i, j) for j in torch.randperm(self.num_partitions, generator=self.generator).tolist()
+                         if (i, j) in self.buckets)
+        return order
+
+    def bucket_dataset(self, i: int, j: int) -> torch.utils.data.Dataset:
+        """ Dataset of the triples of the bucket (i, j). Tails of the partition j follow the entities of i """
+        # Lazy import to avoid a circular import.
+        from dicee.trainer.dice_trainer import negative_sampling_args
+        triples = np.array(load_bucket(self.path, i, j))
+        num_entities = self.store.sizes[i]
+        if i != j:
+            triples[:, 2] += self.store.sizes[i]
+            num_entities += self.store.sizes[j]
+        return construct_dataset(train_set=triples,
+                                 entity_to_idx=range(num_entities),
+                                 relation_to_idx=range(self.model.num_relations),
+                                 form_of_labelling=self.form_of_labelling,
+                                 scoring_technique=self.attributes.scoring_technique,
+                                 neg_ratio=self.attributes.neg_ratio,
+                                 label_smoothing_rate=self.attributes.label_smoothing_rate,
+                                 negative_sampling=negative_sampling_args(self.attributes),
+                                 num_shared_negatives=self.attributes.num_shared_negatives)
+
+    def swap_in(self, i: int, j: int) -> None:
+        """ Load the partitions of the bucket (i, j) into the entity embeddings of the model and the optimizer """
+        # (1) Write back partitions that are not needed and load missing ones.
+        for p in [p for p in self.loaded if p not in (i, j)]:
+            self.store.save(p, *self.loaded.pop(p))
+        for p in {i, j}:
+            if p not in self.loaded:
+                self.loaded[p] = self.store.load(p)
+        # (2) Rows of the partition i followed by the rows of the partition j.
+        partitions = [i] if i == j else [i, j]
+        weight = torch.cat([self.loaded[p][0] for p in partitions]).to(self.device)
+        self.model.entity_embeddings = torch.nn.Embedding.from_pretrained(weight, freeze=False, sparse=True)
+        # (3) The optimizer continues with the states of the partitions and of the remaining parameters.
+        self.optimizer = self.model.configure_sparse_optimizers(self.model.parameters())
+        # Rows of a partition without optimizer states, e.g. before its first bucket, obtain zeros.
+        names = set().union(*[self.loaded[p][1] for p in partitions])
+        state = {name: torch.cat([self.loaded[p][1].get(name, torch.zeros_like(self.loaded[p][0]))
+                                  for p in partitions]).to(self.device) for name in names}
+        for p in partitions:
+            for name, value in self.loaded[p][2].items():
+                state[name] = max(state.get(name, value), value)
+        if state:
+            self.optimizer.state[self.model.entity_embeddings.weight] = state
+        for parameter, parameter_state in self.states.items():
+            self.optimizer.state[parameter] = parameter_state
+
+    def swap_out(self, i: int, j: int) -> None:
+        """ Split the entity embeddings of the model and their optimizer states into the partitions i and j """
+        weight = self.model.entity_embeddings.weight
+        partitions = [i] if i == j else [i, j]
+        sizes = [self.store.sizes[p] for p in partitions]
+        state = self.optimizer.state.get(weight, dict())
+        row_states = {name: value.detach().cpu().split(sizes) for name, value in state.items()
+                      if torch.is_tensor(value) and value.shape == weight.shape}
+        scalar_states = {name: value for name, value in state.items() if name not in row_states}
+        for k, (p, rows) in enumerate(zip(partitions, weight.detach().cpu().split(sizes))):
+            self.loaded[p] = (rows, {name: value[k] for name, value in row_states.items()}, scalar_states)
+        self.states = {parameter: self.optimizer.state[parameter] for parameter in self.model.parameters()
+                       if parameter is not weight and parameter in self.optimizer.state}
+        self.model.entity_embeddings = None
+
+    def _run_epoch(self, epoch: int) -> float:
+        """ Average loss over the buckets weighted by their number of triples """
+        epoch_loss = 0.0
+        for i, j in self.bucket_order():
+            start_time = time.time()
+            self.swap_in(i, j)
+            dataset = self.bucket_dataset(i, j)
+            self.train_dataloaders = DataLoader(dataset=dataset, batch_size=self.attributes.batch_size,
+                                                shuffle=True, collate_fn=dataset.collate_fn,
+                                                num_workers=self.attributes.num_core, persistent_workers=False,
+                                                generator=self.generator)
+            bucket_loss = super()._run_epoch(epoch)
+            self.swap_out(i, j)
+            print(f"Epoch:{epoch + 1} "
+                  f"| Bucket:({i}, {j}) "
+                  f"| NumOfTriples:{self.buckets[(i, j)]} "
+                  f"| Loss:{bucket_loss:.8f} "
+                  f"| Runtime:{time.time() - start_time:.3f} secs")
+            epoch_loss += bucket_loss * self.buckets[(i, j)]
+        return epoch_loss / sum(self.buckets.values())
+
+    def fit(self, *args, train_set: np.ndarray, **kwargs) -> None:
+        """
+            Training starts
+
+            Arguments
+           ----------
+           args:tuple
+           (BASEKGE,)
+           train_set: n x 3 integer indexed (possibly memory-mapped) training triples
+       """
+        assert len(args) == 1
+        model, = args
+        self.model = model
+        self.model.to(self.device)
+        self.loss_function = model.loss_function
+        self.training_step = self.model.training_step
+        self.on_fit_start(self, self.model)
+        # (1) Bucket the triples and partition the entity embeddings.
+        self.buckets = bucket_triples(train_set, self.num_partitions, self.path)
+        self.store = PartitionedEmbeddingStore(self.path, num_entities=model.num_entities,
+                                               embedding_dim=model.embedding_dim, num_partitions=self.num_partitions)
+        self.store.initialize(self.model.param_init)
+        self.model.entity_embeddings = None
+        print(f'NumOfDataPoints:{sum(self.buckets.values())} '
+              f'| NumOfPartitions:{self.num_partitions} '
+              f'| NumOfBuckets:{len(self.buckets)} '
+              f'| NumOfEpochs:{self.attributes.max_epochs} '
+              f'| LearningRate:{self.model.learning_rate} '
+              f'| BatchSize:{self.attributes.batch_size}')
+        # (2) Train on buckets.
+        for epoch in range(self.attributes.max_epochs):
+            start_time = time.time()
+            avg_epoch_loss = self._run_epoch(epoch)
+            print(f"Epoch:{epoch + 1} "
+                  f"| Loss:{avg_epoch_loss:.8f} "
+                  f"| Runtime:{(time.time() - start_time) / 60:.3f} mins")
+            self.model.loss_history.append(avg_epoch_loss)
+            self.on_train_epoch_end(self, self.model)
+        # (3) The partitions are the entity embeddings of the model.
+        for p in list(self.loaded):
+            self.store.save(p, *self.loaded.pop(p))
+        self.store.remove_optimizer_states()
+        remove_buckets(self.path)
+        self.on_fit_end(self, self.model)
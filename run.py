@@ -2,6 +2,10 @@ import json
 from dicee.executer import Execute, ContinuousExecute
 import argparse
 
+def str_or_none(value: str):
+    """ Map the command line value "None" to None """
+    return None if value == "None" else value
+
 def get_default_arguments(description=None):
     """ Extends pytorch_lightning Trainer's arguments with ours """
     # From "pytorch-lightning==1.6.4" to "lightning>=2.1.3",  'Trainer' has no attribute 'add_argparse_args'
@@ -25,13 +29,19 @@ def get_default_arguments(description=None):
     parser.add_argument("--save_embeddings_as_csv", action="store_true",
                         help="A flag for saving embeddings in csv file.")
     parser.add_argument("--backend", type=str, default="pandas",
-                        choices=["pandas", "polars", "rdflib"],
-                        help='Backend for loading, preprocessing, indexing input knowledge graph.')
+                        choices=["pandas", "polars", "rdflib", "streaming"],
+                        help='Backend for loading, preprocessing, indexing input knowledge graph. '
+                             'streaming reads and indexes chunks into memory-mapped arrays')
+    parser.add_argument("--read_chunk_size", type=int, default=1_000_000,
+                        help='Number of triples read at once with --backend streaming')
+    parser.add_argument("--num_preprocess_workers", type=int, default=None,
+                        help='Number of processes to create er/re/ee vocabs. With --backend streaming, '
+                             'input files are sharded across processes to be parsed and indexed in parallel')
     # Model related arguments
     parser.add_argument("--model", type=str,
                         default="Keci",
                         choices=["ComplEx", "ConvQ", "AConvQ", "ConvO", "AConvO", "QMult",
-                                 "OMult", "DistMult", "TransE", "LFMult", "FMult", "PolyMult", "LFMult1"
+                                 "OMult", "DistMult", "TransE", "LFMult", "FMult", "GFMult", "FMult2", "PolyMult", "LFMult1",
                                  "Pykeen_MuRE", "Pykeen_QuatE", "Pykeen_DistMult", "Pykeen_BoxE", "Pykeen_CP",
                                  "Pykeen_HolE", "Pykeen_ProjE", "Pykeen_RotatE",
                                  "Pykeen_TransE", "Pykeen_TransF", "Pykeen_TransH",
@@ -54,13 +64,46 @@ def get_default_arguments(description=None):
                              '"Perturb": {"level": "out", "ratio": 0.2, "method": "RN", "scaler": 0.3}')
     parser.add_argument("--trainer", type=str, default='PL',
                         choices=['torchCPUTrainer', 'PL', 'torchDDP'],
-                        help='PL (pytorch lightning trainer), torchDDP (custom ddp), torchCPUTrainer (custom cpu only)')
+                        help='PL (pytorch lightning trainer), torchDDP (custom ddp, gloo on CPUs without GPUs), '
+                             'torchCPUTrainer (custom cpu only)')
+    parser.add_argument("--num_processes", type=int, default=None,
+                        help='Number of processes of torchDDP on CPUs if not launched via torchrun. '
+                             'None implies the number of NUMA nodes (at least 2)')
     parser.add_argument('--scoring_technique', default="NegSample",
                         help="Training technique for knowledge graph embedding model",
                         choices=["AllvsAll", "KvsAll", "1vsAll", "NegSample", "KvsSample"])
     parser.add_argument('--neg_ratio', type=int, default=50,
                         help='The number of negative triples generated per positive triple.')
+    parser.add_argument('--corruption_ratios', type=float, nargs=3, default=None,
+                        help='Probabilities of corrupting heads, tails and relations with NegSample, '
+                             'e.g. 0.45 0.45 0.1. Default: 0.5 0.5 0.0')
+    parser.add_argument('--filtered_negatives', action='store_true',
+                        help='Reject negative triples that are training triples and resample them with NegSample.')
+    parser.add_argument('--num_shared_negatives', type=int, default=None,
+                        help='Size of a pool of negative tail entities shared by all triples of a mini-batch with '
+                             'NegSample. Triples are scored via forward_k_vs_sample.')
+    parser.add_argument('--entity_sampling', type=str, default="uniform", choices=["uniform", "unigram"],
+                        help='Distribution of corrupted entities with NegSample. unigram: degree^unigram_alpha')
+    parser.add_argument('--unigram_alpha', type=float, default=0.75,
+                        help='Exponent of entity degrees with --entity_sampling unigram.')
+    parser.add_argument('--bernoulli_corruption', action='store_true',
+                        help='Corrupt heads or tails per relation according to tph/hpt statistics with NegSample.')
+    parser.add_argument('--adversarial_temperature', type=float, default=None,
+                        help='Self-adversarial weighting of negatives with NegSample, e.g. 1.0. Default: None')
     parser.add_argument('--weight_decay', type=float, default=0.0, help='L2 penalty e.g.(0.00001)')
+    parser.add_argument('--sparse_embeddings', action='store_true',
+                        help='Sparse gradients of entity and relation embeddings. '
+                             'Only rows occurring in a mini-batch are updated with --optim Adam, AdamW, SGD or Adagrad.')
+    parser.add_argument('--num_partitions', type=int, default=None,
+                        help='Train on buckets of triples given by num_partitions entity partitions '
+                             'that are swapped in and out of memory-mapped files (--trainer torchCPUTrainer). '
+                             'Requires --scoring_technique NegSample or KvsSample, --optim Adam, AdamW, SGD or Adagrad '
+                             'and --eval_model None. Entity embeddings are stored in partitions/entity_embeddings_{p}.npy.')
+    parser.add_argument('--sharded_embeddings', action='store_true',
+                        help='Partition entity embeddings across the ranks of --trainer torchDDP on CPUs. '
+                             'Requires --scoring_technique NegSample or KvsSample and --optim Adam, AdamW, SGD or Adagrad. '
+                             'A rank creates only its shard and stores it into checkpoint_rank_{rank}.pt. '
+                             'Requires --eval_model None.')
     parser.add_argument('--input_dropout_rate', type=float, default=0.0)
     parser.add_argument('--hidden_dropout_rate', type=float, default=0.0)
     parser.add_argument("--feature_map_dropout_rate", type=float, default=0.0)
@@ -79,6 +122,11 @@ def get_default_arguments(description=None):
                         help="# of output channels in convolution")
     parser.add_argument("--num_core", type=int, default=0,
                         help='Number of cores to be used. 0 implies using single CPU')
+    parser.add_argument("--num_prefetch_batches", type=int, default=2,
+                        help='Number of mini-batches prefetched by a background thread in TorchTrainer. '
+                             '0 implies constructing mini-batches synchronously')
+    parser.add_argument("--log_every_n_batches", type=int, default=100,
+                        help='TorchTrainer prints the loss and runtimes aggregated over n mini-batches')
     parser.add_argument("--random_seed", type=int, default=0,
                         help='Seed for all, see pl seed_everything().')
     parser.add_argument('--p', type=int, default=0,
@@ -122,6 +170,30 @@ def get_default_arguments(description=None):
                         help="Stochastic weight averaging")
     parser.add_argument('--degree', type=int, default=0,
                         help='degree for polynomial embeddings')
+    parser.add_argument('--score_func', type=str, default=None, choices=["tri", "comp", "vtp"],
+                        help='Scoring function of polynomial embeddings. None uses the default of the model')
+    parser.add_argument('--weight_bias', type=str, default=None, choices=["same", "diff"],
+                        help='LFMult: same or different weights and bias at every layer')
+    parser.add_argument("--closed_form_scoring",
+                        action="store_true",
+                        help="Compute integrals of polynomial embeddings (PolyMult, LFMult) in closed form. "
+                             "LFMult: exact integrals instead of quadrature. PolyMult: required by --score_func comp "
+                             "and vtp (exact integrals). PolyMult tri: exact integrals instead of its terms "
+                             "1/(1+(i+j+k)%%degree)")
+    parser.add_argument('--inference_cache', type=str_or_none, default="float32", choices=["float32", "float16", None],
+                        help='Dtype of cached entity function evaluations of FMult and GFMult at inference. None disables it')
+    parser.add_argument('--quadrature', type=str_or_none, default=None,
+                        choices=["gauss_legendre", "clenshaw_curtis", "trapezoid", None],
+                        help='Quadrature of function-space models. None uses the default of the model')
+    parser.add_argument('--num_quadrature_points', type=int, default=None,
+                        help='Number of quadrature points of function-space models. None uses the default of the model')
+    parser.add_argument('--trig_scoring', type=str, default="fft", choices=["fft", "direct"],
+                        help='LFMult1: compute trigonometric scores with FFTs or exactly by direct convolution')
+    parser.add_argument('--low_rank', type=int, default=None,
+                        help='FMult and GFMult: rank r of U V^T factorised layers of width embedding_dim // (4r). '
+                             'None uses dense layers of width sqrt(embedding_dim / 2)')
+    parser.add_argument('--precision', type=str_or_none, default=None, choices=[None, "32", "bf16-mixed"],
+                        help='None or 32 for float32 training, bf16-mixed for bfloat16 autocast (e.g. on CPUs)')
 
     if description is None:
         return parser.parse_args()